@@ -0,0 +1,178 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""Benchmark of the parallel reading of p-stats2data.py and p-psql2tsv.py
+
+Generates a sweep of FILES result files, i.e., TSV files with LINES results of
+four algorithms in three runs each for p-stats2data.py, or EXPLAIN ANALYZE
+outputs with LINES query plans of one of four algorithms for p-psql2tsv.py,
+and measures the script over the whole sweep for each number of --jobs and
+each --pool (best of --repeat runs). With --baseline REV, the script of the
+git revision REV is measured as well, e.g., the sequential first version
+e9b6c22, and all outputs must be the same.
+
+Files on network storage take longer to open and read. With --latency MS,
+each file is read MS milliseconds later, and the reading of all files with
+mapFiles is measured instead of the script, since the latency cannot be added
+to local files.
+
+Examples:
+    benchmarks/bench_aggregators.py --files 5000 --jobs 1,4,16 --baseline e9b6c22
+    benchmarks/bench_aggregators.py --script p-psql2tsv.py --latency 5 --pool thread
+"""
+
+import argparse
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import benchutil
+
+SCRIPTS = ['p-stats2data.py', 'p-psql2tsv.py']
+
+ALGORITHMS = ['algA', 'algB', 'algC', 'algD']
+
+# Reading of each file of --latency, i.e., the function and the latency in
+# seconds, which worker processes inherit
+READER = {}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        '--script', choices=SCRIPTS, default=SCRIPTS[0],
+        help='aggregator (default: %(default)s)')
+    parser.add_argument(
+        '--files', type=int, default=5000,
+        help='number of result files (default: %(default)s)')
+    parser.add_argument(
+        '--lines', type=int, default=100,
+        help='results or query plans per file (default: %(default)s)')
+    parser.add_argument(
+        '--jobs', default='1,4,16',
+        help='comma-separated numbers of jobs (default: %(default)s)')
+    parser.add_argument(
+        '--pool', default='thread,process',
+        help='comma-separated pools (default: %(default)s)')
+    parser.add_argument(
+        '--latency', type=float, metavar='MS',
+        help='read each file MS milliseconds later, and measure mapFiles only')
+    parser.add_argument(
+        '--repeat', type=int, default=3,
+        help='runs of each measurement, the best one is shown (default: %(default)s)')
+    parser.add_argument(
+        '--baseline', metavar='REV',
+        help='git revision of the script to compare with')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='pwbench-') as tmp:
+        if args.script == 'p-stats2data.py':
+            prefix, files = writeStatsSweep(tmp, args.files, args.lines)
+        else:
+            prefix, files = writePlanSweep(tmp, args.files, args.lines)
+
+        benchutil.print_row('version', 'jobs', 'pool', 's')
+        configurations = [(jobs, pool) for jobs in map(int, args.jobs.split(','))
+                          for pool in args.pool.split(',')]
+        if args.latency is not None:
+            benchmarkLatency(args.script, files, configurations, args.latency / 1000, args.repeat)
+            return
+
+        outputs = []
+        if args.baseline is not None:
+            script = benchutil.script_path(args.script, args.baseline)
+            duration, output = benchutil.best_of(args.repeat, runScript, script, [prefix] + files)
+            benchutil.print_row(args.baseline, 1, '-', '%.2f' % duration)
+            outputs.append(output)
+        script = benchutil.script_path(args.script)
+        for jobs, pool in configurations:
+            duration, output = benchutil.best_of(
+                args.repeat, runScript, script,
+                ['--jobs', str(jobs), '--pool', pool, prefix] + files)
+            benchutil.print_row('current', jobs, pool, '%.2f' % duration)
+            outputs.append(output)
+        for output in outputs[1:]:
+            benchutil.check_equal('Output', output, outputs[0])
+
+
+def benchmarkLatency(script, files, configurations, latency, repeat):
+    module = benchutil.load_script(script)
+    if script == 'p-stats2data.py':
+        READER.update(function=module.readRuns, latency=latency)
+        tasks = [(filename, False) for filename in files]
+    else:
+        READER.update(function=module.readPlans, latency=latency)
+        tasks = files
+    results = []
+    for jobs, pool in configurations:
+        duration, result = benchutil.best_of(repeat, module.mapFiles, delayedRead, tasks, jobs, pool)
+        benchutil.print_row('current', jobs, pool, '%.2f' % duration)
+        results.append([comparable(fileResult) for fileResult in result])
+    for result in results[1:]:
+        benchutil.check_equal('Results', result, results[0])
+
+
+def delayedRead(task):
+    time.sleep(READER['latency'])
+    return READER['function'](task)
+
+
+def comparable(result):
+    """Query plans of readPlans, or the statistics of each run of readRuns,
+    which cannot be compared themselves"""
+    if isinstance(result, list):
+        return result
+    return {algo: [(run.run, run.resultCount, run.format('mean'), run.format('std'),
+                    run.format(0.5)) for run in runs] for algo, runs in result.items()}
+
+
+def runScript(script, args):
+    return subprocess.run([sys.executable, script] + args, stdout=subprocess.PIPE,
+                          check=True, universal_newlines=True).stdout
+
+
+def writeStatsSweep(directory, files, lines, seed=1):
+    """Result files exp_N<i>.tsv with a header line before each run"""
+    rand = random.Random(seed)
+    header = "algo\ttime\tx\tx\tx\tx\tx\tcount\tfile\n"
+    filenames = []
+    for i in range(1, files + 1):
+        filename = os.path.join(directory, 'exp_N%d.tsv' % i)
+        with open(filename, 'w') as f:
+            for line in range(lines):
+                if line % max(1, lines // 3) == 0:
+                    f.write(header)
+                f.write("/usr/bin/%s\t%d\t0\t0\t0\t0\t0\t%d\tresults/N%d\n" % (
+                    ALGORITHMS[line % len(ALGORITHMS)], rand.randrange(1, 100000), i * 10, i))
+        filenames.append(filename)
+    return 'exp_', filenames
+
+
+def writePlanSweep(directory, files, lines, seed=1):
+    """EXPLAIN ANALYZE outputs q_N<i>_<algorithm> of each algorithm"""
+    rand = random.Random(seed)
+    filenames = []
+    for i in range(files):
+        algorithm = ALGORITHMS[i % len(ALGORITHMS)]
+        filename = os.path.join(directory, 'q_N%d_%s' % (i // len(ALGORITHMS) + 1, algorithm))
+        with open(filename, 'w') as f:
+            for _ in range(lines):
+                execution = rand.uniform(1, 1000)
+                f.write("SET\n"
+                        "                          QUERY PLAN\n"
+                        "--------------------------------------------------------------\n"
+                        " Seq Scan on r  (cost=0.00..378.00 rows=2000 width=8) "
+                        "(actual time=0.007..%.3f rows=2000 loops=1)\n"
+                        "   Filter: (k < 10)\n"
+                        " Planning Time: %.3f ms\n"
+                        " Execution Time: %.3f ms\n"
+                        "(4 rows)\n\n" % (execution - 0.01, rand.uniform(0.1, 1), execution))
+        filenames.append(filename)
+    return 'q_', filenames
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,83 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""Benchmark of the overlap histogram of p-printhist.py
+
+Generates ROWS random intervals with durations up to 1000 in a dense domain
+(a time point per interval) or a sparse one (1000 time points per interval),
+and measures overlapHistogram (best of --repeat runs). With --baseline REV,
+overlapHistogram of p-printhist.py of the git revision REV is measured as
+well, e.g., the sweep of f3e662a, and both histograms must be equal.
+
+Example:
+    benchmarks/bench_printhist.py --rows 1000000,10000000 --baseline f3e662a
+"""
+
+import argparse
+import sys
+
+import numpy as np
+
+import benchutil
+
+SCRIPT = 'p-printhist.py'
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        '--rows', default='1000000',
+        help='comma-separated numbers of intervals (default: %(default)s)')
+    parser.add_argument(
+        '--buckets', type=int, default=100,
+        help='number of buckets (default: %(default)s)')
+    parser.add_argument(
+        '--repeat', type=int, default=3,
+        help='runs of each measurement, the best one is shown (default: %(default)s)')
+    parser.add_argument(
+        '--baseline', metavar='REV',
+        help='git revision of %s to compare with' % SCRIPT)
+    args = parser.parse_args()
+
+    modules = [('current', benchutil.load_script(SCRIPT))]
+    if args.baseline is not None:
+        modules.append((args.baseline, benchutil.load_script(SCRIPT, args.baseline)))
+        if not hasattr(modules[1][1], 'overlapHistogram'):
+            sys.exit("ERROR: %s of %s has no overlapHistogram" % (SCRIPT, args.baseline))
+
+    benchutil.print_row('rows', 'domain', *['%s s' % name for name, _ in modules])
+    for rows in map(int, args.rows.split(',')):
+        for domain in ['dense', 'sparse']:
+            starts, ends = randomIntervals(rows, rows if domain == 'dense' else rows * 1000)
+            cells = []
+            histograms = []
+            for _, module in modules:
+                duration, histogram = benchutil.best_of(
+                    args.repeat, overlaps, module, starts, ends, args.buckets)
+                cells.append('%.2f' % duration)
+                histograms.append(histogram.tolist())
+            if len(modules) > 1:
+                benchutil.check_equal('Overlap histogram', histograms[0], histograms[1])
+            benchutil.print_row(rows, domain, *cells)
+
+
+def randomIntervals(rows, domain, seed=1):
+    rng = np.random.default_rng(seed)
+    starts = rng.integers(0, domain, rows)
+    return starts, starts + rng.integers(0, 1001, rows)
+
+
+def overlaps(module, starts, ends, buckets):
+    """Overlap histogram of a module, whose older versions had a fixed number
+    of buckets and no peak"""
+    domainstart = int(starts.min())
+    bucketlength = -(-(int(ends.max()) - domainstart) // buckets)
+    if hasattr(module, 'overlapDense'):
+        return module.overlapHistogram(starts, ends, domainstart, bucketlength, buckets)[0]
+    if buckets != module.BUCKETCOUNT:
+        sys.exit("ERROR: Older versions support %d buckets only" % module.BUCKETCOUNT)
+    return module.overlapHistogram(starts, ends, domainstart, bucketlength)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,164 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""Benchmark of p-psql2latex.py
+
+Generates an aligned psql output with a single relation of ROWS tuples, and
+measures the throughput of the tokenizer, or the time to render the parsed
+relation as LaTex table and TIKZ figure (best of --repeat runs). With
+--baseline REV, the same is measured for p-psql2latex.py of the git revision
+REV, and both versions must produce the same tokens or output.
+
+Examples:
+    benchmarks/bench_psql2latex.py --rows 1000000,10000000 --baseline e9b6c22
+    benchmarks/bench_psql2latex.py --render --rows 100000,1000000,5000000
+"""
+
+import argparse
+import io
+import itertools
+import os
+import random
+import sys
+import tempfile
+
+import benchutil
+
+SCRIPT = 'p-psql2latex.py'
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        '--rows', default='100000,1000000',
+        help='comma-separated numbers of tuples (default: %(default)s)')
+    parser.add_argument(
+        '--render', action='store_true',
+        help='measure rendering instead of the tokenizer')
+    parser.add_argument(
+        '--repeat', type=int, default=3,
+        help='runs of each measurement, the best one is shown (default: %(default)s)')
+    parser.add_argument(
+        '--baseline', metavar='REV',
+        help='git revision of %s to compare with' % SCRIPT)
+    args = parser.parse_args()
+
+    modules = [('current', benchutil.load_script(SCRIPT))]
+    if args.baseline is not None:
+        modules.append((args.baseline, benchutil.load_script(SCRIPT, args.baseline)))
+
+    with tempfile.TemporaryDirectory(prefix='pwbench-') as tmp:
+        if args.render:
+            benchutil.print_row('rows', *['%s s' % name for name, _ in modules])
+        else:
+            benchutil.print_row('rows', *['%s rows/s' % name for name, _ in modules])
+        for rows in map(int, args.rows.split(',')):
+            input_name = os.path.join(tmp, 'relation%d.out' % rows)
+            write_psql_relation(input_name, rows, delimiters=not args.render)
+            if args.render:
+                cells = benchmark_render(modules, input_name, args.repeat)
+            else:
+                cells = benchmark_tokenizer(modules, input_name, args.repeat)
+            benchutil.print_row(rows, *cells)
+            os.remove(input_name)
+
+
+def benchmark_tokenizer(modules, input_name, repeat):
+    cells = []
+    for _, module in modules:
+        duration, rows = benchutil.best_of(repeat, count_tuples, module, input_name)
+        cells.append('%.0f' % (rows / duration))
+    if len(modules) > 1:
+        check_tokens(modules[0][1], modules[1][1], input_name)
+    return cells
+
+
+def benchmark_render(modules, input_name, repeat):
+    """Tables and figures are rendered to /dev/null for the timings, and to
+    a string for the comparison"""
+    cells = []
+    outputs = []
+    with open(os.devnull, 'w') as devnull:
+        for _, module in modules:
+            parse_result, cfg = parse(module, input_name)
+            duration, _ = benchutil.best_of(repeat, render, module, parse_result, cfg, devnull)
+            cells.append('%.2f' % duration)
+            if len(modules) > 1:
+                output = io.StringIO()
+                render(module, parse_result, cfg, output)
+                outputs.append(output.getvalue())
+    if len(modules) > 1:
+        benchutil.check_equal('Output', outputs[0], outputs[1])
+    return cells
+
+
+def parse(module, filename):
+    with open(filename) as f:
+        lines = f.readlines()
+    if hasattr(module, 'pgsql_events'):
+        parse_result = module.pgsql_parser(module.pgsql_tokenizer(lines))
+    else:
+        parse_result = module.pgsql_parser(lines)
+    cfg = {}
+    for line in parse_result:
+        if line['type'] == 'config':
+            cfg[line['key']] = line['value']
+    return parse_result, cfg
+
+
+def render(module, parse_result, cfg, out):
+    """Render the table (side-by-side type) and figure, old versions return
+    them as strings"""
+    for line in parse_result:
+        if line['type'] == 'relation-table':
+            if hasattr(module, 'write_latex_table'):
+                module.write_latex_table(out, line, "", 2)
+            else:
+                out.write(module.format_latex_table(line, "", 2))
+    if hasattr(module, 'write_tikz_figure'):
+        module.write_tikz_figure(out, parse_result, cfg)
+    else:
+        out.write(module.format_tikz_figure(parse_result, cfg))
+
+
+def write_psql_relation(filename, rows, delimiters=True, seed=1):
+    """Aligned psql output of a relation with rows tuples of random
+    intervals, and some values with the column delimiter inside, unless
+    delimiters is False"""
+    rand = random.Random(seed)
+    with open(filename, 'w') as f:
+        f.write("-- TIKZ: relation-table, r, ts, te,, Relation r\n")
+        f.write("TABLE r;\n")
+        f.write(" a      |    ts    |    te\n")
+        f.write("--------+----------+----------\n")
+        for i in range(rows):
+            ts = rand.randrange(1000000)
+            value = "B%d" % (i % 997)
+            if delimiters and i % 101 == 0:
+                value = "B|%d" % (i % 997)
+            f.write(" %-6s | %8d | %8d\n" % (value, ts, ts + rand.randrange(1, 1000)))
+        f.write("(%d rows)\n\n" % rows)
+        f.write("-- TIKZ: config, label, bench\n")
+        f.write("-- TIKZ: config, caption, Benchmark\n")
+
+
+def count_tuples(module, filename):
+    with open(filename) as f:
+        return sum(1 for token in module.pgsql_tokenizer(f) if token[0] == 'TUPLE')
+
+
+def check_tokens(current, baseline, filename):
+    """Tokens of both versions must be the same. Old versions split values
+    with delimiters inside, which we do not compare."""
+    with open(filename) as f, open(filename) as g:
+        for token, expected in itertools.zip_longest(current.pgsql_tokenizer(f),
+                                                     baseline.pgsql_tokenizer(g)):
+            if token is None or expected is None:
+                benchutil.check_equal('Number of tokens', token, expected)
+            if token[0] == 'TUPLE' and '|' in token[1][0]:
+                continue
+            benchutil.check_equal('Token %r' % (token,), token, expected)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
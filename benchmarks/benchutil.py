@@ -0,0 +1,80 @@
+"""Common parts of the benchmarks of the Python scripts in the repository root.
+
+Scripts are loaded as modules, either from the working tree, or from a git
+revision (see --baseline of each benchmark) to compare the timings and
+outputs with an older version."""
+
+import importlib.util
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules, which the scripts import from their directory
+SHARED_MODULES = ['pwresults.py']
+
+# Scripts of the working tree import shared modules next to them
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+def load_script(script, revision=None):
+    """Import script, e.g., p-psql2latex.py, as module. With a revision, the
+    script is taken from git, e.g., HEAD~3 or a commit hash, together with
+    the shared modules of that revision, which it can run with as a process.
+    Imported as module, it uses the shared modules of the working tree."""
+    name = script[:-3].replace('-', '_')
+    path = os.path.join(ROOT, script)
+    if revision is not None:
+        name = '%s_%s' % (name, revision.replace('~', '_').replace('^', '_'))
+        tmp = tempfile.mkdtemp(prefix='pwbench-')
+        path = os.path.join(tmp, script)
+        for filename in [script] + SHARED_MODULES:
+            try:
+                source = subprocess.check_output(['git', 'show', '%s:%s' % (revision, filename)],
+                                                 cwd=ROOT, stderr=subprocess.DEVNULL)
+            except subprocess.CalledProcessError:
+                if filename == script:
+                    raise
+                continue    # Older revisions without the shared module
+            with open(os.path.join(tmp, filename), 'wb') as f:
+                f.write(source)
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def script_path(script, revision=None):
+    """Filename of script, which can be run; see load_script"""
+    if revision is None:
+        return os.path.join(ROOT, script)
+    return load_script(script, revision).__file__
+
+
+def best_of(repeat, function, *args):
+    """Run function repeat times, and return the shortest duration in seconds
+    and the result of the last run"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args)
+        duration = time.perf_counter() - start
+        if best is None or duration < best:
+            best = duration
+    return best, result
+
+
+def print_row(*cells):
+    print("  ".join("%12s" % cell for cell in cells))
+    sys.stdout.flush()
+
+
+def check_equal(what, current, baseline):
+    if current != baseline:
+        print("ERROR: %s differs from the baseline" % what, file=sys.stderr)
+        sys.exit(1)
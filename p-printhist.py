@@ -6,105 +6,196 @@ Created on Tue Apr 18 11:02:01 2017
 @author: pemoser
 """
 
-import matplotlib.pyplot as plt
 import sys
 import os
-import math
-from operator import itemgetter
+import argparse
+import warnings
+import itertools
+import multiprocessing
+import hashlib
+import shutil
+import tempfile
+import numpy as np
 
 BUCKETCOUNT = 100
+CHUNKSIZE = 100000      # Rows per chunk in streaming mode
+DENSEFACTOR = 4         # Counting sort for domains up to 4 time points per interval
+SKETCHSIZE = 4096       # Items per level of quantile sketches in streaming mode
+QUANTILES = [50, 90, 99]
+CACHEVERSION = 1        # Changes of the cache file format
+CACHECOPYSIZE = 1024 * 1024
+
+HISTOGRAMS = ['start', 'end', 'duration']
+
+TYPES_HELP = """
+   TYPE is one of the following:
+       start     start points histogram output
+       end       ending points histogram output
+       duration  duration histogram output
+       overlap   concurrent overlapping tuples histogram output
+       dataNN    histogram output of the NN-th data column after start and
+                 end, i.e., data00 is the third column (see --columns)
+"""
 
 def main():
 
-    if len(sys.argv) != 3:
-        print("USAGE: %s input prefix" % os.path.basename(sys.argv[0]))
-        print("       input     filename of a temporal data file (TSV)")
-        print("       prefix    filename prefix for results, i.e., prefix-TYPE.tsv")
-        print()
-        print("   TYPE is one of the following:")
-        print("       start     start points histogram output")
-        print("       end       ending points histogram output")
-        print("       duration  duration histogram output")
-        print("       overlap   concurrent overlapping tuples histogram output")
-        sys.exit(1)
-
-    inputf = sys.argv[1]
-    prefix = sys.argv[2]
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=TYPES_HELP)
+
+    parser.add_argument(
+        'input',
+        nargs='+',
+        help='filenames of temporal data files (TSV), e.g., shards of one '
+             'data set, which are processed as if they were concatenated')
+
+    parser.add_argument(
+        'prefix',
+        help='filename prefix for results, i.e., prefix-TYPE.csv')
+
+    parser.add_argument(
+        '--plot',
+        action='store_true',
+        help='also plot each histogram into prefix-TYPE.png (needs matplotlib)')
+
+    parser.add_argument(
+        '--columns',
+        type=parseColumns,
+        metavar='NN,...',
+        help='comma-separated numbers of data columns to analyze, e.g., 0,2 '
+             'for data00 and data02, or "none". Other data columns are not '
+             'even parsed. Default are all data columns.')
+
+    parser.add_argument(
+        '--buckets',
+        type=int,
+        default=BUCKETCOUNT,
+        metavar='N',
+        help='number of buckets of each histogram (default: %(default)s)')
+
+    parser.add_argument(
+        '--log-durations',
+        action='store_true',
+        help='use logarithmic duration buckets, i.e., short durations get '
+             'more buckets than long ones')
+
+    parser.add_argument(
+        '--stream',
+        action='store_true',
+        help='read the input twice in chunks (see --chunk-size), such that '
+             'memory does not depend on the input size. The overlap '
+             'histogram then counts all intervals, which overlap a bucket, '
+             'instead of the maximum of concurrently open intervals.')
+
+    parser.add_argument(
+        '--chunk-size',
+        type=int,
+        default=CHUNKSIZE,
+        metavar='ROWS',
+        help='rows per chunk with --stream (default: %(default)s)')
+
+    parser.add_argument(
+        '--jobs',
+        type=int,
+        default=os.cpu_count(),
+        metavar='N',
+        help='number of processes for several input files (default: number '
+             'of CPUs). With --stream, each process computes all statistics '
+             'and bucket counters of its files, otherwise only reads them.')
+
+    parser.add_argument(
+        '--cache',
+        action='store_true',
+        help='keep the parsed columns of each input file in the cache '
+             'directory, and reuse them while the file does not change, '
+             'i.e., its size and modification time stay the same')
+
+    parser.add_argument(
+        '--cache-dir',
+        metavar='DIR',
+        default=getDefaultCacheDir(),
+        help='cache directory of --cache (default: %(default)s)')
+
+    parser.add_argument(
+        '--cache-size',
+        metavar='MB',
+        type=int,
+        default=4096,
+        help='remove least recently used files from the cache directory, if '
+             'it is bigger than MB megabytes (default: %(default)s)')
+
+    args = parser.parse_args()
+    if args.buckets < 1:
+        parser.error("--buckets must be at least 1")
+    if args.chunk_size < 1:
+        parser.error("--chunk-size must be at least 1")
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+
+    inputfs = args.input
+    prefix = args.prefix
     startf = prefix + "-start.csv"
     endingf = prefix + "-end.csv"
     durationf = prefix + "-duration.csv"
     overlapf = prefix + "-overlap.csv"
 
-    statistics = {
-        'lengths'   : [],
-        'starts'    : [],
-        'ends'      : []
-    }
-    with open(inputf, 'r') as file:
-        for rawline in file:
-            line = [int(x) for x in rawline.split("\t")]
-            statistics['starts'].append(line[0])
-            statistics['ends'].append(line[1])
-            statistics['lengths'].append(line[1] - line[0])
-            if len(line) > 2:
-                for i, d in enumerate(line[2:]):
-                    if not 'data%02d' % i in statistics:
-                        statistics['data%02d' % i] = []
-                    statistics['data%02d' % i].append(d)
-
-    domainstart = min(statistics['starts'])
-    domainend = max(statistics['ends'])
-    domainlength = domainend - domainstart
-    bucketlength = math.ceil(domainlength / BUCKETCOUNT)
-    n = len(statistics['starts'])
+    cachedir = args.cache_dir if args.cache else None
+    try:
+        if args.stream:
+            result = streamHistograms(inputfs, args.chunk_size, args.buckets,
+                                      args.log_durations, args.jobs, cachedir,
+                                      args.columns)
+        else:
+            result = memoryHistograms(inputfs, args.buckets, args.log_durations,
+                                      args.jobs, cachedir, args.columns)
+    except InputError as err:
+        exitError(str(err))
+    if args.cache:
+        evictCache(args.cache_dir, args.cache_size * 1024 * 1024)
+
+    domainstart = result['domainstart']
+    domainlength = result['domainlength']
+    n = result['n']
 
     # Find concurrently open intervals
-    START = 0
-    END = 1
-    epindex = [(x, START) for x in statistics['starts']]
-    epindex += [(x, END) for x in statistics['ends']]
-    epindex = sorted(epindex, key=itemgetter(0,1))
-    openints = [0] * BUCKETCOUNT
-    bucket = 1
-    overlaps = 0
-    maxoverlaps = 0
-    for (time, type) in epindex:
-        while time > domainstart + bucket * bucketlength:
-            openints[bucket - 1] = maxoverlaps
-            maxoverlaps = overlaps
-            bucket += 1
-
-        if type == START:
-            overlaps += 1
-            if maxoverlaps < overlaps:
-                maxoverlaps = overlaps
-        else:
-            overlaps -= 1
-    openints[BUCKETCOUNT - 1] = maxoverlaps
-    print("OVERLAPS       -- " + statsToString(openints))
-    openints = [x * 100 / n for x in openints]
-    printHistogram(range(1, BUCKETCOUNT + 1), openints, overlapf)
+    openints = result['overlap']
+    stats = Statistics(exact=True)
+    stats.add(openints)
+    print("OVERLAPS       -- " + statsToString(stats))
+    if result['peak'] is not None:
+        print("PEAK OVERLAP   -- MAX=%d, TIME=%d" % (openints.max(), result['peak']))
+    openints = openints * 100 / n
+    printHistogram(range(1, args.buckets + 1), openints, overlapf, args.plot)
 
     # Create start-points histogram in percentage
-    freq, bins, _ = plt.hist(statistics['starts'], BUCKETCOUNT)
-    bins = [(x - domainstart) * 100 / domainlength for x in bins]
-    freq = [x * 100 / n for x in freq]
-    print("START POINTS   -- " + statsToString(statistics['starts']))
-    printHistogram(bins, freq, endingf)
+    freq, bins, stats = result['start']
+    bins = (bins - domainstart) * 100 / domainlength
+    freq = freq * 100 / n
+    print("START POINTS   -- " + statsToString(stats))
+    printHistogram(bins, freq, startf, args.plot)
 
     # Create ending-points histogram in percentage
-    freq, bins, _ = plt.hist(statistics['ends'], BUCKETCOUNT)
-    bins = [(x - domainstart) * 100 / domainlength for x in bins]
-    freq = [x * 100 / n for x in freq]
-    print("ENDING POINTS  -- " + statsToString(statistics['ends']))
-    printHistogram(bins, freq, startf)
+    freq, bins, stats = result['end']
+    bins = (bins - domainstart) * 100 / domainlength
+    freq = freq * 100 / n
+    print("ENDING POINTS  -- " + statsToString(stats))
+    printHistogram(bins, freq, endingf, args.plot)
 
     # Create duration histogram in percentage
-    freq, bins, _ = plt.hist(statistics['lengths'], BUCKETCOUNT)
-    bins = [x * 100 / domainlength for x in bins]
-    freq = [x * 100 / n for x in freq]
-    print("DURATION       -- " + statsToString(statistics['lengths']))
-    printHistogram(bins, freq, durationf)
+    freq, bins, stats = result['duration']
+    bins = bins * 100 / domainlength
+    freq = freq * 100 / n
+    print("DURATION       -- " + statsToString(stats))
+    # Logarithmic buckets of short durations are tiny in percent
+    printHistogram(bins, freq, durationf, args.plot,
+                   "%.3e" if args.log_durations else "%.3f")
+
+    # Create data histograms in percentage over the range of each column
+    for key in result['data']:
+        freq, bins, stats = result[key]
+        freq = freq * 100 / n
+        print("%-15s-- %s" % (key.upper(), statsToString(stats)))
+        printHistogram(bins, freq, "%s-%s.csv" % (prefix, key), args.plot)
 
     print("READY.")
 
@@ -112,21 +203,605 @@ def main():
 
 
 
-def avg(array):
-    return sum(array) / len(array)
+def memoryHistograms(inputfs, buckets, logdurations=False, jobs=1, cachedir=None,
+                     columns=None):
+    """Load all input files, and compute all histograms. Returns the domain,
+    the number of intervals n, the overlap histogram, the frequencies, bin
+    edges and statistics of start points, ending points, durations and the
+    selected data columns (see parseColumns), and the names of these data
+    columns."""
+
+    # Each row holds start, end, and optional data columns
+    data = loadIntervals(inputfs, jobs, cachedir, columns)
+    starts = data[:, 0]
+    ends = data[:, 1]
+
+    domainstart = int(starts.min())
+    domainend = int(ends.max())
+    domainlength = domainend - domainstart
+    bucketlength = -(-domainlength // buckets)
+
+    result = {
+        'domainstart'   : domainstart,
+        'domainlength'  : domainlength,
+        'n'             : len(starts),
+        'data'          : []
+    }
+    result['overlap'], result['peak'] = overlapHistogram(
+        starts, ends, domainstart, bucketlength, buckets)
+    for key, values in intervalColumns(data, columns):
+        stats = Statistics(exact=True)
+        stats.add(values)
+        edges = histogramEdges(stats, buckets, logdurations and key == 'duration')
+        result[key] = (np.histogram(values, edges)[0], edges, stats)
+        if key not in HISTOGRAMS:
+            result['data'].append(key)
+    return result
+
+def streamHistograms(inputfs, chunksize, buckets, logdurations=False, jobs=1,
+                     cachedir=None, columns=None):
+    """Same as memoryHistograms, but each input file is read twice chunk by
+    chunk: The first pass computes the domain and statistics, and the second
+    fills the bucket counters. Each pass yields partial results per file,
+    which are merged afterwards. The overlap histogram counts all intervals,
+    which overlap each bucket, with a difference array (see overlapCounts)."""
+
+    # First pass: Bounds of each histogram, and statistics
+    stats = {}
+    tasks = [(inputf, chunksize, cachedir, columns) for inputf in inputfs]
+    for inputf, partial in zip(inputfs, mapFiles(streamStats, tasks, jobs)):
+        if len(partial) == 0:
+            continue
+        if len(stats) == 0:
+            stats = partial
+            first = inputf
+        elif list(partial) != list(stats):
+            raise InputError("%s: the number of columns differs from %s" % (
+                inputf, first))
+        else:
+            for key in stats:
+                stats[key].merge(partial[key])
+    if len(stats) == 0:
+        raise InputError("%s: No intervals found" % ", ".join(inputfs))
+
+    domainstart = stats['start'].min
+    domainlength = stats['end'].max - domainstart
+    bucketlength = -(-domainlength // buckets)
+
+    # Second pass: Bucket counters with the same bins as in memory
+    edges = {}
+    for key in stats:
+        edges[key] = histogramEdges(stats[key], buckets,
+                                    logdurations and key == 'duration')
+    freqs = {key: np.zeros(buckets, dtype=np.int64) for key in stats}
+    diff = np.zeros(buckets + 1, dtype=np.int64)
+    tasks = [(inputf, chunksize, cachedir, columns, edges, domainstart,
+              bucketlength, buckets) for inputf in inputfs]
+    for partfreqs, partdiff in mapFiles(streamCounts, tasks, jobs):
+        for key in partfreqs:
+            freqs[key] += partfreqs[key]
+        diff += partdiff
+
+    result = {
+        'domainstart'   : domainstart,
+        'domainlength'  : domainlength,
+        'n'             : stats['start'].count,
+        'overlap'       : np.cumsum(diff[:buckets]),
+        'peak'          : None,
+        'data'          : [key for key in stats if key not in HISTOGRAMS]
+    }
+    for key in stats:
+        result[key] = (freqs[key], edges[key], stats[key])
+    return result
+
+def streamStats(task):
+    """First pass of streamHistograms over one file: Statistics of each
+    column, or nothing for an empty file"""
+    inputf, chunksize, cachedir, columns = task
+    stats = {}
+    for data in readChunks(inputf, chunksize, cachedir, columns):
+        for key, values in intervalColumns(data, columns):
+            stats.setdefault(key, Statistics()).add(values)
+    return stats
+
+def streamCounts(task):
+    """Second pass of streamHistograms over one file: Bucket counters of each
+    histogram, and the difference array of the overlap histogram"""
+    inputf, chunksize, cachedir, columns, edges, domainstart, bucketlength, buckets = task
+    freqs = {}
+    diff = np.zeros(buckets + 1, dtype=np.int64)
+    for data in readChunks(inputf, chunksize, cachedir, columns):
+        for key, values in intervalColumns(data, columns):
+            freq = np.histogram(values, edges[key])[0]
+            freqs[key] = freqs[key] + freq if key in freqs else freq
+        diff += overlapCounts(data[:, 0], data[:, 1], domainstart, bucketlength,
+                              buckets)
+    return freqs, diff
+
+def mapFiles(function, tasks, jobs):
+    """Map the tasks of several files in a process pool with up to jobs
+    processes, or one after another in this process"""
+    jobs = min(jobs, len(tasks))
+    if jobs <= 1:
+        return list(map(function, tasks))
+    with multiprocessing.Pool(jobs) as pool:
+        return pool.map(function, tasks, chunksize=1)
+
+def intervalColumns(data, columns=None):
+    """Start points, ending points, durations and data columns of a chunk of
+    intervals, which holds the selected data columns only (see
+    selectColumns)"""
+    if columns is None:
+        columns = range(data.shape[1] - 2)
+    result = [('start', data[:, 0]),
+              ('end', data[:, 1]),
+              ('duration', data[:, 1] - data[:, 0])]
+    for i, column in enumerate(columns):
+        result.append(('data%02d' % column, data[:, 2 + i]))
+    return result
+
+def parseColumns(text):
+    """Numbers of the data columns of --columns, i.e., the columns after start
+    and end"""
+    if text.strip().lower() in ["", "none"]:
+        return []
+    try:
+        columns = [int(column) for column in text.split(",")]
+    except ValueError:
+        raise argparse.ArgumentTypeError("invalid column list: '%s'" % text)
+    if any(column < 0 for column in columns):
+        raise argparse.ArgumentTypeError("invalid column number in '%s'" % text)
+    return sorted(set(columns))
+
+def getUsecols(columns):
+    """Indexes of the start and end, and the selected data columns of a row, or
+    None for all columns"""
+    if columns is None:
+        return None
+    return [0, 1] + [2 + column for column in columns]
+
+def selectColumns(data, columns, filename):
+    """Start and end, and the selected data columns of a 2D array with all
+    columns, e.g., from the cache"""
+    if columns is None:
+        return data
+    if len(columns) > 0 and 2 + columns[-1] >= data.shape[1]:
+        raise InputError("%s: there is no column data%02d" % (filename, columns[-1]))
+    return data[:, getUsecols(columns)]
+
+def histogramEdges(stats, buckets, log=False):
+    """Bin edges of a histogram over the range of values, which is equal to
+    the bins of np.histogram. Logarithmic bins grow with log(1 + value)."""
+    if log and stats.min < 0:
+        raise InputError("Logarithmic buckets need non-negative values")
+    if log and stats.min < stats.max:
+        edges = np.expm1(np.linspace(np.log1p(stats.min), np.log1p(stats.max),
+                                     buckets + 1))
+        edges[0] = stats.min
+        edges[-1] = stats.max
+        return edges
+    return np.histogram_bin_edges([], buckets, range=(stats.min, stats.max))
 
-def statsToString(array):
-    return "MIN=%d, MAX=%d, AVG=%.3f, LEN=%d" % (
-        min(array),
-        max(array),
-        avg(array),
-        len(array))
+def overlapCounts(starts, ends, domainstart, bucketlength, buckets):
+    """Difference array of the number of intervals, which overlap each bucket,
+    i.e., +1 at the bucket of each start point, and -1 after the bucket of
+    each ending point. Buckets are the same as in overlapHistogram."""
+    return (np.bincount(getBuckets(starts, domainstart, bucketlength, buckets),
+                        minlength=buckets + 1) -
+            np.bincount(getBuckets(ends, domainstart, bucketlength, buckets) + 1,
+                        minlength=buckets + 1))
 
-def printHistogram(bins, freq, filename):
+def getBuckets(times, domainstart, bucketlength, buckets):
+    """Bucket of each time point: Bucket i holds the time points after
+    domainstart + i * bucketlength up to domainstart + (i + 1) * bucketlength,
+    and the first bucket also holds domainstart itself."""
+    if bucketlength == 0:
+        return np.zeros(len(times), dtype=np.int64)
+    indexes = -(-(times - domainstart) // bucketlength) - 1
+    return np.clip(indexes, 0, buckets - 1)
+
+def readChunks(filename, chunksize, cachedir=None, columns=None):
+    """Read tab-separated integer rows of a file into 2D int64 arrays with at
+    most chunksize rows each (see loadIntervals). With a cache directory,
+    chunks are slices of the cached columns, or they are cached meanwhile."""
+    if cachedir is None:
+        yield from parseChunks(filename, chunksize, getUsecols(columns))
+        return
+
+    # The cache holds all columns, such that it also fits other selections
+    entry = getCacheEntry(filename, cachedir)
+    data = loadCache(entry)
+    if data is None:
+        chunks = writeCache(entry, parseChunks(filename, chunksize))
+    else:
+        chunks = (data[i:i + chunksize] for i in range(0, len(data), chunksize))
+    for chunk in chunks:
+        yield selectColumns(chunk, columns, filename)
+
+def parseChunks(filename, chunksize, usecols=None):
+    columns = None
+    try:
+        file = open(filename, 'r')
+    except OSError as err:
+        raise InputError("%s: %s" % (filename, err))
+    with file:
+        while True:
+            lines = list(itertools.islice(file, chunksize))
+            if len(lines) == 0:
+                return
+            data = parseRows(lines, filename, usecols)
+            if columns is None:
+                columns = data.shape[1]
+            elif data.shape[1] != columns:
+                raise InputError("%s: the number of columns changed from %d to %d" % (
+                    filename, columns, data.shape[1]))
+            yield data
+
+def loadIntervals(filenames, jobs=1, cachedir=None, columns=None):
+    """Read all tab-separated integer rows of files at once into a 2D int64
+    array, i.e., one row per interval. Files are read in parallel with up to
+    jobs processes. Cached files are mapped into memory, i.e., the array of a
+    single cached file is not even read. Only the selected data columns are
+    kept (see selectColumns)."""
+    parts = []
+    tasks = [(filename, cachedir, columns) for filename in filenames]
+    for filename, data in zip(filenames, mapFiles(readIntervals, tasks, jobs)):
+        if data.shape[0] == 0:
+            continue
+        if len(parts) == 0:
+            first = filename
+        elif data.shape[1] != parts[0].shape[1]:
+            raise InputError("%s: the number of columns differs from %s" % (
+                filename, first))
+        parts.append(data)
+    if len(parts) == 0:
+        raise InputError("%s: No intervals found" % ", ".join(filenames))
+    if len(parts) == 1:
+        return parts[0]
+    return np.concatenate(parts)
+
+def readIntervals(task):
+    filename, cachedir, columns = task
+    if cachedir is None:
+        return parseRows(filename, filename, getUsecols(columns))
+
+    entry = getCacheEntry(filename, cachedir)
+    data = loadCache(entry)
+    if data is None:
+        data = parseRows(filename, filename)
+        for _ in writeCache(entry, [data]):
+            pass
+    return selectColumns(data, columns, filename)
+
+def parseRows(source, filename, usecols=None):
+    """Parse tab-separated integer rows of a file or list of lines into a 2D
+    int64 array, optionally of some columns only. Each row needs a start and
+    ending point at least."""
+    try:
+        # Empty files are fine, e.g., empty shards of a data set
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', UserWarning)
+            data = np.loadtxt(source, dtype=np.int64, delimiter="\t", ndmin=2,
+                              usecols=usecols)
+    except (OSError, ValueError) as err:
+        raise InputError("%s: %s" % (filename, err))
+    if data.shape[0] > 0 and data.shape[1] < 2:
+        raise InputError("%s: Rows need a start and ending point" % filename)
+    return data
+
+def getDefaultCacheDir():
+    """Cache directory inside the user's cache home (see XDG base directories)"""
+    home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(home, "pwscripts", "printhist")
+
+def getCacheEntry(filename, cachedir):
+    """Cache file of an input file, which is named after a hash of its path,
+    size and modification time"""
+    try:
+        st = os.stat(filename)
+    except OSError as err:
+        raise InputError("%s: %s" % (filename, err))
+    key = [CACHEVERSION, os.path.abspath(filename), st.st_size, st.st_mtime_ns]
+    return os.path.join(cachedir, hashlib.sha256(repr(key).encode()).hexdigest() + ".npy")
+
+def loadCache(entry):
+    """Map the columns of a cache file into memory, or None if it does not
+    exist. Cache files are .npy files in column-major order, such that each
+    column is contiguous."""
+    try:
+        data = np.load(entry, mmap_mode='r')
+        os.utime(entry)
+    except (OSError, ValueError):
+        return None
+    if data.ndim != 2 or data.shape[1] < 2 or data.dtype != np.int64:
+        return None
+    return data
+
+def writeCache(entry, chunks):
+    """Pass through 2D int64 arrays of chunks, and write all of them into a
+    cache file at the end. Each column is collected in a temporary file first,
+    such that only one chunk is in memory. New cache files appear atomically,
+    and empty inputs are not cached."""
+    columns = []
+    rows = 0
+    try:
+        for data in chunks:
+            if len(columns) == 0:
+                columns = [tempfile.TemporaryFile() for _ in range(data.shape[1])]
+            for i, column in enumerate(columns):
+                np.ascontiguousarray(data[:, i]).tofile(column)
+            rows += len(data)
+            yield data
+        if rows == 0:
+            return
+
+        cachedir = os.path.dirname(entry)
+        os.makedirs(cachedir, exist_ok=True)
+        fd, tmpname = tempfile.mkstemp(suffix=".tmp", dir=cachedir)
+        try:
+            # mkstemp creates private files, but the cache is not
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(tmpname, 0o666 & ~umask)
+            with os.fdopen(fd, 'wb') as file:
+                np.lib.format.write_array_header_1_0(file, {
+                    'descr'         : np.lib.format.dtype_to_descr(np.dtype(np.int64)),
+                    'fortran_order' : True,
+                    'shape'         : (rows, len(columns))
+                })
+                for column in columns:
+                    column.seek(0)
+                    shutil.copyfileobj(column, file, CACHECOPYSIZE)
+            os.replace(tmpname, entry)
+        except BaseException:
+            os.remove(tmpname)
+            raise
+    finally:
+        for column in columns:
+            column.close()
+
+def evictCache(cachedir, maxsize):
+    """Remove least recently used cache files, until the cache directory is
+    not bigger than maxsize bytes. Other processes may remove files at the
+    same time, hence missing files are fine."""
+    entries = []
+    size = 0
+    try:
+        scan = list(os.scandir(cachedir))
+    except FileNotFoundError:
+        return
+    for entry in scan:
+        if not entry.name.endswith(".npy"):
+            continue
+        try:
+            st = entry.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((st.st_mtime, st.st_size, entry.path))
+        size += st.st_size
+
+    for _, entrysize, path in sorted(entries):
+        if size <= maxsize:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        size -= entrysize
+
+class InputError(Exception):
+    """Invalid input file, which may be raised within worker processes"""
+
+def exitError(msg):
+    sys.exit("%s: ERROR: %s" % (os.path.basename(sys.argv[0]), msg))
+
+def overlapHistogram(starts, ends, domainstart, bucketlength, buckets):
+    """Maximum number of concurrently open intervals within each bucket, and
+    the first time point with the overall maximum. End points count after
+    start points with the same time, and each bucket also counts the
+    intervals, which are open at its beginning."""
+    if bucketlength == 0:
+        # All intervals start and end at domainstart
+        openints = np.zeros(buckets, dtype=np.int64)
+        openints[buckets - 1] = len(starts)
+        return openints, domainstart
+
+    # Buckets up to the last ending point, which may leave buckets at the end
+    domainlength = int(ends.max()) - domainstart
+    used = -(-domainlength // bucketlength)
+    if domainlength < DENSEFACTOR * len(starts):
+        maxima, peak = overlapDense(starts, ends, domainstart, bucketlength,
+                                    domainlength, used)
+    else:
+        maxima, peak = overlapSparse(starts, ends, domainstart, bucketlength,
+                                     used)
+
+    # As always, the last used bucket goes into the last one, and all other
+    # buckets after the last ending point stay empty
+    openints = np.zeros(buckets, dtype=np.int64)
+    openints[:used - 1] = maxima[:-1]
+    openints[buckets - 1] = maxima[-1]
+    return openints, peak
+
+def overlapDense(starts, ends, domainstart, bucketlength, domainlength, buckets):
+    """overlapHistogram with a counting sort of all time points of a small
+    domain. The number of open intervals after the start points of a time
+    point are all start points up to it, minus all ending points before it."""
+    startcounts = np.bincount(starts - domainstart, minlength=domainlength + 1)
+    endcounts = np.bincount(ends - domainstart, minlength=domainlength + 1)
+    overlaps = np.cumsum(startcounts) - (np.cumsum(endcounts) - endcounts)
+
+    # The first time point of each bucket also counts the intervals, which
+    # are open at the beginning of the bucket
+    firsts = np.arange(buckets, dtype=np.int64) * bucketlength + 1
+    firsts[0] = 0
+    maxima = np.maximum.reduceat(overlaps, firsts)
+    return maxima, domainstart + int(overlaps.argmax())
+
+def overlapSparse(starts, ends, domainstart, bucketlength, buckets):
+    """overlapHistogram with sorted start and ending points of a large domain.
+    The number of open intervals after the i-th start point is i + 1 minus
+    all ending points before it."""
+    starts = np.sort(starts)
+    ends = np.sort(ends)
+    overlaps = np.arange(1, len(starts) + 1) - np.searchsorted(ends, starts, 'left')
+
+    # Intervals, which are open at the beginning of each bucket
+    bounds = domainstart + np.arange(buckets, dtype=np.int64) * bucketlength
+    firsts = np.searchsorted(starts, bounds, 'right')
+    entries = firsts - np.searchsorted(ends, bounds, 'right')
+    firsts[0] = 0
+    entries[0] = 0
+
+    # Start points of each bucket, where reduceat returns the value at the
+    # first index of empty buckets
+    empty = firsts == np.append(firsts[1:], len(starts))
+    maxima = np.maximum.reduceat(np.append(overlaps, 0),
+                                 np.minimum(firsts, len(starts)))
+    maxima[empty] = 0
+    peak = int(overlaps.argmax())
+    return np.maximum(maxima, entries), int(starts[peak])
+
+class Statistics:
+    """Statistics of integer values, which are added chunk by chunk in a
+    single pass: minimum, maximum, mean, variance and quantiles. Quantiles
+    are exact, or estimated with a QuantileSketch in streaming mode."""
+
+    def __init__(self, exact=False):
+        self.count = 0
+        self.min = None
+        self.max = None
+        self.total = 0          # Exact sum as Python integer
+        self.m2 = 0.0           # Sum of squared distances to the mean
+        self.sketch = QuantileSketch(None if exact else SKETCHSIZE)
+
+    def add(self, values):
+        if len(values) == 0:
+            return
+        count = len(values)
+        total = exactSum(values)
+        m2 = float(np.square(values - total / count).sum())
+        self.__merge__(count, int(values.min()), int(values.max()), total, m2)
+        self.sketch.add(values)
+
+    def merge(self, other):
+        if other.count == 0:
+            return
+        self.__merge__(other.count, other.min, other.max, other.total, other.m2)
+        self.sketch.merge(other.sketch)
+
+    def __merge__(self, count, low, high, total, m2):
+        # Parallel variance by Chan et al.
+        if self.count > 0:
+            delta = total / count - self.mean()
+            m2 += self.m2 + delta * delta * self.count * count / (self.count + count)
+            low = min(self.min, low)
+            high = max(self.max, high)
+        self.count += count
+        self.min = low
+        self.max = high
+        self.total += total
+        self.m2 = m2
+
+    def mean(self):
+        return self.total / self.count
+
+    def variance(self):
+        return self.m2 / self.count
+
+    def quantiles(self, qs):
+        return self.sketch.quantiles(qs)
+
+class QuantileSketch:
+    """KLL-style quantile sketch: Level i holds items, which stand for 2**i
+    values each. A full level is sorted, and every other item moves up to the
+    next level, starting at the first or second at random. Without capacity,
+    all values are kept, i.e., quantiles are exact."""
+
+    def __init__(self, capacity=SKETCHSIZE):
+        self.capacity = capacity
+        self.levels = []
+        self.random = np.random.default_rng(0)
+
+    def add(self, values):
+        self.__addLevel__(0, values)
+
+    def merge(self, other):
+        for level, items in enumerate(other.levels):
+            self.__addLevel__(level, items)
+
+    def __addLevel__(self, level, items):
+        while len(items) > 0:
+            # Merged sketches may have more levels than this one
+            while level > len(self.levels):
+                self.levels.append(items[:0])
+            if level == len(self.levels):
+                self.levels.append(items)
+            else:
+                self.levels[level] = np.concatenate((self.levels[level], items))
+            if self.capacity is None or len(self.levels[level]) <= self.capacity:
+                return
+            # An odd item stays, such that no weight gets lost
+            items = np.sort(self.levels[level])
+            self.levels[level] = items[len(items) - len(items) % 2:]
+            items = items[self.random.integers(2):len(items) - len(items) % 2:2]
+            level += 1
+
+    def quantiles(self, qs):
+        """Smallest values, such that a q-th of all values are smaller or
+        equal, for each q in qs"""
+        if self.capacity is None:
+            return np.quantile(np.concatenate(self.levels), qs, method='inverted_cdf')
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(level), 1 << i, dtype=np.int64)
+                                  for i, level in enumerate(self.levels)])
+        order = np.argsort(items)
+        cumulative = np.cumsum(weights[order])
+        return items[order[np.searchsorted(cumulative, np.multiply(qs, cumulative[-1]))]]
+
+def exactSum(array):
+    # int64 sums overflow for many large time points, e.g., microseconds since
+    # 1970, hence we sum up the upper and lower 32 bits of chunks separately
+    # into a Python integer
+    total = 0
+    for i in range(0, len(array), CHUNKSIZE):
+        chunk = array[i:i + CHUNKSIZE]
+        total += (int((chunk >> 32).sum()) << 32) + int((chunk & 0xFFFFFFFF).sum())
+    return total
+
+def statsToString(stats):
+    return "MIN=%d, MAX=%d, AVG=%.3f, LEN=%d, STD=%.3f, %s" % (
+        stats.min,
+        stats.max,
+        stats.mean(),
+        stats.count,
+        stats.variance() ** 0.5,
+        ", ".join("P%d=%d" % (q, value) for q, value in
+                  zip(QUANTILES, stats.quantiles(np.divide(QUANTILES, 100)))))
+
+def printHistogram(bins, freq, filename, plot=False, xformat="%.3f"):
     with open(filename, 'w') as file:
         file.write("x\ty\n")
         for i in range(0,len(freq)):
-            file.write("%.3f\t%.3f\n" % (bins[i], freq[i]))
+            file.write((xformat + "\t%.3f\n") % (bins[i], freq[i]))
+    if plot:
+        plotHistogram(bins, freq, os.path.splitext(filename)[0] + ".png")
+
+def plotHistogram(bins, freq, filename):
+    # matplotlib takes long to import, hence we do it only for plots
+    try:
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+    except ImportError:
+        sys.exit("%s: ERROR: Plots need matplotlib" % os.path.basename(sys.argv[0]))
+
+    fig, ax = plt.subplots()
+    ax.bar(bins[:len(freq)], freq, align='edge',
+           width=bins[1] - bins[0] if len(bins) > 1 else 1)
+    ax.set_ylabel("%")
+    fig.savefig(filename)
+    plt.close(fig)
 
 if __name__ == '__main__':
     main()
@@ -31,7 +31,8 @@ In addition this script needs the following prerequisites for the input:
   1. There must be at least 2 columns for VALID TIME for each table
   2. Each relation must have a TIKZ config line as SQL comment (see below)
   3. A single timeline can be defined with `TIKZ: timeline, from, to, desc`
-     This is optional.
+     This is optional. With `--auto-timeline` it is drawn below all relations
+     from the first to the last time point, if no timeline line is given.
 
 NB: Since version 0.8 it also supports TSV files, instead of PostgreSQL output.
 
@@ -76,6 +77,9 @@ describe which types are supported:
      graphlabel         subfigure's graph label
      xscale             scale of the tikzpicture (on the x-axis)
      yscale             scale of the tikzpicture (on the y-axis)
+     maxtuples          largest number of tuples drawn per relation. Larger
+                        relations get a density row above a sample of their
+                        tuples (see write_tikz_density).
 ```
 
 Example
@@ -120,13 +124,66 @@ so, add `-- TIKZ: TSV` as very first line of your input file. The first non-comm
 line will be interpreted as beginning of a table, that is, the header followed by
 some lines representing tuples. NB: Separate each header or tuple with tabulators.
 
+Smaller and faster inputs are the outputs of `COPY (query) TO STDOUT WITH CSV
+HEADER` (see `--csvout` of p-pgcontrol.sh), or `COPY (query) TO STDOUT (FORMAT
+binary)`. Their TIKZ lines are kept in a sidecar file, i.e., `r.tikz` for
+`r.csv`, and each table follows the next relation line therein. Binary inputs
+have no column names and types, hence add a line like `-- TIKZ: columns, a
+text, ts int4, te int4` after each relation line.
+Unaligned outputs of `psql -A -a -f FILENAME` (`--input-format unaligned`) and
+JSON lines (`.jsonl`) keep their TIKZ lines inline, like the aligned format.
+Parquet files (`.parquet`) need a sidecar file, and the optional pyarrow
+package.
+
 The full piped command is then: `psql -a -d DBNAME -f FILENAME |
 pgsql2latex.py -o OUTPUTFILE -`.
+For huge outputs add `--stream`, such that the input is read line by line, and
+each relation is rendered as soon as its table ends.
+
+To regenerate all figures at once, give many input files, a directory, or a
+glob pattern, and an output template, for example: `pgsql2latex.py -O
+'figures/{name}.tex' --overwrite results/`. The files are rendered in parallel
+on all CPUs (see `--jobs`).
 To use the `OUTPUTFILE` inside a LaTex document, just add a input-command
  `\input{OUTPUTFILE}`.
 
 Changelog
 ---------
+  * 0.10
+      - Streaming mode (`--stream`): Relations are rendered as soon as their
+        table ends, hence memory is bounded by a single relation
+      - Input echo inside the TEX header can be turned off with `--no-echo`
+      - BUGFIX: configs (i.e., xscale/yscale) are also used with `--figure-only`
+      - Faster tokenizer: precompiled patterns, and a fast path for tuple lines
+        with the expected number of column delimiters
+      - Values with `|` inside are sliced at the column positions of the
+        PostgreSQL table, i.e., `----+----+----`
+      - Relations are stored column by column, with start/end points and ypos
+        parsed once into integer arrays
+      - Relations keep running statistics of their y-positions and time bounds
+      - Automatic timeline from the time bounds of all relations, if there is no
+        timeline line (`--auto-timeline`)
+      - Tables and figures are written directly to the output, with tuple
+        templates compiled once per relation
+      - Batch runs over many files, directories or glob patterns in parallel
+        (`--output-template`, `--jobs`), with a summary of failed files
+      - Existing output files can be overwritten or skipped (`--overwrite`,
+        `--skip-existing`)
+      - Render cache: Outputs of unchanged input files and options are copied
+        from the cache directory (`--cache-dir`, `--cache-size`, `--no-cache`)
+      - Watch mode (`--watch`): Renders the input again on each change, and
+        reuses tokens of unchanged blocks and fragments of unchanged relations
+      - Output files are written into a temporary file first, and replace the
+        output file only if rendering succeeds (no more half-made outputs)
+      - Output files ending with .gz or .xz are compressed
+      - Level of detail for huge relations (`-- TIKZ: config, maxtuples, N`):
+        a density row with merged intervals and point buckets, and a sample
+        of N labelled tuples
+      - COPY ... TO STDOUT inputs in CSV or binary format (`--input-format`),
+        with TIKZ lines in a sidecar file (`--sidecar`). Integers of binary
+        inputs are decoded straight into the relations.
+      - More input formats: unaligned psql outputs (`psql -A`), JSON lines,
+        and Parquet files (needs pyarrow, which is imported only then)
   * 0.9thesis
       - xscale/yscale for tikz pictures
       - point representation (cross) if only one scalar value is given as time
@@ -176,8 +233,24 @@ import stat
 import sys
 import argparse
 import io
-
-__version__ = "0.9thesis"
+import struct
+import contextlib
+import gzip
+import lzma
+import time
+import copy
+import hashlib
+import glob
+import concurrent.futures
+import itertools
+import string
+import array
+import collections
+import operator
+import shutil
+import tempfile
+
+__version__ = "0.10"
 
 def main():
     """Main, nothing more to say :-)"""
@@ -192,16 +265,74 @@ def main():
 
     parser.add_argument(
         'FILE',
-        default='-',
-        type=argparse.FileType('r'),
+        nargs='+',
         help='Input files taken from the "psql --echo-all" output\n'
-             'Use a dash, i.e. -, if you want to use STDIN.')
+             'Use a dash, i.e. -, if you want to use STDIN. More than one '
+             'file, directories or glob patterns start a batch run (see '
+             '--output-template).')
 
     parser.add_argument(
         '-o',
         '--output',
         metavar='FILE',
-        help='Put output into FILE; default is STDOUT')
+        help='Put output into FILE; default is STDOUT. FILE is compressed, if it '
+             'ends with .gz or .xz')
+
+    parser.add_argument(
+        '-O',
+        '--output-template',
+        metavar='TEMPLATE',
+        help='Output filename of each input file in a batch run. {dir} is the '
+             'directory, and {name} the filename without extension of the '
+             'input file; default is "{dir}/{name}.tex". Output files and '
+             'sidecar files within input directories are skipped.')
+
+    parser.add_argument(
+        '-j',
+        '--jobs',
+        type=int,
+        default=os.cpu_count(),
+        help='Number of parallel processes in a batch run; default is the '
+             'number of CPUs.')
+
+    existing = parser.add_mutually_exclusive_group()
+
+    existing.add_argument(
+        '--overwrite',
+        action='store_const',
+        dest='existing',
+        const='overwrite',
+        help='Overwrite existing output files.')
+
+    existing.add_argument(
+        '--skip-existing',
+        action='store_const',
+        dest='existing',
+        const='skip',
+        help='Skip input files, whose output file exists already.')
+
+    parser.set_defaults(existing='error')
+
+    parser.add_argument(
+        '--cache-dir',
+        metavar='DIR',
+        default=get_default_cache_dir(),
+        help='Keep rendered output files in DIR, and reuse them if an input '
+             'file and the options did not change; default is "%(default)s".')
+
+    parser.add_argument(
+        '--cache-size',
+        metavar='MB',
+        type=int,
+        default=512,
+        help='Remove least recently used files from the cache directory, if '
+             'it is bigger than MB megabytes; default is %(default)s.')
+
+    parser.add_argument(
+        '--no-cache',
+        action='store_false',
+        dest='cache',
+        help='Do not use the cache directory.')
 
     parser.add_argument(
         '-s',
@@ -247,6 +378,52 @@ def main():
 
     parser.set_defaults(output_type='all')
 
+    parser.add_argument(
+        '--stream',
+        action='store_true',
+        help='Read the input line by line, and render each relation as soon '
+             'as its table ends. Memory is then bounded by a single relation '
+             '(or row with --table-only). Config lines that change the '
+             'layout, i.e., ystep or maxtuples, must precede the relations.')
+
+    parser.add_argument(
+        '--input-format',
+        choices=['auto'] + list(INPUT_FORMATS),
+        default='auto',
+        help='Format of the input files: PostgreSQL or TSV text (psql, which '
+             'checks the first line for -- TIKZ: TSV), aligned, tsv, '
+             'unaligned (psql -A), or JSON lines (jsonl). Data inputs are '
+             'output of COPY ... TO STDOUT in CSV or binary format, or Parquet '
+             'files (needs pyarrow), and their TIKZ lines are read from a '
+             'sidecar file. Default is auto, i.e., binary COPY and Parquet '
+             'inputs are detected by their signature, and CSV, JSON lines and '
+             'Parquet inputs by their file extension.')
+
+    parser.add_argument(
+        '--sidecar',
+        metavar='FILE',
+        help='Read the TIKZ lines of data inputs from FILE; default is the '
+             'input file with a .tikz extension')
+
+    parser.add_argument(
+        '--watch',
+        action='store_true',
+        help='Keep running, and render the input file again into the output '
+             'file whenever it changes. Only changed relations are rendered '
+             'again. Stop it with Ctrl-C.')
+
+    parser.add_argument(
+        '--auto-timeline',
+        action='store_true',
+        help='Draw a timeline below all relations from the first to the last '
+             'time point, if the input has no "TIKZ: timeline" line.')
+
+    parser.add_argument(
+        '--no-echo',
+        action='store_false',
+        dest='echo',
+        help='Do not copy the input as TEX comment into the output header.')
+
     # We must capture this option before we parse the arguments, because the
     # last positional argument FILE is mandatory. Hence, the parser would exit
     # with an error (There is no meaningful exception to catch, except for
@@ -272,150 +449,691 @@ def main():
     # Now parse regular command line arguments
     args = parser.parse_args()
 
+    # Many input files are rendered in parallel, each into its own output file
+    if len(args.FILE) > 1 or args.output_template is not None or is_batch_input(args.FILE[0]):
+        if args.output is not None:
+            parser.error("Use --output-template instead of --output for many input files.")
+        if args.watch:
+            parser.error("Watch mode needs a single input file.")
+        sys.exit(batch_latex(args))
+
     # Stdin file stats to see if it is a pipe or redirection...
     mode = os.fstat(sys.stdin.fileno()).st_mode
 
     # Input files are explicitely given as a filename list
-    #if type(args.FILE) is file:
-    if isinstance(args.FILE, io.IOBase):
-        input_file = args.FILE
-        input_text = input_file.readlines()
+    if args.FILE[0] != '-':
+        try:
+            input_file = open(args.FILE[0], 'r')
+        except OSError as err:
+            parser.error("can't open '%s': %s" % (args.FILE[0], err))
 
     # We have a piped or redirected STDIN at disposal...
     elif stat.S_ISFIFO(mode) or stat.S_ISREG(mode):
-        print ("READING FROM STDIN\n")
-        input_text = sys.stdin.readlines()
+        input_file = sys.stdin
 
     # No stdin, no input files... shutdown!
     else:
         parser.error("No input files, nor stdin given (i.e., a dash).")
 
-    try:
-        parse_result = pgsql_parser(input_text)
-
-        figure = ""
-        table = ""
-        cfg = {}
-
-        if args.output_type in ['all', 'All', 'table-only']:
-            table_type = 1
-            if args.output_type == 'all':
-                table_type = 2
-            if args.output_type == 'All':
-                table_type = 3
-
-            for line in parse_result:
-                if line['type'] == 'relation-table':
-                    if table == "":
-                        table = format_latex_table(line, "", table_type)
-                    else:
-                        table += "    \hspace{2cm}" + format_latex_table(line, "", table_type)
-                if line['type'] == 'config':
-                    cfg[line['key']] = line['value']
-
-        # If we print the whole figure/table combination, we need a "label" and
-        # "caption" below the two sub-figures.
-        if args.output_type in ['all', 'All']:
-            if not 'label' in cfg:
-                raise_error_cfgline(
-                    'label',
-                    "We do not know which 'label' to use for figures.")
-
-            if not 'caption' in cfg:
-                raise_error_cfgline(
-                    'caption',
-                    "We do not know which 'caption' to use for figures.")
-
-        if args.output_type in ['all', 'All', 'figure-only']:
-            figure = format_tikz_figure(parse_result, cfg)
-
-        # TODO Create text first in memory, and write it at last. Otherwise, we
-        # could get half-made output files, when an error occurs
-        outfile = sys.stdout
-        if args.output != None:
-            if os.path.isfile(args.output):
-                raise_error("File '%s' already exists! Exiting..." % args.output)
-            outfile = open(args.output, 'w')
-
-        outfile.write(format_latex_header("".join(input_text)))
-
-        if args.output_type == 'all':
-
-            # Subfigures have a left and right column with a certain width
-            # If it is not configured explicitely, we will take these defaults:
-            subfigure_left = list_get(cfg, 'subfigure-left', 0.27)
-            subfigure_right = list_get(cfg, 'subfigure-right', 0.63)
-
-            out = format_latex_figure_and_table(table,
-                                                figure,
-                                                cfg['caption'],
-                                                cfg['label'],
-                                                subfigure_left,
-                                                subfigure_right)
-        elif args.output_type == 'All':
-            out = format_latex_figure_and_table_top(table, figure,
-                                                    cfg['caption'],
-                                                    cfg['label'],
-                                                    cfg['tablecaption'],
-                                                    cfg['tablelabel'],
-                                                    cfg['graphcaption'],
-                                                    cfg['graphlabel'])
-        elif args.output_type == 'table-only':
-            out = table
-        elif args.output_type == 'figure-only':
-            out = figure
-        else:
-            raise_error("Unknown output type specified")
-
-        if args.output_standalone:
-            out = format_latex_standalone(out)
+    if args.watch:
+        if args.FILE[0] == '-':
+            parser.error("Watch mode needs an input file, not STDIN.")
+        input_file.close()
+        try:
+            watch_latex(args.FILE[0], args.output, args)
+        except ValueError as valerr:
+            print ("\n".join(valerr.args) + "\n")
+            sys.exit(3)
+        sys.exit(0)
 
-        outfile.write(out)
+    if args.existing == 'skip' and args.output is not None and os.path.isfile(args.output):
+        print ("File '%s' already exists! Skipping..." % args.output)
+        sys.exit(0)
 
+    try:
+        if args.cache and input_file is not sys.stdin:
+            input_file.close()
+            render_latex_cached(args.FILE[0], args.output, args)
+        else:
+            render_latex(input_file, args.output, args)
     except ValueError as valerr:
         print ("\n".join(valerr.args) + "\n")
         sys.exit(3)
 
-def format_tikz_desc(pos, desc):
-    """Prints the description of each found table on the left-hand-side of the
-    tuple time lines in a standalone tikz figure"""
-    return TEMPLATE_TIKZ_DESC.format(pos=pos,
-                                     desc=desc)
+def render_latex(input_file, output, args):
+    """Render an input file to the output filename, or STDOUT if it is None,
+    as configured with the command line arguments. Errors are raised as
+    ValueError (see raise_error)."""
+
+    input_format = get_input_format(input_file, args.input_format)
+
+    if args.stream:
+        with open_output(output, args.existing) as outfile:
+            stream_latex(input_file, outfile, args, input_format)
+        return
+
+    kind, reader = INPUT_FORMATS[input_format]
+    if kind == 'text':
+        input_text = input_file.readlines()
+        tokens = reader(input_text)
+    else:
+        input_text, tokens = sidecar_input(input_file, reader, args)
+
+    # Times of tuples are only parsed if we draw them
+    with_figure = args.output_type in ['all', 'All', 'figure-only']
+    parse_result = pgsql_parser(tokens, with_figure)
+
+    cfg = {}
 
+    for line in parse_result:
+        if line['type'] == 'config':
+            cfg[line['key']] = line['value']
+
+    # If we print the whole figure/table combination, we need a "label" and
+    # "caption" below the two sub-figures.
+    check_latex_figure_cfg(cfg, args.output_type)
+
+    # Tables and figures are written directly to the output file
+    def table(out):
+        first = True
+        for line in parse_result:
+            if line['type'] == 'relation-table':
+                if not first:
+                    out.write(TABLE_SEPARATOR)
+                write_latex_table(out, line, "", get_table_type(args.output_type))
+                first = False
+
+    def figure(out):
+        write_tikz_figure(out, parse_result, cfg, args.auto_timeline)
+
+    with open_output(output, args.existing) as outfile:
+        if args.echo:
+            outfile.write(format_latex_header("".join(input_text)))
+        else:
+            outfile.write(format_latex_header(None))
+
+        write_latex_output(outfile, args, cfg, table, figure)
+
+def render_latex_cached(input_name, output, args):
+    """Like render_latex, but for a named input file. Each rendered output is
+    kept in the cache directory under a hash of the input file, the options,
+    and the version of this script. Hence, unchanged inputs are just copied
+    from there."""
 
-def format_tikz_tupleline(tup, relation, tupid, ypos):
-    """Prints the tuple time lines in a standalone tikz figure"""
+    if output is not None and os.path.isfile(output) and args.existing != 'overwrite':
+        raise_error("File '%s' already exists! Exiting..." % output)
 
-    template = TEMPLATE_TIKZ_TUPLE
+    entry = os.path.join(args.cache_dir, get_cache_key(input_name, args) + ".tex")
 
-    valid_time_ts = relation.getTupleTS(tup)
-    valid_time_te = relation.getTupleTE(tup)
+    # Open the cache entry before we use it, such that other processes cannot
+    # remove it under our feet. New entries are written atomically (see
+    # open_output), hence other processes never see half-made entries.
+    try:
+        cached = open(entry, 'r')
+        os.utime(entry)
+    except FileNotFoundError:
+        os.makedirs(args.cache_dir, exist_ok=True)
+        render_args = copy.copy(args)
+        render_args.existing = 'overwrite'
+        with open(input_name, 'r') as input_file:
+            render_latex(input_file, entry, render_args)
+        cached = open(entry, 'r')
+
+    with cached, open_output(output, args.existing) as outfile:
+        shutil.copyfileobj(cached, outfile, CACHE_COPY_BUFSIZE)
+
+    evict_cache(args.cache_dir, args.cache_size * 1024 * 1024)
+
+def get_default_cache_dir():
+    """Cache directory inside the user's cache home (see XDG base directories)"""
+    home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(home, "pwscripts", "psql2latex")
+
+def get_cache_key(input_name, args):
+    """Hash of the input file's content, all options that change the output,
+    and the version of this script. The input format is the detected one, such
+    that auto and its result share the same entries."""
+    digest = hashlib.sha256()
+    options = [__version__]
+    for option in CACHE_OPTIONS:
+        if option == 'input_format':
+            with open(input_name, 'r') as input_file:
+                options.append(get_input_format(input_file, args.input_format))
+        else:
+            options.append(getattr(args, option))
+    digest.update(repr(options).encode())
+    with open(input_name, 'rb') as input_file:
+        for chunk in iter(lambda: input_file.read(CACHE_COPY_BUFSIZE), b''):
+            digest.update(chunk)
+
+    # COPY inputs get their TIKZ lines from a sidecar file
+    sidecar_name = get_sidecar_name(input_name, args)
+    if os.path.isfile(sidecar_name):
+        with open(sidecar_name, 'rb') as sidecar:
+            digest.update(b"\x00" + sidecar.read())
+    return digest.hexdigest()
+
+def evict_cache(cache_dir, max_size):
+    """Remove least recently used cache entries, until the cache directory is
+    not bigger than max_size bytes. Files might be removed by other processes
+    at the same time, so we ignore missing files."""
+    entries = []
+    size = 0
+    for entry in os.scandir(cache_dir):
+        if not entry.name.endswith(".tex"):
+            continue
+        try:
+            st = entry.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((st.st_mtime, st.st_size, entry.path))
+        size += st.st_size
 
-    # Single point detected: Generate point representation
-    if valid_time_te == -1:
-        valid_time_te = valid_time_ts + 1
-        template = TEMPLATE_TIKZ_POINT
+    for _, entry_size, path in sorted(entries):
+        if size <= max_size:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        size -= entry_size
+
+def batch_latex(args):
+    """Render many input files in parallel, each into the output file given by
+    the output template. Errors do not stop the batch run, but are printed in
+    a summary at the end. Returns the exit code."""
+
+    template = args.output_template
+    if template is None:
+        template = os.path.join("{dir}", "{name}.tex")
+
+    inputs = []
+    for input_name in expand_inputs(args.FILE):
+        output_name = template.format(
+            dir=os.path.dirname(input_name) or ".",
+            name=os.path.splitext(os.path.basename(input_name))[0])
+        inputs.append((input_name, output_name))
+
+    # Output files of earlier runs, and sidecar files of data inputs, are in
+    # the same directory as the inputs by default, but they are no inputs.
+    generated = set()
+    for input_name, output_name in inputs:
+        generated.add(os.path.abspath(output_name))
+        generated.add(os.path.abspath(get_sidecar_name(input_name, args)))
+
+    tasks = []
+    skipped = []
+    for input_name, output_name in inputs:
+        if os.path.abspath(input_name) in generated:
+            continue
+        if args.existing == 'skip' and os.path.isfile(output_name):
+            skipped.append(input_name)
+        else:
+            tasks.append((input_name, output_name))
+
+    errors = []
+    if args.jobs is not None and args.jobs > 1 and len(tasks) > 1:
+        with concurrent.futures.ProcessPoolExecutor(args.jobs) as executor:
+            futures = [executor.submit(batch_render_file, i, o, args) for i, o in tasks]
+            for (input_name, _), future in zip(tasks, futures):
+                error = future.result()
+                if error is not None:
+                    errors.append((input_name, error))
+    else:
+        for input_name, output_name in tasks:
+            error = batch_render_file(input_name, output_name, args)
+            if error is not None:
+                errors.append((input_name, error))
+
+    print ("%s: %d rendered, %d skipped, %d failed" % (
+        os.path.basename(__file__),
+        len(tasks) - len(errors),
+        len(skipped),
+        len(errors)))
+
+    for input_name, error in errors:
+        print ("\nFAILED: %s\n%s" % (input_name, error))
+
+    if len(errors) > 0:
+        return 3
+    return 0
+
+def batch_render_file(input_name, output_name, args):
+    """Render a single file of a batch run. This runs inside a worker process,
+    hence we return the error message instead of raising it, or None."""
+    try:
+        output_dir = os.path.dirname(output_name)
+        if output_dir != "":
+            os.makedirs(output_dir, exist_ok=True)
+        if args.cache:
+            render_latex_cached(input_name, output_name, args)
+        else:
+            with open(input_name, 'r') as input_file:
+                render_latex(input_file, output_name, args)
+    except ValueError as valerr:
+        return "\n".join(valerr.args).rstrip()
+    except Exception as err:
+        return "%s: %s" % (type(err).__name__, err)
+    return None
+
+def is_batch_input(name):
+    """Is the input argument a directory or a glob pattern (see expand_inputs)?"""
+    return os.path.isdir(name) or (not os.path.exists(name) and any(c in name for c in '*?['))
+
+def expand_inputs(names):
+    """Input filenames of a batch run: Directories are replaced by all files
+    therein, and glob patterns by all matching files, both sorted by name."""
+    for name in names:
+        if os.path.isdir(name):
+            for entry in sorted(os.listdir(name)):
+                path = os.path.join(name, entry)
+                if os.path.isfile(path):
+                    yield path
+        elif is_batch_input(name):
+            for path in sorted(glob.glob(name)):
+                if os.path.isfile(path):
+                    yield path
+        else:
+            yield name
+
+@contextlib.contextmanager
+def open_output(filename, existing='error'):
+    """Open the output file for writing, or use STDOUT if no filename is given.
+    Existing files are only overwritten, if existing is 'overwrite'. We write
+    into a temporary file with a large buffer next to the output file, and
+    replace the output file with it at the end of the with block. If an error
+    occurs, the temporary file is removed, hence there are never half-made
+    output files. Files ending with .gz or .xz are compressed."""
+    if filename is None:
+        yield sys.stdout
+        return
+
+    if os.path.isfile(filename) and existing != 'overwrite':
+        raise_error("File '%s' already exists! Exiting..." % filename)
+
+    fd, tmpname = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(filename)),
+                                   prefix="." + os.path.basename(filename),
+                                   suffix=".tmp")
+    raw = os.fdopen(fd, 'wb', buffering=0)
+    outfile = None
+    try:
+        # Temporary files are only readable by us, but output files should
+        # get the usual permissions.
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(tmpname, 0o666 & ~umask)
+
+        stream = raw
+        if filename.endswith('.gz'):
+            stream = gzip.GzipFile(os.path.basename(filename)[:-3], 'wb', fileobj=raw)
+        elif filename.endswith('.xz'):
+            stream = lzma.LZMAFile(raw, 'wb')
+        outfile = io.TextIOWrapper(io.BufferedWriter(stream, OUTPUT_BUFSIZE))
+
+        yield outfile
+
+        # Compressed streams write their trailer on close, but do not close
+        # the raw file, which plain outputs do.
+        outfile.flush()
+        if stream is not raw:
+            stream.close()
+        os.fsync(raw.fileno())
+        outfile.close()
+        raw.close()
+        os.replace(tmpname, filename)
+    except:
+        try:
+            if outfile is not None:
+                outfile.close()
+        except (OSError, ValueError):
+            pass
+        raw.close()
+        if os.path.exists(tmpname):
+            os.remove(tmpname)
+        raise
+
+def get_table_type(output_type):
+    """Table template number for an output type (see write_latex_table)"""
+    if output_type == 'all':
+        return 2
+    if output_type == 'All':
+        return 3
+    return 1
+
+def check_latex_figure_cfg(cfg, output_type):
+    """The whole figure/table combination needs a "label" and "caption"."""
+    if output_type in ['all', 'All']:
+        if not 'label' in cfg:
+            raise_error_cfgline(
+                'label',
+                "We do not know which 'label' to use for figures.")
+
+        if not 'caption' in cfg:
+            raise_error_cfgline(
+                'caption',
+                "We do not know which 'caption' to use for figures.")
+
+def write_latex_output(outfile, args, cfg, table, figure):
+    """Write the table and figure as configured with the output type. Both
+    can be given as strings, or as functions or files (see write_template)."""
+
+    if args.output_type == 'all':
+
+        # Subfigures have a left and right column with a certain width
+        # If it is not configured explicitely, we will take these defaults:
+        subfigure_left = list_get(cfg, 'subfigure-left', 0.27)
+        subfigure_right = list_get(cfg, 'subfigure-right', 0.63)
+
+        template = TEMPLATE_LATEX_TIKZTABLE
+        kwargs = {'caption': cfg['caption'],
+                  'label': cfg['label'],
+                  'subfigureleft': subfigure_left,
+                  'subfigureright': subfigure_right}
+    elif args.output_type == 'All':
+        template = TEMPLATE_LATEX_TIKZTABLETOP
+        kwargs = {'caption': cfg['caption'],
+                  'label': cfg['label'],
+                  'tablecaption': cfg['tablecaption'],
+                  'tablelabel': cfg['tablelabel'],
+                  'graphcaption': cfg['graphcaption'],
+                  'graphlabel': cfg['graphlabel']}
+    elif args.output_type == 'table-only':
+        template = "{table}"
+        kwargs = {}
+    elif args.output_type == 'figure-only':
+        template = "{tikzpicture}"
+        kwargs = {}
+    else:
+        raise_error("Unknown output type specified")
 
-    # Concatenate all non-temporal (non-meta) attributes as description above the line
-    attribs = ""
-    for key, value in enumerate(relation.getTupleB(tup)):
-        attribs += r"%s," % value
+    def content(out):
+        write_template(out, template,
+                       {'table': table, 'tikzpicture': figure},
+                       **kwargs)
 
-    if len(attribs) == 0:
-        out = template + "{{${name}_{{{id}}}$}};\n"
+    if args.output_standalone:
+        write_template(outfile, TEMPLATE_TIKZ_DOC, {'content': content})
     else:
-        if relation.name == "":
-            out = template + "{{({attribs})}};\n"
+        content(outfile)
+
+def stream_latex(input_file, outfile, args, input_format='psql'):
+    """Parse the input file line by line, and render each relation as soon as
+    its table ends. Tables and figures are written to temporary files, and
+    assembled at the end, because configs like 'caption' or 'xscale' are
+    usually given after all relations. The input is echoed to outfile while
+    we read it. Data inputs echo their sidecar file instead."""
+
+    with tempfile.TemporaryFile('w+') as table, \
+         tempfile.TemporaryFile('w+') as figure:
+
+        kind, reader = INPUT_FORMATS[input_format]
+        if kind == 'text':
+            lines = input_file
+        else:
+            lines, tokens = sidecar_input(input_file, reader, args)
+
+        if args.echo:
+            header_head, _, header_tail = split_template(TEMPLATE_HEADER,
+                                                         ['input'],
+                                                         appname=os.path.basename(__file__),
+                                                         appversion=__version__)
+            outfile.write(header_head)
+            lines = echo_lines(lines, outfile)
+        else:
+            outfile.write(format_latex_header(None))
+
+        if kind == 'text':
+            tokens = reader(lines)
+        else:
+            collections.deque(lines, 0)     # Echo the whole sidecar file
+
+        # We keep tuples inside relations only if we need to draw them
+        with_figure = args.output_type in ['all', 'All', 'figure-only']
+        events = pgsql_events(tokens, keep_tuples=with_figure)
+        cfg = render_events(events, table, figure, args)
+
+        if args.echo:
+            outfile.write(header_tail)
+
+        finish_latex(outfile, args, cfg, table, figure)
+
+def render_events(events, table, figure, args, fragments=None):
+    """Render parser events (see pgsql_events) into the table and figure
+    files, and return all configs. Table rows are written as soon as we see
+    them. If a dictionary of fragments is given, we render whole relations
+    at their end instead, and reuse the fragments of unchanged relations
+    from an earlier call. Afterwards, fragments contains only the ones used
+    by this call."""
+
+    cfg = {}
+    offset = 0
+    bounds = None       # Time bounds of all relations for the auto timeline
+    auto_timeline = args.auto_timeline
+    current = None      # Relation of the table, which is currently written
+    used = {}           # Fragments used in this call
+    table_type = get_table_type(args.output_type)
+    with_table = args.output_type in ['all', 'All', 'table-only']
+    with_figure = args.output_type in ['all', 'All', 'figure-only']
+
+    for event, line in events:
+        if event == 'config':
+            cfg[line['key']] = line['value']
+
+        elif event == 'timeline' and with_figure:
+            figure.write(format_tikz_timeline(line, offset))
+            offset -= 2
+            auto_timeline = False
+
+        elif event == 'header' and with_table and line['type'] == 'relation-table':
+            if table.tell() > 0:
+                table.write(TABLE_SEPARATOR)
+            if fragments is not None:
+                continue
+            template, kwargs = latex_table_template(line, "", table_type)
+            table_head, _, table_tail = split_template(template, ['rows'], **kwargs)
+            table.write(table_head)
+            current = line['relation']
+            row_template = compile_latex_table_row(current)
+            row_count = 0
+
+        # Rows are written one by one, since the first row does not start
+        # with a line break, and the last row does not end with one.
+        elif event == 'tuple' and with_table and current is not None:
+            if row_count > 0:
+                table.write("\n")
+            row_count += 1
+            table.write(row_template % (row_count,
+                                        " & ".join(current.getTupleTB(line))))
+
+        elif event == 'end':
+            relation = line['relation']
+            ystep = float(list_get(cfg, 'ystep', 1))
+            maxtuples = get_maxtuples(cfg)
+            digest = None
+            if fragments is not None:
+                digest = relation.getDigest()
+
+            if with_table and line['type'] == 'relation-table':
+                if digest is None:
+                    table.write(table_tail)
+                    current = None
+                else:
+                    key = ('table', digest, table_type)
+                    if key not in fragments:
+                        out = io.StringIO()
+                        write_latex_table(out, line, "", table_type)
+                        fragments[key] = out.getvalue()
+                    used[key] = fragments[key]
+                    table.write(used[key])
+
+            if with_figure:
+                if digest is None:
+                    offset = write_tikz_relation(figure, relation, offset, ystep, maxtuples)
+                else:
+                    key = ('figure', digest, offset, ystep, maxtuples)
+                    if key not in fragments:
+                        out = io.StringIO()
+                        fragments[key] = (out, write_tikz_relation(out, relation, offset,
+                                                                   ystep, maxtuples))
+                    used[key] = fragments[key]
+                    figure.write(used[key][0].getvalue())
+                    offset = used[key][1]
+                bounds = merge_time_bounds(bounds, relation.getTimeBounds())
+
+    if with_figure and auto_timeline and bounds is not None:
+        figure.write(format_tikz_timeline(get_auto_timeline(bounds), offset))
+
+    if fragments is not None:
+        fragments.clear()
+        fragments.update(used)
+
+    return cfg
+
+def finish_latex(outfile, args, cfg, table, figure):
+    """Write the rendered table and figure files (see render_events) into
+    their final LaTex frame."""
+
+    check_latex_figure_cfg(cfg, args.output_type)
+
+    def tikzpicture(out):
+        write_template(out, TEMPLATE_TIKZ_PICTURE, {'content': figure},
+                       xscale=float(list_get(cfg, 'xscale', 0.65)),
+                       yscale=float(list_get(cfg, 'yscale', 0.4)))
+
+    write_latex_output(outfile, args, cfg, table, tikzpicture)
+
+def watch_latex(input_name, output, args):
+    """Render the input file again, whenever it changes, until we get
+    interrupted. We poll the modification time and size of the file, since
+    there is no portable file notification in the standard library. Tokens of
+    unchanged blocks (i.e., lines up to an empty line) and the rendered
+    fragments of unchanged relations are reused, and the output file is
+    replaced atomically."""
+
+    if output is None:
+        raise_error("Watch mode needs an output file.", "Use -o FILE")
+    if os.path.isfile(output) and args.existing != 'overwrite':
+        raise_error("File '%s' already exists! Exiting..." % output)
+
+    blocks = {}
+    fragments = {}
+    last = None
+    try:
+        while True:
+            try:
+                st = os.stat(input_name)
+                current = (st.st_mtime_ns, st.st_size)
+            except FileNotFoundError:
+                current = None      # Editors might replace the file
+
+            if current is not None and current != last:
+                last = current
+                start = time.time()
+                try:
+                    changed = watch_render(input_name, output, args, blocks, fragments)
+                    print ("%s: '%s' rendered in %.3f s (%d of %d blocks changed)" % (
+                        time.strftime("%H:%M:%S"), output, time.time() - start,
+                        changed, len(blocks)), flush=True)
+                except ValueError as valerr:
+                    print ("\n".join(valerr.args) + "\n", flush=True)
+
+            time.sleep(WATCH_INTERVAL)
+    except KeyboardInterrupt:
+        pass
+
+def watch_render(input_name, output, args, blocks, fragments):
+    """Render the input file once for watch_latex. blocks maps the text of
+    each block to its tokens, and fragments holds rendered relations (see
+    render_events). Both are updated with this call. Returns the number of
+    blocks, which we had to tokenize."""
+
+    with open(input_name, 'r') as input_file:
+        if get_input_format(input_file, args.input_format) != 'psql':
+            raise_error("Watch mode supports PostgreSQL and TSV text inputs only "
+                        "(i.e., --input-format psql).")
+        lines = input_file.readlines()
+
+    # Each block can be tokenized on its own, since empty lines reset the
+    # tokenizer. Only the first line tells us the input type.
+    input_type = INPUT_TYPE_POSTGRES
+    start = 0
+    if len(lines) > 0 and RE_TSV.search(lines[0].lstrip()):
+        input_type = INPUT_TYPE_TSV
+        start = 1
+
+    texts = []
+    block = []
+    for line in lines[start:]:
+        block.append(line)
+        if line.strip() == "":
+            texts.append("".join(block))
+            block = []
+    if len(block) > 0:
+        texts.append("".join(block))
+
+    changed = 0
+    tokens = {}
+    for text in texts:
+        if text in tokens:
+            continue
+        if (input_type, text) in blocks:
+            tokens[text] = blocks[(input_type, text)]
+        else:
+            tokens[text] = list(pgsql_tokenizer(text.splitlines(True), input_type))
+            changed += 1
+
+    blocks.clear()
+    for text, block_tokens in tokens.items():
+        blocks[(input_type, text)] = block_tokens
+
+    def all_tokens():
+        for text in texts:
+            yield from tokens[text]
+
+    table = io.StringIO()
+    figure = io.StringIO()
+    with_figure = args.output_type in ['all', 'All', 'figure-only']
+    events = pgsql_events(all_tokens(), parse_times=with_figure)
+    cfg = render_events(events, table, figure, args, fragments)
+
+    with open_output(output, 'overwrite') as outfile:
+        if args.echo:
+            outfile.write(format_latex_header("".join(lines)))
         else:
-            out = template + "{{${name}_{{{id}}}$=({attribs})}};\n"
+            outfile.write(format_latex_header(None))
+        finish_latex(outfile, args, cfg, table, figure)
+
+    return changed
+
+def echo_lines(lines, outfile):
+    """Pass all lines through, and write them as TEX comments to outfile. Like
+    format_latex_header, we skip leading and trailing empty lines."""
+    last = None     # Last non-empty line, which is not written yet
+    empty = []      # Empty lines after the last non-empty line
+    for line in lines:
+        yield line
+        if line.strip() == "":
+            empty.append(line.rstrip("\n"))
+            continue
+        if last is None:
+            line = line.lstrip()
+        else:
+            outfile.write("%% %s\n" % last)
+            for e in empty:
+                outfile.write("%% %s\n" % e)
+        last = line.rstrip("\n")
+        empty = []
+    if last is not None:
+        outfile.write("%% %s\n" % last.rstrip())
+    else:
+        outfile.write("%% \n")
+
+def format_tikz_desc(pos, desc):
+    """Prints the description of each found table on the left-hand-side of the
+    tuple time lines in a standalone tikz figure"""
+    return TEMPLATE_TIKZ_DESC.format(pos=pos,
+                                     desc=desc)
 
-    return out.format(name=relation.name,
-                      id=tupid,
-                      ts=valid_time_ts,
-                      te=valid_time_te,
-                      posx=float(valid_time_ts+valid_time_te) / 2,
-                      posy=ypos,
-                      attribs=attribs.rstrip(','))
 
 def format_tikz_timeline(cfg, pos):
     """Prints a timeline in a standalone tikz figure"""
@@ -455,30 +1173,53 @@ def raise_error_cfgline(key, msg):
         "For example:\n"
         "-- TIKZ: config, " + key + ", value")
 
-def pgsql_tokenizer(lines):
+def pgsql_tokenizer(lines, input_type=None):
     """We parse the input lines with a simple state machine, and generate a
     token (i.e., 2-element list, with key and value) that we give back at each
-    iteration"""
+    iteration. The lines can be any iterable, also an open file, which is then
+    read line by line. If no input type is given, the first line tells us if
+    we have PostgreSQL or TSV input.
+
+    The number of columns is known from the header, hence tuple lines with
+    exactly that many column delimiters take a fast path, which just splits
+    and strips them. PostgreSQL tables are aligned, thus lines with more
+    delimiters (i.e., inside values) are sliced at the column positions of
+    the horizontal line below the header, i.e., ----+----+-----."""
 
-    input_type = INPUT_TYPE_POSTGRES
     value_sep = '|'
+    delimiters = -1     # Column delimiters of each tuple of the current table
+    splitter = None     # Column splitter of the current PostgreSQL table
+    strip = str.strip
 
     state = STATE_FIRSTLINE
-    for line in lines:
+    if input_type is None:
+        input_type = INPUT_TYPE_POSTGRES
+    else:
+        state = STATE_OUTSIDE
+        if input_type == INPUT_TYPE_TSV:
+            value_sep = '\t'
+    for raw in lines:
+
+        # Fast path: Neither empty lines, nor tuple counts or comments have
+        # the same number of column delimiters as a tuple line
+        if state == STATE_TUPLES and raw.count(value_sep) == delimiters:
+            yield ['TUPLE', list(map(strip, raw.split(value_sep)))]
+            continue
 
-        line = line.lstrip()
+        line = raw.lstrip()
 
         if state == STATE_FIRSTLINE:
             state = STATE_OUTSIDE
-            match = re.search(r'--\s*TIKZ: TSV', line)
-            if match:
+            if RE_TSV.search(line):
                 input_type = INPUT_TYPE_TSV
                 value_sep = '\t'
                 continue
 
         # Skip empty lines
         # This ends a table parsing, and returns to the STATE_OUTSIDE state
-        if line.rstrip() == "":
+        if line == "" or line.isspace():
+            if state in [STATE_HEADER, STATE_TUPLES]:
+                yield ['TABLEEND', '']
             state = STATE_OUTSIDE
             continue
 
@@ -493,6 +1234,7 @@ def pgsql_tokenizer(lines):
             # horizontal line which starts tuple lines, i.e., ----+----+-----
             if state == STATE_HEADER:
                 state = STATE_TUPLES
+                splitter = get_column_splitter(raw)
             continue
 
         # Not skipped and currently in STATE_OUTSIDE state, hence it could be a
@@ -503,16 +1245,17 @@ def pgsql_tokenizer(lines):
             # PostgreSQL output: Search for table headers first, if not found, skip it...
             # TSV output: First line (not a comment), must be a table header...
             if input_type == INPUT_TYPE_POSTGRES:
-                if None == re.search(r'\s*[^\|]+?\s*\|\s*[^\|]+?', line):
+                if '|' not in line or not RE_HEADER.search(line):
                     yield ['COMMAND', line.rstrip()]
                     continue
 
             state = STATE_HEADER
-            headers = []
-            for head in line.split(value_sep):
-                headers.append(head.strip())
-
+            headers = list(map(strip, line.split(value_sep)))
             yield ['HEADER', headers]
+
+            # Single columns have no delimiters, hence no fast path
+            delimiters = len(headers) - 1 if len(headers) > 1 else -1
+            splitter = None
             if input_type == INPUT_TYPE_TSV:
                 state = STATE_TUPLES
                 continue
@@ -522,28 +1265,82 @@ def pgsql_tokenizer(lines):
         if state == STATE_TUPLES:
 
             # PostgreSQL: We skip tuple count rows at the end of each table. This ends a table block.
-            match = re.search(r'\((\d+?)\s\w*\)', line)
-            if match:
-                state = STATE_OUTSIDE
-                yield ['TUPLECOUNT', match.group(1)]
-                continue
+            if line.startswith('('):
+                match = RE_TUPLECOUNT.match(line)
+                if match:
+                    state = STATE_OUTSIDE
+                    yield ['TUPLECOUNT', match.group(1)]
+                    continue
 
-            values = []
-            for value in line.split(value_sep):
-                values.append(value.strip())
+            if splitter is not None:
+                values = splitter(raw)
+                if values is not None:
+                    yield ['TUPLE', values]
+                    continue
 
-            yield ['TUPLE', values]
+            yield ['TUPLE', list(map(strip, line.split(value_sep)))]
+
+    if state in [STATE_HEADER, STATE_TUPLES]:
+        yield ['TABLEEND', '']
+
+def get_column_splitter(ruler):
+    """Column positions of an aligned PostgreSQL table are taken from the
+    horizontal line below the header, i.e., ----+----+-----. Returns a
+    function, which slices a tuple line at these positions, and gives back
+    the stripped values, or None if the line does not fit. There is no
+    splitter for single columns, or lines that do not look like a ruler."""
+    ruler = ruler.rstrip()
+    if ruler.strip("-+") != "" or '+' not in ruler:
+        return None
+
+    positions = [i for i, c in enumerate(ruler) if c == '+']
+    starts = [0] + [pos + 1 for pos in positions]
+    stops = positions + [None]
+
+    get_values = operator.itemgetter(*[slice(a, b) for a, b in zip(starts, stops)])
+    get_delimiters = operator.itemgetter(*positions)
+    delimiters = get_delimiters('|' * len(ruler))
+    minlen = positions[-1] + 1
+    strip = str.strip
+
+    def splitter(raw):
+        if len(raw) > minlen and get_delimiters(raw) == delimiters:
+            return list(map(strip, get_values(raw)))
+        return None
+
+    return splitter
 
-def pgsql_parser(text):
-    """We parse the input lines with a simple state machine"""
+def pgsql_parser(tokens, parse_times=True):
+    """We parse the input tokens (see pgsql_tokenizer or INPUT_FORMATS), and
+    return all config lines, i.e., relations, timelines and configs, in input
+    order. Times are parsed only if parse_times is set (see pgsql_events)."""
 
     configs = []
-    tables = []
-    table_count = 0     # How many table with header and tuples have been found in the input?
+    for event, line in pgsql_events(tokens, parse_times=parse_times):
+        if event in ['config', 'timeline', 'relation']:
+            configs.append(line)
+
+    return configs
+
+def pgsql_events(tokens, keep_tuples=True, parse_times=True):
+    """Turn the tokens of the input lines (see pgsql_tokenizer) into parser
+    events, i.e., 2-element
+    tuples with an event type and a config line or tuple:
+      - 'config' and 'timeline' for TIKZ config and timeline lines,
+      - 'relation' for a TIKZ relation line, which waits for its table,
+      - 'header' and 'end', when the table of a relation starts or ends,
+      - 'tuple' for the values of a single tuple of the current relation.
+    Tuples are only stored inside the relation if keep_tuples is set. Hence,
+    a consumer can render each relation as soon as it ends, and does not need
+    to hold the whole input in memory. Times of stored tuples are only parsed
+    if parse_times is set, i.e., if we draw the relations."""
+
+    pending = collections.deque()   # Relation config lines without table yet
+    current = None                  # Relation config line of the open table
     configs_count_relation = 0
     configs_count_timeline = 0
 
-    for token in pgsql_tokenizer(text):
+    for token in tokens:
 
         # First, search for a TIKZ comment line, which looks as follows:
         # -TIKZ: name, config-list-comma-separated
@@ -552,33 +1349,29 @@ def pgsql_parser(text):
         # a description or a caption, which can contain commas which will
         # be kept.
         if token[0] == 'COMMENT':
-            match = re.search(r'TIKZ:\s*([a-z\-]+?)\s*,\s*(.*)+?', token[1])
+            match = RE_TIKZ_COMMENT.search(token[1])
             if match:
                 comment_type = match.group(1)
                 comment_body = match.group(2)
 
                 if comment_type == 'config':
-                    listitems = [comment_type] + re.split(r'\s*,\s*', comment_body, 1)
-                    configs.append(dict(zip(['type', 'key', 'value'], listitems)))
+                    listitems = [comment_type] + RE_LIST_SEP.split(comment_body, 1)
+                    yield ('config', dict(zip(['type', 'key', 'value'], listitems)))
 
                 elif comment_type in ['relation', 'relation-table']:
-                    listitems = [comment_type] + re.split(r'\s*,\s*', comment_body, 4)
+                    listitems = [comment_type] + RE_LIST_SEP.split(comment_body, 4)
                     if len(listitems) != 6:
                         raise_error("Not enough parameters for TIKZ relation or TIKZ relation-table given.\n" +
                                     "For example:\n--TIKZ: relation, R, ts, te, ypos, Description string\n" +
                                     "Instead the following was given: --" + token[1])
 
-                    if configs_count_relation < table_count:
-                        relation = tables[table_count]
-                    else:
-                        relation = Relation()
-                        tables.append(relation)
-
-                    configs_count_relation += 1
-
+                    relation = Relation(parse_times)
                     relation.setMetaData(listitems[1:])
+                    configs_count_relation += 1
 
-                    configs.append({'type' : listitems[0], 'relation' : relation})
+                    line = {'type' : listitems[0], 'relation' : relation}
+                    pending.append(line)
+                    yield ('relation', line)
 
                 elif comment_type == 'timeline':
                     if configs_count_timeline == 1:
@@ -589,7 +1382,7 @@ def pgsql_parser(text):
                             "-- TIKZ: timeline, from, to, step, time line " +
                             "description")
                     else:
-                        listitems = [comment_type] + re.split(r'\s*,\s*', comment_body, 3)
+                        listitems = [comment_type] + RE_LIST_SEP.split(comment_body, 3)
                         if len(listitems) != 5:
                             raise_error(
                                 "Wrong TIKZ timeline string found: '%s'" % token[1],
@@ -598,109 +1391,671 @@ def pgsql_parser(text):
                                 "-- TIKZ: timeline, from, to, step, time line " +
                                 "description")
                         configs_count_timeline += 1
-                        configs.append(dict(zip(['type', 'from', 'to', 'step', 'desc'], listitems)))
-        elif token[0] == 'HEADER':
-            if configs_count_relation > table_count:
-                relation = tables[table_count]
-            else:
-                relation = Relation()
-                tables.append(relation)
+                        yield ('timeline', dict(zip(['type', 'from', 'to', 'step', 'desc'], listitems)))
 
-            table_count += 1
+        # Tables are bound to relation config lines in input order
+        elif token[0] == 'HEADER':
+            if len(pending) == 0:
+                raise_error_missing_relation()
 
-            relation.setSchema(token[1])
+            current = pending.popleft()
+            current['relation'].setSchema(token[1])
+            yield ('header', current)
 
         elif token[0] == 'TUPLE':
-            relation = tables[table_count - 1]
-            relation.addTuple(token[1])
+            relation = current['relation']
+            if keep_tuples:
+                relation.addTuple(token[1])
+            else:
+                relation.checkTuple(token[1])
+            yield ('tuple', token[1])
+
+        # Decoded values of binary inputs, see copy_table_tokens
+        elif token[0] == 'VALUES':
+            relation = current['relation']
+            if keep_tuples:
+                relation.addValues(token[1])
+            else:
+                relation.checkTuple(token[1])
+            yield ('tuple', token[1])
+
+        elif token[0] in ['TUPLECOUNT', 'TABLEEND']:
+            if current is not None:
+                yield ('end', current)
+                current = None
 
     if configs_count_relation == 0:
         raise_error(
             "No tables found! Is this a valid input file?")
 
-    # The amount of relation config strings and table outputs must match!
-    if configs_count_relation < len(tables):
-        raise_error(
-            "We do not have enough TIKZ relation config strings",
-            "Define a configuration string for each table.\n" +
-            "For example:\n" +
-            "-- TIKZ: relation, table_name, ts, te, relation description")
+    # Relations without table output are printed with their description only
+    while len(pending) > 0:
+        line = pending.popleft()
+        yield ('header', line)
+        yield ('end', line)
+
+def get_input_format(input_file, input_format='auto'):
+    """Input format of an open input file (see INPUT_FORMATS), if it should be
+    detected (i.e., 'auto'): Binary COPY and Parquet files start with a
+    signature, and some formats have their own file extension. Everything
+    else is PostgreSQL or TSV text (i.e., 'psql')."""
+    if input_format != 'auto':
+        return input_format
+    head = input_file.buffer.peek(len(COPY_BINARY_SIGNATURE))
+    if head.startswith(COPY_BINARY_SIGNATURE):
+        return 'binary'
+    if head.startswith(PARQUET_SIGNATURE):
+        return 'parquet'
+    extension = os.path.splitext(input_file.name)[1].lower()
+    return INPUT_FORMAT_EXTENSIONS.get(extension, 'psql')
+
+def get_sidecar_name(input_name, args):
+    """Sidecar file of a data input, which holds its TIKZ lines. Without
+    --sidecar, it is the input file with a .tikz extension instead."""
+    if args.sidecar is not None:
+        return args.sidecar
+    return os.path.splitext(input_name)[0] + ".tikz"
+
+def sidecar_input(input_file, read_tables, args):
+    """Read the tables of a data input (see INPUT_FORMATS), together with its
+    sidecar file (see get_sidecar_name). Returns the sidecar lines, which we
+    echo instead of the input, and the tokens of both (see copy_tokens)."""
+    if input_file is sys.stdin and args.sidecar is None:
+        raise_error("Data inputs from STDIN need a sidecar file.", "Use --sidecar FILE")
+    sidecar_name = get_sidecar_name(input_file.name, args)
+    try:
+        with open(sidecar_name, 'r') as sidecar:
+            lines = sidecar.readlines()
+    except OSError as err:
+        raise_error("Cannot read the sidecar file '%s' of a data input: %s" % (sidecar_name, err),
+                    "Put all TIKZ lines of the input into this file, or use --sidecar FILE")
+
+    return lines, copy_tokens(lines, read_tables(input_file))
+
+def unaligned_tokenizer(lines):
+    """Tokens of unaligned psql outputs, i.e., psql -A -F'|' (see
+    pgsql_tokenizer). Values have no padding, hence we take them as they
+    are, without stripping. Tables start with a header line, and end with
+    their tuple count, i.e., (3 rows), or an empty line."""
+    state = STATE_OUTSIDE
+    delimiters = -1
+
+    for raw in lines:
+
+        # Fast path for tuple lines, like in pgsql_tokenizer
+        if state == STATE_TUPLES and raw.count('|') == delimiters:
+            yield ['TUPLE', raw.rstrip('\r\n').split('|')]
+            continue
 
-    if configs_count_relation > len(tables):
-        raise_error(
-            "We do not have enough table outputs compared to the amount of " +
-            "TIKZ relation config strings",
-            "Either delete a configuration string for a table, or provide\n" +
-            "an additional SQL-command to produce a table output.\n" +
-            "For example:\n" +
-            "-- TIKZ: relation, table_name, ts, te, relation description")
+        line = raw.strip()
+        if line == "":
+            if state == STATE_TUPLES:
+                yield ['TABLEEND', '']
+            state = STATE_OUTSIDE
+            continue
 
-    return configs
+        if state == STATE_TUPLES:
+            match = RE_TUPLECOUNT.match(line)
+            if match:
+                state = STATE_OUTSIDE
+                yield ['TUPLECOUNT', match.group(1)]
+            else:
+                yield ['TUPLE', raw.rstrip('\r\n').split('|')]
+            continue
+
+        if line.startswith('--'):
+            yield ['COMMENT', line.lstrip("-- ")]
+        elif '|' in line and RE_HEADER.search(line):
+            state = STATE_TUPLES
+            delimiters = line.count('|')
+            yield ['HEADER', line.split('|')]
+        else:
+            yield ['COMMAND', line]
+
+    if state == STATE_TUPLES:
+        yield ['TABLEEND', '']
+
+def jsonl_tokenizer(lines):
+    """Tokens of JSON lines, e.g., psql -At -c 'SELECT row_to_json(r) FROM r'
+    (see pgsql_tokenizer). Each run of JSON objects is a table, whose
+    columns are the keys of its first object. Other lines are comments or
+    SQL commands."""
+    import json
+
+    loads = json.loads
+    names = None
+
+    for raw in lines:
+        line = raw.strip()
+        if line.startswith('{'):
+            try:
+                row = loads(line)
+            except ValueError as err:
+                raise_error("Invalid JSON line: %s\n%s" % (line, err))
+            if names is None:
+                names = list(row)
+                yield ['HEADER', names]
+            yield ['TUPLE', [format_psql_value(row.get(name)) for name in names]]
+            continue
+
+        if names is not None:
+            yield ['TABLEEND', '']
+            names = None
 
-def format_tikz_figure(parse_result, cfg):
+        if line == "":
+            continue
+        if line.startswith('--'):
+            yield ['COMMENT', line.lstrip("-- ")]
+        else:
+            yield ['COMMAND', line]
+
+    if names is not None:
+        yield ['TABLEEND', '']
+
+def format_psql_value(value):
+    """Text of a decoded value, like psql prints it, i.e., NULL is empty, and
+    booleans are t or f"""
+    if value is None:
+        return ""
+    if value is True:
+        return "t"
+    if value is False:
+        return "f"
+    return str(value)
+
+def read_binary_tables(input_file):
+    """Tables of a binary COPY input file (see copy_binary_tables), which is
+    mapped into memory if possible"""
+    import mmap
+
+    try:
+        data = mmap.mmap(input_file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        data = input_file.buffer.read()     # Pipes and empty files
+    return copy_binary_tables(data)
+
+def read_parquet_tables(input_file):
+    """Tables of a Parquet input file, i.e., a single one with its column
+    names first (see copy_table_tokens). Parquet needs pyarrow, which is an
+    optional dependency, hence we import it only here."""
+    try:
+        import pyarrow.parquet
+    except ImportError:
+        raise_error("Parquet inputs need pyarrow.", "Install it with: pip install pyarrow")
+
+    source = input_file.buffer
+    if not source.seekable():
+        source = io.BytesIO(source.read())
+    parquet = pyarrow.parquet.ParquetFile(source)
+
+    def rows():
+        yield parquet.schema_arrow.names
+        for batch in parquet.iter_batches():
+            columns = [map(format_psql_value, column.to_pylist()) for column in batch.columns]
+            yield from map(list, zip(*columns))
+
+    yield rows()
+
+def copy_tokens(sidecar, tables):
+    """Tokens of the sidecar lines, and the given data tables in between: Each
+    table follows the next relation line of the sidecar. The columns of a
+    table can be given with a line like `-- TIKZ: columns, a text, ts int4,
+    te int4`, before or right after its relation line. Binary tables need
+    it, because the binary format has neither names nor types. Other tables
+    use their header otherwise."""
+    tables = iter(tables)
+    columns = None
+    temporal = []   # Time and ypos column names of the waiting relation line
+    due = False     # A relation line waits for its table
+    for token in pgsql_tokenizer(sidecar, INPUT_TYPE_POSTGRES):
+        if token[0] == 'COMMENT':
+            match = RE_TIKZ_COMMENT.search(token[1])
+            comment_type = match.group(1) if match else None
+            if comment_type == 'columns':
+                columns = [item.split(None, 1) for item in RE_LIST_SEP.split(match.group(2))]
+                continue
+            if due:
+                yield from copy_table_tokens(next(tables, None), columns, temporal)
+                columns = None
+            due = comment_type in ['relation', 'relation-table']
+            if due:
+                temporal = RE_LIST_SEP.split(match.group(2), 4)[1:4]
+
+        # Tables inside the sidecar are bound to the waiting relation line
+        elif token[0] == 'HEADER':
+            due = False
+        yield token
+
+    if due:
+        yield from copy_table_tokens(next(tables, None), columns, temporal)
+        columns = None
+
+    # There are not enough relation lines (see raise_error_missing_relation)
+    for table in tables:
+        yield from copy_table_tokens(table, columns, [])
+        columns = None
+
+def copy_table_tokens(table, columns, temporal):
+    """Tokens of a single data table, which is either an iterator of text rows
+    with the header first (see copy_csv_tables), or a generator function of
+    a binary table (see copy_binary_tables). columns is a list of names with
+    optional types, or None. Integer time and ypos columns (i.e., named in
+    temporal) of binary tables are decoded straight to int (see
+    Relation.addValues), everything else to text."""
+    if table is None:
+        return
+
+    if callable(table):
+        if columns is None:
+            raise_error("Binary COPY input needs the names and types of its columns.",
+                        "Add a line like '-- TIKZ: columns, a text, ts int4, te int4' after "
+                        "each relation line of the sidecar file.")
+        names = [column[0] for column in columns]
+        decoders = [get_copy_decoder(column[1] if len(column) > 1 else 'text',
+                                     column[0] in temporal)
+                    for column in columns]
+        yield ['HEADER', names]
+        for values in table(decoders):
+            yield ['VALUES', values]
+    else:
+        header = next(table, None)
+        if columns is None:
+            if header is None:
+                return
+            names = header
+        else:
+            names = [column[0] for column in columns]
+            if header is not None and header != names:
+                table = itertools.chain([header], table)
+        yield ['HEADER', names]
+        for values in table:
+            yield ['TUPLE', values]
+
+    yield ['TABLEEND', '']
+
+def copy_csv_tables(lines):
+    """Tables of a COPY ... CSV stream, which are separated by empty lines.
+    The delimiter is detected from the first line, i.e., ';', ',' or a tab
+    (see --csvout of p-pgcontrol.sh). Each table is an iterator of rows,
+    which must be consumed before the next table."""
+    lines = iter(lines)
+    first = next(lines, None)
+    if first is None:
+        return
+    import csv
+
+    delimiter = max(COPY_CSV_DELIMITERS, key=first.count)
+    reader = csv.reader(itertools.chain([first], lines), delimiter=delimiter)
+    for row in reader:
+        if len(row) == 0:
+            continue
+        yield itertools.chain([row], itertools.takewhile(len, reader))
+
+def copy_binary_tables(data):
+    """Tables of a COPY ... (FORMAT binary) stream, which can also hold many
+    concatenated streams. Each table is a generator function, which takes a
+    decoder for each column (see get_copy_decoder), and yields the decoded
+    tuples. It must be consumed before the next table.
+    See https://www.postgresql.org/docs/current/sql-copy.html"""
+    pos = 0
+    end = len(data)
+    unpack_from = struct.unpack_from
+
+    def rows(decoders):
+        nonlocal pos
+        try:
+            while True:
+                count, = unpack_from('>h', data, pos)
+                pos += 2
+                if count == -1:
+                    return
+                if count != len(decoders):
+                    raise_error("Binary COPY tuple has %d fields, but there are %d columns." % (
+                        count, len(decoders)))
+                values = []
+                for fixed, unpack_field, decode in decoders:
+
+                    # Fast path: Integers are unpacked with their length, but
+                    # not beyond the end of data (i.e., NULL at the end)
+                    if fixed and pos + 4 + fixed <= end:
+                        size, value = unpack_field(data, pos)
+                        if size == fixed:
+                            values.append(value)
+                            pos += 4 + fixed
+                            continue
+
+                    size, = unpack_from('>i', data, pos)
+                    pos += 4
+                    if size == -1:
+                        values.append(decode(None))
+                    else:
+                        values.append(decode(data[pos:pos + size]))
+                        pos += size
+                yield values
+        except struct.error:
+            raise_error("Binary COPY input ends within a tuple.")
+
+    while pos < len(data):
+        if data[pos:pos + len(COPY_BINARY_SIGNATURE)] != COPY_BINARY_SIGNATURE:
+            raise_error("Binary COPY input has no valid signature at byte %d." % pos)
+        _, extension = unpack_from('>ii', data, pos + len(COPY_BINARY_SIGNATURE))
+        pos += len(COPY_BINARY_SIGNATURE) + 8 + extension
+        yield rows
+
+def get_copy_decoder(column_type, as_int=False):
+    """Decoder of a binary COPY column (see copy_binary_tables), i.e., a
+    function, which turns a raw field into a value. Integers stay integers if
+    as_int is set, and are then unpacked together with their length, i.e., a
+    fixed size and unpack function. All other fields get the text that psql
+    would print. NULL becomes an empty string, like in psql outputs."""
+    column_type = column_type.lower()
+    from_bytes = int.from_bytes
+
+    if column_type in COPY_INTEGER_TYPES:
+        size, fmt = COPY_INTEGER_TYPES[column_type]
+        decode = lambda field: "" if field is None else from_bytes(field, 'big', signed=True)
+        if as_int:
+            return size, struct.Struct('>i' + fmt).unpack_from, decode
+        return 0, None, lambda field: "" if field is None else str(decode(field))
+
+    return 0, None, get_copy_text_decoder(column_type)
+
+def get_copy_text_decoder(column_type):
+    """Function, which turns a raw binary COPY field of a non-integer type
+    into text (see get_copy_decoder)"""
+    unpack = struct.unpack
+    if column_type in COPY_TEXT_TYPES:
+        return lambda field: "" if field is None else field.decode('utf-8')
+    if column_type in ['float4', 'real']:
+        return lambda field: "" if field is None else repr(unpack('>f', field)[0])
+    if column_type in ['float8', 'double precision']:
+        return lambda field: "" if field is None else repr(unpack('>d', field)[0])
+    if column_type in ['bool', 'boolean']:
+        return lambda field: "" if field is None else ('t' if field[0] else 'f')
+    if column_type in ['int4range', 'int8range']:
+        return lambda field: "" if field is None else format_copy_range(field)
+    raise_error("Unknown column type '%s' for binary COPY input." % column_type,
+                "Use integer, text, float, boolean or integer range types.")
+
+def format_copy_range(field):
+    """Text of a binary integer range, i.e., [1,5), which is parsed like the
+    range types of psql outputs (see Relation.parseTupleT)"""
+    flags = field[0]
+    if flags & 0x01:
+        return "empty"
+    bounds = []
+    pos = 1
+    for infinite in [0x08, 0x10]:
+        if flags & infinite:
+            bounds.append("")
+            continue
+        size, = struct.unpack_from('>i', field, pos)
+        bounds.append(str(int.from_bytes(field[pos + 4:pos + 4 + size], 'big', signed=True)))
+        pos += 4 + size
+    return "%s%s,%s%s" % ("[" if flags & 0x02 else "(", bounds[0],
+                          bounds[1], "]" if flags & 0x04 else ")")
+
+def raise_error_missing_relation():
+    """The amount of relation config strings and table outputs must match!"""
+    raise_error(
+        "We do not have enough TIKZ relation config strings",
+        "Define a configuration string for each table.\n" +
+        "For example:\n" +
+        "-- TIKZ: relation, table_name, ts, te, relation description")
+
+def write_tikz_figure(out, parse_result, cfg, auto_timeline=False):
     """
     Draw a TIKZ figure with an optional timeline, tuple-lines for each tuple in
     all given tables, and description on the right-hand-side of each table.
+    If auto_timeline is set and no timeline is given, we draw it below all
+    relations from the first to the last time point of all tuples.
     """
 
-    # Count tuples above the timeline. We do this, because we need to count
-    # backwards while creating lines above the timeline. However, it is not
-    # necessary below, because there we count starting from 1, s.t., the
-    # index 1 is always close to the timeline in the middle.
-    posy = 0
-    out = ""
-
     xscale = float(list_get(cfg, 'xscale', 0.65))
     yscale = float(list_get(cfg, 'yscale', 0.4))
     ystep = float(list_get(cfg, 'ystep', 1))
+    maxtuples = get_maxtuples(cfg)
+
+    def content(out):
+        offset = 0
+        bounds = None
+        timeline = auto_timeline
+        for line in parse_result:
+
+            # Print the timeline
+            if line['type'] == 'timeline':
+                out.write(format_tikz_timeline(line, offset))
+                offset -= 2
+                timeline = False
+                continue
 
-    offset = 0
-    for line in parse_result:
-
-        # Print the timeline
-        if line['type'] == 'timeline':
-            iout = format_tikz_timeline(line, offset)
-            offset -= 2
-            out += iout
-            continue
-
-        if line['type'] in ['relation', 'relation-table']:
-            relation = line['relation']
-
-            # Print tuples of each table as lines from ts to te. The description of
-            # each tuple is a list of explicit attributes (i.e., non-temporal
-            # columns), and optionally a tuple identifier "relation_tuplecount"
-            posy = offset
-            for tuple_count, tup in enumerate(relation.values, 1):
-                if relation.ypos != -1:
-                    posy = offset + float(relation.getTupleYPOS(tup) - relation.getYMax())
-                out += format_tikz_tupleline(tup, relation, tuple_count, posy)
-                posy -= 1
-
-            offset = offset - (relation.getYMax() - relation.getYMin()) - ystep
+            if line['type'] in ['relation', 'relation-table']:
+                offset = write_tikz_relation(out, line['relation'], offset, ystep, maxtuples)
+                bounds = merge_time_bounds(bounds, line['relation'].getTimeBounds())
+
+        if timeline and bounds is not None:
+            out.write(format_tikz_timeline(get_auto_timeline(bounds), offset))
+
+    write_template(out, TEMPLATE_TIKZ_PICTURE, {'content': content},
+                   xscale=xscale, yscale=yscale)
+
+def get_maxtuples(cfg):
+    """Largest number of tuples drawn per relation, or None if unlimited"""
+    maxtuples = list_get(cfg, 'maxtuples', None)
+    if maxtuples is None:
+        return None
+    maxtuples = int(maxtuples)
+    if maxtuples < 1:
+        raise_error_cfgline('maxtuples', "We need at least one tuple per relation.")
+    return maxtuples
+
+def merge_time_bounds(bounds, other):
+    """Smallest time bounds, which contain both given bounds (or None)"""
+    if bounds is None:
+        return other
+    if other is None:
+        return bounds
+    return min(bounds[0], other[0]), max(bounds[1], other[1])
+
+def get_auto_timeline(bounds, desc="time"):
+    """Timeline config-line for the given time bounds. We choose the step,
+    such that the timeline has at most 10 numbers, i.e., 1, 2, 5, 10, 20..."""
+    length = bounds[1] - bounds[0]
+    step = 1
+    while length > step * 10:
+        for factor in [2, 5, 10]:
+            if length <= step * factor * 10 or factor == 10:
+                step *= factor
+                break
+    return {'type': 'timeline',
+            'from': bounds[0],
+            'to': bounds[1],
+            'step': step,
+            'desc': desc}
+
+def write_tikz_relation(out, relation, offset, ystep, maxtuples=None):
+    """Draw the tuple-lines and the description of a single relation starting
+    at y-position offset. Returns the offset for the next drawing below.
+    Relations with more than maxtuples tuples get a density row first, and
+    only a sample of maxtuples tuples is drawn below (see write_tikz_density).
+    """
 
-            # Print description on the left-hand-side of each relation
-            if relation.desc.strip() != "":
-                p = (offset + ystep) + (relation.getYMax() - relation.getYMin())  / 2
-                out += format_tikz_desc(p, relation.desc)
+    # Count tuples above the timeline. We do this, because we need to count
+    # backwards while creating lines above the timeline. However, it is not
+    # necessary below, because there we count starting from 1, s.t., the
+    # index 1 is always close to the timeline in the middle.
+    write = out.write
+
+    # All tuples of a relation share the same templates, either with or
+    # without name and attributes.
+    if len(relation.getSchemaB()) == 0:
+        suffix = "{{${name}_{{{id}}}$}};\n"
+    elif relation.name == "":
+        suffix = "{{({attribs})}};\n"
+    else:
+        suffix = "{{${name}_{{{id}}}$=({attribs})}};\n"
+    template_interval = compile_template(TEMPLATE_TIKZ_TUPLE + suffix, name=relation.name)
+    template_point = compile_template(TEMPLATE_TIKZ_POINT + suffix, name=relation.name)
+
+    # Huge relations would overflow TeX, hence we draw every stride-th tuple
+    # only. Tuple identifiers stay the same.
+    count = relation.getLength()
+    stride = 1
+    if maxtuples is not None and count > maxtuples:
+        write_tikz_density(out, relation, offset, maxtuples)
+        offset -= 1
+        stride = -(-count // maxtuples)
+
+    # Print tuples of each table as lines from ts to te. The description of
+    # each tuple is a list of explicit attributes (i.e., non-temporal
+    # columns), and optionally a tuple identifier "relation_tuplecount"
+    with_ypos = relation.ypos != -1
+    ymax = relation.getYMax()
+    ys = relation.y if with_ypos else itertools.repeat(0)
+    posy = offset
+    rows = enumerate(zip(relation.ts, relation.te, ys, relation.getTuplesB()), 1)
+    if stride > 1:
+        rows = itertools.islice(rows, 0, None, stride)
+    for row, (ts, te, y, attribs) in rows:
+        if with_ypos:
+            posy = offset + float(y - ymax)
 
-    return TEMPLATE_TIKZ_PICTURE.format(content=out, xscale=xscale, yscale=yscale)
+        # Single point detected: Generate point representation
+        template = template_interval
+        if te == -1:
+            te = ts + 1
+            template = template_point
+
+        write(template % {'id': row,
+                          'ts': ts,
+                          'te': te,
+                          'posx': float(ts + te) / 2,
+                          'posy': posy,
+                          'attribs': ",".join(attribs).rstrip(',')})
+        posy -= 1
+
+    height = relation.getYMax() - relation.getYMin()
+    if stride > 1 and not with_ypos:
+        height = (count - 1) // stride
+    offset = offset - height - ystep
+
+    # Print description on the left-hand-side of each relation
+    if relation.desc.strip() != "":
+        p = (offset + ystep) + height / 2
+        write(format_tikz_desc(p, relation.desc))
+
+    return offset
+
+def write_tikz_density(out, relation, posy, maxtuples):
+    """Draw all tuples of a relation in a single row at posy: Intervals, which
+    overlap or touch each other, are merged into bands, and points are counted
+    in buckets. Each band is labelled with its number of tuples, and shaded by
+    it. The time range is split into at most maxtuples buckets, and bands or
+    points inside the same bucket are merged. Hence, we never draw more than
+    2 * maxtuples bands and points, however many tuples there are."""
+
+    tmin, tmax = relation.getTimeBounds()
+    width = max(1, -(-(tmax - tmin) // maxtuples))
+    buckets = (tmax - tmin) // width + 1
+
+    # Difference array of intervals, which cover each bucket, the number of
+    # intervals starting in each bucket, and their first and last time points
+    cover = [0] * (buckets + 1)
+    starts = [0] * buckets
+    first = [None] * buckets
+    last = [None] * buckets
+    points = [0] * buckets
+    for ts, te in zip(relation.ts, relation.te):
+        start = (ts - tmin) // width
+        if te == -1:
+            points[start] += 1
+            continue
+        end = (max(ts, te - 1) - tmin) // width
+        cover[start] += 1
+        cover[end + 1] -= 1
+        starts[start] += 1
+        if first[start] is None or ts < first[start]:
+            first[start] = ts
+        if last[end] is None or te > last[end]:
+            last[end] = te
+
+    # Bands are runs of covered buckets
+    bands = []
+    covered = 0
+    for bucket in range(buckets):
+        if covered == 0 and cover[bucket] > 0:
+            bands.append([first[bucket], last[bucket], 0])
+        covered += cover[bucket]
+        if covered > 0:
+            band = bands[-1]
+            band[2] += starts[bucket]
+            if last[bucket] is not None and (band[1] is None or last[bucket] > band[1]):
+                band[1] = last[bucket]
+
+    densest = max([band[2] for band in bands] + points)
+    for ts, te, count in bands:
+        out.write(TEMPLATE_TIKZ_BAND.format(name=relation.name,
+                                            ts=ts,
+                                            te=te,
+                                            posx=float(ts + te) / 2,
+                                            posy=posy,
+                                            count=count,
+                                            shade=20 + 80 * count // densest))
+
+    for bucket, count in enumerate(points):
+        if count > 0:
+            out.write(TEMPLATE_TIKZ_POINTS.format(name=relation.name,
+                                                  posx=tmin + (bucket + 0.5) * width,
+                                                  posy=posy,
+                                                  count=count))
+
+def compile_template(template, **constants):
+    """Turn a format template into a printf-style template with named fields,
+    i.e., %(name)s, which is much faster for many tuples. The given constants
+    are replaced right away."""
+    result = ""
+    for text, field, _, _ in string.Formatter().parse(template):
+        result += text.replace('%', '%%')
+        if field is None:
+            continue
+        if field in constants:
+            result += str(constants[field]).replace('%', '%%')
+        else:
+            result += '%(' + field + ')s'
+    return result
 
 def format_latex_header(raw_data):
     """Prints a TEX comment header including a version, this app's name, and
-    the input text."""
+    the input text. If raw_data is None, the input is omitted."""
+    if raw_data is None:
+        return TEMPLATE_HEADER_NOINPUT.format(
+                    appname=os.path.basename(__file__),
+                    appversion=__version__)
     return TEMPLATE_HEADER.format(
                 appname=os.path.basename(__file__),
                 appversion=__version__,
                 input="".join("%% %s\n" % x for x in raw_data.strip().split("\n")))
 
-def format_latex_standalone(content):
-    """Creates a TIKZ standalone latex document"""
-    return TEMPLATE_TIKZ_DOC.format(content=content)
+def write_latex_table(out, line, label, table_type=1):
+    """Print a single table from a relation-config-line"""
+
+    template, kwargs = latex_table_template(line, label, table_type)
+    head, _, tail = split_template(template, ['rows'], **kwargs)
+    relation = line['relation']
+    row_template = compile_latex_table_row(relation)
 
+    # Rows are separated by line breaks
+    write = out.write
+    write(head)
+    for row_count, values in enumerate(relation.getTuplesTB(), 1):
+        if row_count > 1:
+            write("\n")
+        write(row_template % (row_count, r" & ".join(values)))
+    write(tail)
 
-def format_latex_table(line, label, table_type=1):
-    """Print a single table from a relation-config-line"""
+def latex_table_template(line, label, table_type=1):
+    """Choose the table template for a relation-config-line, and return it
+    together with all replacement fields, except for the rows."""
 
     if line['type'] not in ['relation', 'relation-table']:
         raise_error("Latex Print Table: Provided config-line has wrong " \
@@ -710,59 +2065,60 @@ def format_latex_table(line, label, table_type=1):
 
     # We skip the first element inside a table. It is the header.
     header = relation.getSchemaTemporal()
-    tuples = relation.getTuplesTB()
 
     # Concatenate all non-temporal attributes as description above the line
     attribs = r" & ".join(header)
-    rows = ""
-    for row_count, row in enumerate(tuples, 1):
-        rows += " " * 12 + "$%s_{%d}$ & %s \\\\\n" % (relation.name,
-                                         row_count,
-                                         r" & ".join(row))
 
     if table_type == 1:
-        return TEMPLATE_LATEX_TABLE.format(
-                caption=relation.desc,
-                label=label,
-                length=len(header) + 1,
-                header_cfg="c" * len(header),
-                header=attribs.rstrip(" &"),
-                rows=rows.rstrip("\n"))
+        return TEMPLATE_LATEX_TABLE, {
+                'caption': relation.desc,
+                'label': label,
+                'length': len(header) + 1,
+                'header_cfg': "c" * len(header),
+                'header': attribs.rstrip(" &")}
 
     if table_type == 2:
-        return TEMPLATE_LATEX_TABLE2.format(
-                    header_cfg="c" * len(header),
-                    header=attribs.rstrip(" &"),
-                    rows=rows.rstrip("\n"),
-                    relation=relation.name)
-
-    return TEMPLATE_LATEX_TABLETOP.format(
-                header_cfg="c" * len(header),
-                header=attribs.rstrip(" &"),
-                rows=rows.rstrip("\n"),
-                relation=relation.name)
-
-
-
-def format_latex_figure_and_table(table_str, tikz_str, caption, label, subfigure_left, subfigure_right):
-    """Prints a figure and a table side-by-side as sub-figures"""
-    return TEMPLATE_LATEX_TIKZTABLE.format(table=table_str,
-                                           tikzpicture=tikz_str,
-                                           caption=caption,
-                                           label=label,
-                                           subfigureleft=subfigure_left,
-                                           subfigureright=subfigure_right)
-
-def format_latex_figure_and_table_top(table_str, tikz_str, caption, label, tablecaption, tablelabel, graphcaption, graphlabel):
-    """Prints a figure and a table side-by-side as sub-figures"""
-    return TEMPLATE_LATEX_TIKZTABLETOP.format(table=table_str,
-                                           tikzpicture=tikz_str,
-                                           caption=caption,
-                                           label=label,
-                                           tablecaption=tablecaption,
-                                           tablelabel=tablelabel,
-                                           graphcaption=graphcaption,
-                                           graphlabel=graphlabel)
+        return TEMPLATE_LATEX_TABLE2, {
+                    'header_cfg': "c" * len(header),
+                    'header': attribs.rstrip(" &"),
+                    'relation': relation.name}
+
+    return TEMPLATE_LATEX_TABLETOP, {
+                'header_cfg': "c" * len(header),
+                'header': attribs.rstrip(" &"),
+                'relation': relation.name}
+
+def compile_latex_table_row(relation):
+    """Printf-style template of a table row without line break, which needs
+    the row number and the joined values (see Relation.getTuplesTB)."""
+    return " " * 12 + "$" + relation.name.replace('%', '%%') + "_{%d}$ & %s \\\\"
+
+def split_template(template, fields, **kwargs):
+    """Split a template at the given replacement fields, and format the text
+    in between with kwargs. The result alternates formatted text and field
+    names, that is, field names are at odd positions."""
+    chunks = re.split(r'(?<!\{)\{(' + '|'.join(fields) + r')\}(?!\})', template)
+    chunks[::2] = [chunk.format(**kwargs) for chunk in chunks[::2]]
+    return chunks
+
+def write_template(outfile, template, fields, **kwargs):
+    """Write a template to outfile. The values of fields are written in place
+    of their replacement field, and can be strings, functions that write to
+    the given outfile, or (temporary) files, which are copied from the start.
+    All other replacement fields are formatted with kwargs."""
+    chunks = split_template(template, fields.keys(), **kwargs)
+    for i, chunk in enumerate(chunks):
+        if i % 2 == 0:
+            outfile.write(chunk)
+            continue
+        value = fields[chunk]
+        if isinstance(value, str):
+            outfile.write(value)
+        elif callable(value):
+            value(outfile)
+        else:
+            value.seek(0)
+            shutil.copyfileobj(value, outfile)
 
 def list_get (l, idx, default):
     try:
@@ -770,6 +2126,20 @@ def list_get (l, idx, default):
     except:
         return default
 
+# Options, which change the output, hence they are part of the cache key. Stream
+# mode applies layout configs only to the relations after them (see --stream).
+CACHE_OPTIONS = ['output_type', 'output_standalone', 'echo', 'auto_timeline',
+                 'stream', 'input_format']
+
+# Seconds between two checks of the input file in watch mode
+WATCH_INTERVAL = 0.2
+
+# Buffer size to hash and copy cached files
+CACHE_COPY_BUFSIZE = 1024 * 1024
+
+# Write buffer of output files
+OUTPUT_BUFSIZE = 1024 * 1024
+
 # STATES of the tokenizer, which is implemented as a state machine...
 STATE_FIRSTLINE = 0
 STATE_OUTSIDE   = 1      # We have not found a table yet
@@ -780,6 +2150,48 @@ STATE_TUPLES    = 3      # We have already parsed the table header, and are
 INPUT_TYPE_POSTGRES = 0
 INPUT_TYPE_TSV      = 1
 
+# Patterns of the tokenizer and parser, which we compile once
+# Binary COPY streams start with this signature, followed by flags and a
+# header extension (see copy_binary_tables)
+COPY_BINARY_SIGNATURE = b"PGCOPY\n\xff\r\n\x00"
+COPY_CSV_DELIMITERS   = [',', ';', '\t']
+COPY_INTEGER_TYPES    = {'int2': (2, 'h'), 'smallint': (2, 'h'),
+                         'int4': (4, 'i'), 'integer': (4, 'i'), 'int': (4, 'i'),
+                         'int8': (8, 'q'), 'bigint': (8, 'q')}
+COPY_TEXT_TYPES       = ['text', 'varchar', 'char', 'bpchar', 'name',
+                         'character', 'character varying']
+
+PARQUET_SIGNATURE     = b"PAR1"
+
+# Input formats (see --input-format): Text inputs have a tokenizer, which
+# turns their lines into tokens (see pgsql_tokenizer), and which are echoed
+# into the output. Data inputs have a reader, which gives back their tables
+# (see copy_table_tokens), and their TIKZ lines are kept in a sidecar file
+# (see sidecar_input). Optional dependencies are imported by the reader.
+INPUT_FORMATS = {
+    'psql':      ('text', pgsql_tokenizer),     # Aligned or TSV by first line
+    'aligned':   ('text', lambda lines: pgsql_tokenizer(lines, INPUT_TYPE_POSTGRES)),
+    'tsv':       ('text', lambda lines: pgsql_tokenizer(lines, INPUT_TYPE_TSV)),
+    'unaligned': ('text', unaligned_tokenizer),
+    'jsonl':     ('text', jsonl_tokenizer),
+    'csv':       ('data', copy_csv_tables),
+    'binary':    ('data', read_binary_tables),
+    'parquet':   ('data', read_parquet_tables),
+}
+
+# Input formats, which are detected by their file extension
+INPUT_FORMAT_EXTENSIONS = {'.csv': 'csv',
+                           '.jsonl': 'jsonl',
+                           '.ndjson': 'jsonl',
+                           '.parquet': 'parquet'}
+
+RE_TSV          = re.compile(r'--\s*TIKZ: TSV')
+RE_HEADER       = re.compile(r'\s*[^\|]+?\s*\|\s*[^\|]+?')
+RE_TUPLECOUNT   = re.compile(r'\((\d+?)\s\w*\)')
+RE_TIKZ_COMMENT = re.compile(r'TIKZ:\s*([a-z\-]+?)\s*,\s*(.*)+?')
+RE_LIST_SEP     = re.compile(r'\s*,\s*')
+RE_RANGE        = re.compile(r'.?(\d+),(\d+).?')
+
 TEMPLATE_HEADER = r"""% This file has been automatically generated by...
 %
 % {appname} v{appversion} written by Peter Moser <pitiz29a@gmail.com>
@@ -790,6 +2202,15 @@ TEMPLATE_HEADER = r"""% This file has been automatically generated by...
 {input}% _______________________________________________________________INPUT-END____
 """
 
+TEMPLATE_HEADER_NOINPUT = r"""% This file has been automatically generated by...
+%
+% {appname} v{appversion} written by Peter Moser <pitiz29a@gmail.com>
+% Source code can be found under: https://github.com/Piiit/pwScripts
+"""
+
+# Tables side-by-side within the same subfigure
+TABLE_SEPARATOR = r"    \hspace{2cm}"
+
 TEMPLATE_TIKZ_DOC = r"""
 \documentclass{{article}}
 \usepackage{{subcaption}}
@@ -859,6 +2280,19 @@ TEMPLATE_TIKZ_POINT = r"""
         \draw[-] ({posx},{posy}-0.2) node[above,font=\tiny]"""
 
 
+# Merged intervals and points of huge relations (see write_tikz_density)
+TEMPLATE_TIKZ_BAND = r"""
+        % Band of {name} with {count} tuples
+        \draw[-, line width=2, black!{shade}] ({ts},{posy})--({te},{posy});
+        \draw[-] ({posx},{posy}-0.2) node[above,font=\tiny] {{$n={count}$}};
+"""
+
+TEMPLATE_TIKZ_POINTS = r"""
+        % Points of {name} with {count} tuples
+        \draw ({posx},{posy}) node[cross] {{}};
+        \draw[-] ({posx},{posy}-0.2) node[above,font=\tiny] {{$n={count}$}};
+"""
+
 TEMPLATE_LATEX_TABLE = r"""
     \begin{{table}}
         \renewcommand{{\arraystretch}}{{1.3}}
@@ -935,9 +2369,22 @@ RELATION_TYPE_INTERVAL = 0
 RELATION_TYPE_POINT    = 1
 
 class Relation:
-    def __init__(self):
+    """A relation is stored column by column: Start and end points, and the
+    y-positions of all tuples are parsed once into integer arrays, and all
+    other attributes are kept as strings, i.e., one list per column. The text
+    of temporal columns is only kept, if it cannot be printed from the parsed
+    integers again, i.e., for range types. Tuples are addressed by their row
+    number, starting at 0. Relations, which are not drawn, keep the text of
+    all columns and do not parse their times at all (see parseTimes), since
+    tables print them as they are, e.g., dates."""
+
+    __slots__ = ['schema', 'tsid', 'teid', 'ypos', 'tsname', 'tename',
+                 'yposname', 'name', 'desc', 'relType', 'ts', 'te', 'y',
+                 'columns', '_ymax', '_ymin', '_tsmin', '_tsmax', '_temax',
+                 '_points', '_offset', 'parseTimes']
+
+    def __init__(self, parseTimes=True):
         self.schema = []
-        self.values = []
         self.tsid = -1
         self.teid = -1
         self.ypos = -1
@@ -945,10 +2392,22 @@ class Relation:
         self.tename = ""
         self.yposname = ""
         self.name = ""
+        self.desc = ""
         self.relType = RELATION_TYPE_INTERVAL
-        self._ymax = -1
-        self._ymin = -1
+        self.ts = array.array('q')
+        self.te = array.array('q')      # -1 for points
+        self.y = array.array('q')       # Only filled if we have a ypos column
+        self.columns = []               # Text of each column, or None
+
+        # Running statistics, which we update with each tuple
+        self._ymax = 0
+        self._ymin = 1000000
+        self._tsmin = None
+        self._tsmax = None
+        self._temax = None
+        self._points = 0
         self._offset = 0
+        self.parseTimes = parseTimes
 
     def __findSchemaIds__(self):
         for i, a in enumerate(self.schema):
@@ -959,66 +2418,172 @@ class Relation:
             elif a == self.yposname:
                 self.ypos = i
 
-    def __findYRange__(self):
-        if self.ypos == -1:
-            self._ymin = 0
-            self._ymax = len(self.values) - 1
-            return
-        self._ymin = 1000000
-        self._ymax = 0
-        for tup in self.values:
-            self._ymin = min(self._ymin, int(tup[self.ypos]))
-            self._ymax = max(self._ymax, int(tup[self.ypos]))
+        # Temporal and ypos columns start without text, everything else is
+        # kept as it is.
+        self.columns = []
+        for i in range(len(self.schema)):
+            if self.parseTimes and i in [self.tsid, self.teid, self.ypos]:
+                self.columns.append(None)
+            else:
+                self.columns.append([])
 
     def getYMin(self):
-        if self._ymin == -1:
-            self.__findYRange__()
+        if self.ypos == -1:
+            return 0
         return self._ymin
 
     def getYMax(self):
-        if self._ymax == -1:
-            self.__findYRange__()
+        if self.ypos == -1:
+            return self.getLength() - 1
         return self._ymax
 
+    def getTimeBounds(self):
+        """Returns the first and last time point of all tuples, or None if
+        the relation is empty. Points end one time unit after their start,
+        like they are drawn."""
+        if self._tsmin is None:
+            return None
+        if self._points == 0:
+            return self._tsmin, self._temax
+        if self._temax is None:
+            return self._tsmin, self._tsmax + 1
+        return self._tsmin, max(self._temax, self._tsmax + 1)
+
     def setSchema(self, schema):
         self.schema = schema
         self.__findSchemaIds__()
 
     def addTuple(self, tup):
-        if len(tup) == len(self.schema):
-            self.values.append(tup)
+        self.checkTuple(tup)
+        if not self.parseTimes:
+            for column, value in zip(self.columns, tup):
+                column.append(value)
+            return
+        try:
+            ts, te = self.parseTupleT(tup)
+            if self.ypos != -1:
+                y = int(tup[self.ypos])
+                self.y.append(y)
+                self._ymin = min(self._ymin, y)
+                self._ymax = max(self._ymax, y)
+        except ValueError:
+            raise_error("Time or ypos of a tuple in relation '%s' is not an integer: %s" % (self.desc, ", ".join(tup)))
+        self.__appendTuple__(tup, ts, te)
+
+    def addValues(self, values):
+        """Same as addTuple, but for decoded values of binary inputs (see
+        copy_table_tokens): Time and ypos columns are integers already, or
+        text for range types, and all other columns are text. Their number
+        is checked by the decoder."""
+        if not self.parseTimes:
+            for column, value in zip(self.columns, values):
+                column.append(value if type(value) is str else str(value))
+            return
+        ts = values[self.tsid]
+        try:
+            if self.teid != -1:
+                te = values[self.teid]
+                if type(ts) is not int or type(te) is not int:
+                    ts, te = int(ts), int(te)
+            elif type(ts) is int:
+                te = -1
+            else:
+                ts, te = self.parseTupleT(values)
+            if self.ypos != -1:
+                y = int(values[self.ypos])
+                self.y.append(y)
+                self._ymin = min(self._ymin, y)
+                self._ymax = max(self._ymax, y)
+        except ValueError:
+            raise_error("Time or ypos of a tuple in relation '%s' is not an integer: %s" % (
+                self.desc, ", ".join(map(str, values))))
+        self.__appendTuple__(values, ts, te)
+
+    def __appendTuple__(self, tup, ts, te):
+        self.ts.append(ts)
+        self.te.append(te)
+
+        if self._tsmin is None:
+            self._tsmin = ts
+            self._tsmax = ts
         else:
+            self._tsmin = min(self._tsmin, ts)
+            self._tsmax = max(self._tsmax, ts)
+        if te == -1:
+            self._points += 1
+        elif self._temax is None or te > self._temax:
+            self._temax = te
+
+        for i, column in enumerate(self.columns):
+            if column is not None:
+                column.append(tup[i])
+
+        # Keep the text of temporal columns from now on, if it differs from
+        # the parsed integer, and fill it up for all tuples before. Decoded
+        # integers (see addValues) are printed the same anyway.
+        for i, times in [(self.tsid, self.ts), (self.teid, self.te)]:
+            if (i != -1 and self.columns[i] is None and type(tup[i]) is str
+                    and tup[i] != str(times[-1])):
+                self.columns[i] = [str(t) for t in times[:-1]] + [tup[i]]
+
+    def checkTuple(self, tup):
+        if len(tup) != len(self.schema):
             raise_error("Too many tuple columns for the actual schema: " + ", ".join(self.schema))
 
-    def getTupleTS(self, tup):
-        return self.getTupleT(tup)[0]
-
-    def getTupleTE(self, tup):
-        return self.getTupleT(tup)[1]
+    def getDigest(self):
+        """Hash of the meta data and all tuples to recognize unchanged
+        relations"""
+        digest = hashlib.sha1()
+        digest.update(repr([self.name, self.tsname, self.tename, self.yposname,
+                            self.desc, self.schema, self.getLength()]).encode())
+        for times in [self.ts, self.te, self.y]:
+            digest.update(times.tobytes())
+        for column in self.columns:
+            if column is not None:
+                digest.update("\x1f".join(column).encode('utf-8', 'surrogateescape'))
+            digest.update(b"\x1e")
+        return digest.hexdigest()
+
+    def getTuplesB(self):
+        columns = []
+        for i, column in enumerate(self.columns):
+            if i == self.tsid or i == self.teid or i == self.ypos:
+                continue
+            columns.append(column)
+        if len(columns) == 0:
+            return itertools.repeat(())
+        return zip(*columns)
 
-    def getTupleYPOS(self, tup):
-        return float(tup[self.ypos])
+    def getTuplesTB(self):
+        columns = []
+        for i in range(len(self.columns)):
+            if i == self.ypos:
+                continue
+            if self.columns[i] is not None:
+                columns.append(self.columns[i])
+            elif i == self.tsid:
+                columns.append(map(str, self.ts))
+            else:
+                columns.append(map(str, self.te))
+        return map(list, zip(*columns))
 
-    def getTupleB(self, tup):
+    def getTupleTB(self, tup):
+        """Same as a row of getTuplesTB, but for a tuple, which is not stored"""
         result = []
         for i, a in enumerate(tup):
-            if i == self.tsid or i == self.teid or i == self.ypos:
+            if i == self.ypos:
                 continue
-            result.append(a)
+            result.append(a if type(a) is str else str(a))
         return result
 
-    def getTupleTB(self, tup):
+    def getSchemaB(self):
         result = []
-        for i, a in enumerate(tup):
-            if i == self.ypos:
+        for i, a in enumerate(self.schema):
+            if i == self.tsid or i == self.teid or i == self.ypos:
                 continue
             result.append(a)
         return result
 
-    def getTuplesTB(self):
-        for tup in self.values:
-            yield self.getTupleTB(tup)
-
     def getSchemaTemporal(self):
         result = []
         for i, a in enumerate(self.schema):
@@ -1028,20 +2593,16 @@ class Relation:
         return result
 
     def getLength(self):
-        return len(self.values)
-
-    def getDefault(self, name, default):
-        try:
-            return self.get(name)
-        except:
-            return default
+        if not self.parseTimes:
+            return len(self.columns[0]) if len(self.columns) > 0 else 0
+        return len(self.ts)
 
-    def getTupleT(self, tup):
+    def parseTupleT(self, tup):
         if self.teid != -1:
             return [int(tup[self.tsid]), int(tup[self.teid])]
 
         # Parse range types, we ignore boundary types for now...
-        match = re.search(r'.?(\d+),(\d+).?', tup[self.tsid])
+        match = RE_RANGE.search(tup[self.tsid])
         if match:
             return [int(match.group(1)), int(match.group(2))]
 
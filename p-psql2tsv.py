@@ -8,76 +8,443 @@ Created on Tue Sep 12 10:13:43 2017
 
 import sys
 import re
+import math
 import os
+import argparse
+
+from pwresults import ResultIndex, getDefaultIndexFile, mapFiles
+
+DESCRIPTION = """
+  Extract from a list of files containing experiments (EXPLAIN ANALYZE) conducted with
+  PostgreSQL the execution time. Remove <prefix> from each filename, and choose the remaining
+  text as varying parameter name. The next token until an underscore (_) is the varying
+  parameter value, and the remainder is the algorithm name used as column name.
+  The full filename pattern looks like this: <prefix><parameter-name><parameter-value>_<algorithm>
+  Several parameters can follow each other, e.g., <prefix>N1000M10_<algorithm>.
+
+  The result is then a table with the parameter names as first column names, and all algorithms
+  as follwing column names. Rows are sorted by their parameter values, and missing results, e.g.,
+  of a sweep, which is still running, are nan. With --pivot, the values of a parameter become
+  columns instead of rows, e.g., algoA_M10 and algoA_M20. The cells contain the average of all
+  execution times within a single file in whole ms, or of another measure of each query plan with
+  three decimals (see --measure). Other statistics can be chosen with --stat, and several of them
+  result in one column per algorithm and statistic, e.g., algoA_mean and algoA_ci95, which can be
+  used as error bars in pgfplots directly.
+
+  STAT is one of the following:
+      mean          arithmetic mean (default)
+      median        median
+      trimNN        mean without the lowest and highest NN percent, e.g., trim10
+      min, max      minimum or maximum
+      std           sample standard deviation
+      ci95          half width of the 95% confidence interval of the mean (t-distribution),
+                    i.e., the mean lies within mean +/- ci95
+  Spreads, i.e., std and ci95, always have three decimals, and they are 0 for a single value.
+
+  MEASURE is one of the following:
+      execution     execution time in ms (default)
+      planning      planning time in ms
+      total         planning and execution time in ms
+      rows          actual rows of the plan's root node
+      shared-hit    shared buffer hits of the plan (needs BUFFERS)
+      shared-read   shared buffer reads of the plan (needs BUFFERS)
+      node:TYPE     exclusive time in ms of all nodes of a type, e.g., node:Seq Scan or
+                    node:Hash Join, i.e., actual total time times loops without the child nodes
+"""
+
+# Lines of EXPLAIN ANALYZE outputs in text format, i.e., plan nodes with their actual times,
+# rows and loops, buffer usage, the planning section, and planning and execution times. Older
+# PostgreSQL versions use lower case times, and "Total runtime" instead of "Execution time".
+# All alternatives are a single pattern, such that each line is matched only once.
+PLAN_LINE_PATTERN = re.compile(
+    r"(?P<indent>\s*)(?:"
+    r"(?P<kind>Planning [Tt]ime|Execution [Tt]ime|Total runtime): (?P<ms>[\d.]+) ms"
+    r"|Buffers: (?P<buffers>.*)"
+    r"|(?P<planning>Planning:)\s*$"
+    r"|(?P<arrow>->\s+)?(?P<node>\S.*?)\s+"
+    r"(?:\(cost=\S+ rows=\d+ width=\d+\)\s*)?"
+    r"\((?:actual (?:time=[\d.]+\.\.(?P<time>[\d.]+) )?rows=(?P<rows>[\d.]+) "
+    r"loops=(?P<loops>\d+)|(?P<never>never executed))\))")
+PLAN_SHARED_PATTERN = re.compile(r"shared((?: (?:hit|read|dirtied|written)=\d+)+)")
+
+# Plan node names without their relations and indexes
+PLAN_NODE_TYPE_PATTERN = re.compile(r" (?:using|on) .*$")
+
+MEASURES = ['execution', 'planning', 'total', 'rows', 'shared-hit', 'shared-read']
+
+STATISTICS = ['mean', 'median', 'min', 'max', 'std', 'ci95']
+
+# Index file of --index, and changes of its format or of the indexed results
+INDEX_NAME = "psql2tsv"
+INDEX_VERSION = 2
+
+# Two-sided 95% quantiles of the t-distribution with 1 to 30 degrees of freedom
+T_QUANTILES_95 = [
+    12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+    2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+    2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042
+]
 
 def main():
 
-    if len(sys.argv) <= 2:
-        print("USAGE: res2tsv.py <prefix> list-of-files")
-        print()
-        print("  Extract from a list of files containing experiments (EXPLAIN ANALYZE) conducted with")
-        print("  PostgreSQL the execution time. Remove <prefix> from each filename, and choose the remaining")
-        print("  text as varying parameter name. The next token until an underscore (_) is the varying")
-        print("  parameter value, and the remainder is the algorithm name used as column name.")
-        print("  The full filename pattern looks like this: <prefix><parameter-name><parameter-value>_<algorithm>")
-        print()
-        print("  The result is then a table with the prefix as first column name, and all algorithms as follwing")
-        print("  column names. The cells contain the average of all execution times within a single file.")
-        print()
-        sys.exit(0)
+    parser = argparse.ArgumentParser(
+        usage="%(prog)s [options] <prefix> list-of-files",
+        description=DESCRIPTION,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+
+    parser.add_argument(
+        'prefix',
+        help='filename prefix, which is removed from each filename')
+
+    parser.add_argument(
+        'files',
+        nargs='+',
+        metavar='FILE',
+        help='experiment results (EXPLAIN ANALYZE outputs)')
+
+    parser.add_argument(
+        '--measure',
+        type=parseMeasure,
+        default='execution',
+        help='measure of each query plan, which is averaged per file (see '
+             'MEASURE below; default: %(default)s)')
+
+    parser.add_argument(
+        '--stat',
+        type=parseStatistics,
+        default=['mean'],
+        metavar='STAT[,STAT...]',
+        help='statistics of the measure within each file, one column per '
+             'algorithm and statistic (see STAT below; default: mean)')
+
+    parser.add_argument(
+        '--warmup',
+        type=int,
+        default=0,
+        metavar='N',
+        help='skip the first N query plans of each file, e.g., warm-up runs '
+             'with cold caches (default: %(default)s)')
+
+    parser.add_argument(
+        '--pivot',
+        metavar='NAME',
+        help='parameter, whose values become columns of each algorithm '
+             'instead of rows')
+
+    parser.add_argument(
+        '--jobs',
+        type=int,
+        default=os.cpu_count(),
+        metavar='N',
+        help='number of files, which are read at the same time (default: '
+             'number of CPUs)')
+
+    parser.add_argument(
+        '--pool',
+        choices=['process', 'thread'],
+        default='process',
+        help='read files in processes, or in threads, e.g., for many small '
+             'files on network storage (default: %(default)s)')
+
+    parser.add_argument(
+        '--index',
+        action='store_true',
+        help='keep the parsed query plans of each file in the index file, '
+             'and read only new or changed files, i.e., if their size or '
+             'modification time and their content changed')
+
+    parser.add_argument(
+        '--index-file',
+        metavar='FILE',
+        default=getDefaultIndexFile(INDEX_NAME),
+        help='SQLite database of --index (default: %(default)s)')
+
+    args = parser.parse_args()
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    if args.warmup < 0:
+        parser.error("--warmup must not be negative")
 
     # Collect data
-    results = {}
-    algorithms = []
-    parameters = []
-    prefix = sys.argv[1]
-    for arg in sys.argv[2:]:
-        sum = 0
-        count = 0
-        with open(arg, 'r') as f:
-            try:
-                for line in f:
-                    if re.search("xecution", line):
-                        sum += float(line.split()[2])
-                        count += 1
-            except:
-                continue
-        filename = os.path.basename(arg)
-        m = re.match(r"%s([a-zA-Z0-9]+)_(.*)" % prefix, filename)
-        if m:
-            g = m.groups()
-            varying = g[0]
-            algo = g[1]
-            if not algo in algorithms:
-                algorithms.append(algo)
-            if not varying in parameters:
-                parameters.append(varying)
-
-            if varying in results:
-                results[varying][algo] = round(sum/count)
+    cube = None
+    prefix = args.prefix
+    filenamePattern = re.compile(r"%s((?:[a-zA-Z]+[0-9]+)+)_(.*)" % prefix)
+    if args.index:
+        index = ResultIndex(args.index_file, INDEX_NAME, INDEX_VERSION)
+        filePlans = index.map(readPlans, args.files, args.files, "", args.jobs, args.pool)
+    else:
+        filePlans = mapFiles(readPlans, args.files, args.jobs, args.pool)
+    for arg, plans in zip(args.files, filePlans):
+        values = [value for value in (getMeasure(plan, args.measure) for plan in plans[args.warmup:])
+                  if value is not None]
+        if len(values) == 0:
+            if 0 < len(plans) <= args.warmup:
+                printWarning("All %d query plans of '%s' are dropped as warm-up. Skipping it." %
+                             (len(plans), arg))
             else:
-                results[varying] = {algo: round(sum/count)}
+                printWarning("No %s found in '%s'. Skipping it." % (args.measure, arg))
+            continue
+        cells = [formatStatistic(statistic, values, args.measure == 'execution')
+                 for statistic in args.stat]
+        filename = os.path.basename(arg)
+        m = filenamePattern.match(filename)
+        if not m:
+            printWarning("Prefix '%s' does not match with filename '%s'. Skipping it." % (prefix, filename))
+            continue
+        var = re.findall(r"([a-zA-Z]+)([0-9]+)", m.group(1))
+        names = tuple(name for name, _ in var)
+        if cube is None:
+            cube = ResultCube(names)
+        elif names != cube.names:
+            printErrorAndExit("Parameter name mismatch. First it was '%s', then '%s'." %
+                              ("".join(cube.names), "".join(names)))
+        cube.add(tuple(int(value) for _, value in var), m.group(2), cells)
 
-        headerVar = []
-        var = re.split(r"([a-zA-Z]+)([0-9]+)", varying)
-        for i in range(0, len(var)-1, 3):
-            headerVar.append(var[i+1])
+    if cube is None:
+        printErrorAndExit("No results found.")
+    if args.pivot is not None and args.pivot not in cube.names:
+        printErrorAndExit("Parameter '%s' to pivot not found. Parameters are: %s" %
+                          (args.pivot, ", ".join(cube.names)))
+    names, columns, rows = cube.table(args.pivot)
 
     # Print header
-    print("\t".join(headerVar), end='')
-    for a in algorithms:
-        print("\t%s" % a, end='')
-    print()
-
-    # Print data lines (first field = varying parameter)
-    for parameter in parameters:
-        var = re.split(r"([a-zA-Z]+)([0-9]+)", parameter)
-        for i in range(0, len(var)-1, 3):
-            print("%d\t" % int(var[i+2]), end='')
-        res = results[parameter]
-        for a in algorithms:
-            print("%d\t" % res[a], end='')
+    header = list(names)
+    for a, value in columns:
+        column = a if value is None else "%s_%s%d" % (a, args.pivot, value)
+        if len(args.stat) == 1:
+            header.append(column)
+        else:
+            header.extend("%s_%s" % (column, statistic) for statistic in args.stat)
+    print("\t".join(header))
+
+    # Print data lines (first fields = parameter values)
+    missing = ["nan"] * len(args.stat)
+    for values, res in rows:
+        for value in values:
+            print("%d\t" % value, end='')
+        for column in columns:
+            for cell in res.get(column, missing):
+                print("%s\t" % cell, end='')
         print()
 
+class ResultCube:
+    """Cells of the results of each algorithm, indexed by the values of the
+    parameters (a tuple in the order of their names), and the algorithm.
+    Algorithms keep the order of their first result."""
+
+    def __init__(self, names):
+        self.names = names
+        self.algorithms = []
+        self.cells = {}
+
+    def add(self, values, algorithm, cells):
+        if algorithm not in self.algorithms:
+            self.algorithms.append(algorithm)
+        self.cells[(values, algorithm)] = cells
+
+    def table(self, pivot=None):
+        """Parameter names, columns and rows of a table. Columns are pairs of
+        algorithm and value of the pivot parameter, or None without one. Rows
+        are pairs of parameter values without the pivot, sorted numerically,
+        and their cells by column. Missing cells are left out."""
+        index = None if pivot is None else self.names.index(pivot)
+        names = tuple(name for i, name in enumerate(self.names) if i != index)
+        rows = {}
+        columns = set()
+        for (values, algorithm), cells in self.cells.items():
+            if index is None:
+                column = (algorithm, None)
+            else:
+                column = (algorithm, values[index])
+                values = values[:index] + values[index + 1:]
+            rows.setdefault(values, {})[column] = cells
+            columns.add(column)
+        order = {algorithm: i for i, algorithm in enumerate(self.algorithms)}
+        columns = sorted(columns, key=lambda column: (order[column[0]], column[1] or 0))
+        return names, columns, sorted(rows.items())
+
+def printErrorAndExit(msg):
+    print(os.path.basename(sys.argv[0]) + ": ERROR: " + msg, file=sys.stderr, flush=True)
+    sys.exit(1)
+
+def printWarning(msg):
+    print(os.path.basename(sys.argv[0]) + ": WARNING: " + msg, file=sys.stderr, flush=True)
+
+def parseMeasure(text):
+    if text in MEASURES or (text.startswith("node:") and len(text) > 5):
+        return text
+    raise argparse.ArgumentTypeError("invalid measure: '%s'" % text)
+
+def parseStatistics(text):
+    statistics = text.split(",")
+    for statistic in statistics:
+        m = re.fullmatch(r"trim([0-9]+)", statistic)
+        if statistic not in STATISTICS and not (m and int(m.group(1)) < 50):
+            raise argparse.ArgumentTypeError("invalid statistic: '%s'" % statistic)
+    return statistics
+
+def formatStatistic(statistic, values, rounded=False):
+    """Cell text of a statistic of the values of a file (see
+    computeStatistic). Spreads keep three decimals, and so do locations
+    unless they are rounded, like execution times in whole ms."""
+    value = computeStatistic(statistic, values)
+    if rounded and statistic not in ('std', 'ci95'):
+        return "%d" % round(value)
+    return "%.3f" % value
+
+def computeStatistic(statistic, values):
+    """Statistic (see parseStatistics) of the values of a file. Spreads of a
+    single value are zero."""
+    count = len(values)
+    if statistic == 'mean':
+        total = 0
+        for value in values:
+            total += value
+        return total / count
+    if statistic == 'min':
+        return min(values)
+    if statistic == 'max':
+        return max(values)
+    if statistic in ('std', 'ci95'):
+        if count < 2:
+            return 0.0
+        mean = math.fsum(values) / count
+        std = math.sqrt(math.fsum((value - mean) ** 2 for value in values) / (count - 1))
+        if statistic == 'std':
+            return std
+        return tQuantile95(count - 1) * std / math.sqrt(count)
+
+    values = sorted(values)
+    if statistic == 'median':
+        middle = count // 2
+        if count % 2 == 1:
+            return values[middle]
+        return (values[middle - 1] + values[middle]) / 2
+
+    # Trimmed mean, which keeps at least one value
+    trimmed = min(count * int(statistic[4:]) // 100, (count - 1) // 2)
+    values = values[trimmed:count - trimmed]
+    return math.fsum(values) / len(values)
+
+def tQuantile95(df):
+    """Two-sided 95% quantile of the t-distribution, i.e., of its 97.5%
+    percentile. Above the table, the Cornish-Fisher expansion around the
+    normal distribution is off by less than 0.001."""
+    if df <= len(T_QUANTILES_95):
+        return T_QUANTILES_95[df - 1]
+    z = 1.959964
+    return (z + (z ** 3 + z) / (4 * df)
+            + (5 * z ** 5 + 16 * z ** 3 + 3 * z) / (96 * df ** 2))
+
+def getMeasure(plan, measure):
+    """Value of a measure of a query plan (see readPlans), or None if the plan
+    does not have it"""
+    if measure == 'total':
+        if plan['planning'] is None or plan['execution'] is None:
+            return None
+        return plan['planning'] + plan['execution']
+    if measure.startswith("node:"):
+        return plan['nodes'].get(measure[5:], 0.0)
+    return plan[measure]
+
+def readPlans(filename):
+    """Read all EXPLAIN ANALYZE outputs of a file in text format in a single
+    pass. Each query plan ends with its execution time, and holds its planning
+    and execution time, the actual rows and shared buffers of its root node,
+    and the exclusive time of each node type (see addPlanNode). Other lines are
+    skipped."""
+    plans = []
+    plan = newPlan()
+    nodes = []                  # Stack of [indent, type, exclusive time] of the current branch
+    planning = False            # Buffers belong to the planning
+    with open(filename, 'r', errors='replace') as f:
+        for line in f:
+            m = PLAN_LINE_PATTERN.match(line)
+            if m is None:
+                continue
+
+            if m.group('node') is not None:
+                if m.group('arrow') is None and len(nodes) > 0:
+                    # A root node without execution time, e.g., a plan of an
+                    # older EXPLAIN, which was cut off
+                    plan = newPlan()
+                    nodes = []
+                addPlanNode(plan, nodes, m)
+                planning = False
+            elif m.group('buffers') is not None:
+                if not planning and len(nodes) == 1 and plan['shared-hit'] is None:
+                    hit, read = parseSharedBuffers(m.group('buffers'))
+                    plan['shared-hit'] = hit
+                    plan['shared-read'] = read
+            elif m.group('planning') is not None:
+                planning = True
+            else:
+                if m.group('kind').startswith("Planning"):
+                    plan['planning'] = float(m.group('ms'))
+                else:
+                    plan['execution'] = float(m.group('ms'))
+                    closePlanNodes(plan, nodes, -1)
+                    plans.append(plan)
+                    plan = newPlan()
+                    nodes = []
+                planning = False
+    return plans
+
+def newPlan():
+    return {
+        'planning'      : None,
+        'execution'     : None,
+        'rows'          : None,
+        'shared-hit'    : None,
+        'shared-read'   : None,
+        'nodes'         : {}
+    }
+
+def addPlanNode(plan, nodes, m):
+    """Add a node line of a plan (see PLAN_LINE_PATTERN). Nodes are nested by
+    their indentation, and each node's time (actual total time times loops)
+    is subtracted from its parent, such that each node gets its exclusive
+    time (see closePlanNodes). Nodes without timing, e.g., with TIMING OFF,
+    count as zero."""
+    indent = len(m.group('indent'))
+    closePlanNodes(plan, nodes, indent)
+
+    nodeType = PLAN_NODE_TYPE_PATTERN.sub("", m.group('node'))
+    time = None
+    if m.group('time') is not None:
+        time = float(m.group('time')) * int(m.group('loops'))
+        if len(nodes) > 0 and nodes[-1][2] is not None:
+            nodes[-1][2] -= time
+    if len(nodes) == 0 and m.group('never') is None:
+        plan['rows'] = float(m.group('rows'))
+
+    # Children are indented further than the text of their parent node
+    textIndent = indent + (len(m.group('arrow')) if m.group('arrow') else 0)
+    nodes.append([textIndent, nodeType, time])
+
+def closePlanNodes(plan, nodes, indent):
+    """Add the exclusive time of each node, which ends before a node at the
+    given indentation, to its type. Actual times are averages per loop with
+    three decimals, hence a node with many loops, e.g., the inner index scan
+    of a nested loop, may exceed its parent. Exclusive times are therefore at
+    least zero."""
+    while len(nodes) > 0 and nodes[-1][0] >= indent:
+        _, nodeType, time = nodes.pop()
+        plan['nodes'][nodeType] = plan['nodes'].get(nodeType, 0.0) + max(time or 0.0, 0.0)
+
+def parseSharedBuffers(buffers):
+    """Shared buffer hits and reads of a Buffers line"""
+    hit = 0
+    read = 0
+    m = PLAN_SHARED_PATTERN.search(buffers)
+    if m:
+        for item in m.group(1).split():
+            key, value = item.split("=")
+            if key == 'hit':
+                hit = int(value)
+            elif key == 'read':
+                read = int(value)
+    return hit, read
+
 if __name__ == '__main__':
     main()
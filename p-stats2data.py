@@ -9,6 +9,30 @@ Created on Tue Sep 12 10:13:43 2017
 import sys
 import re
 import os
+import argparse
+
+from pwresults import ResultIndex, getDefaultIndexFile, mapFiles
+
+DESCRIPTION = """
+  Extract from a list of files containing experiments (TSV)
+  the execution time. Remove <prefix> from each filename, and choose the remaining
+  text as varying parameter name.
+  The full filename pattern looks like this: <prefix><parameter-name><parameter-value>
+
+  The result is then a table with the prefix as first column name, and all algorithms as following
+  column names. The cells contain the average of all execution times of the last experiment run
+  within the files of each parameter value (see --stat and --runs).
+"""
+
+# Values per level of quantile sketches, i.e., quantiles of smaller runs are exact
+SKETCH_SIZE = 256
+
+# Distinct result count cells, which are kept parsed
+PARSER_CACHE_SIZE = 4096
+
+# Index file of --index, and changes of its format or of the indexed results
+INDEX_NAME = "stats2data"
+INDEX_VERSION = 1
 
 def natural_sort_key(s, _nsre=re.compile('([0-9]+)')):
     return [int(text) if text.isdigit() else text.lower()
@@ -20,32 +44,86 @@ def printErrorAndExit(msg):
 
 def main():
 
-    if len(sys.argv) <= 2:
-        print("USAGE: pw_stats2data.py <prefix> list-of-files")
-        print()
-        print("  Extract from a list of files containing experiments (TSV)")
-        print("  the execution time. Remove <prefix> from each filename, and choose the remaining")
-        print("  text as varying parameter name.")
-        print("  The full filename pattern looks like this: <prefix><parameter-name><parameter-value>")
-        print()
-        print("  The result is then a table with the prefix as first column name, and all algorithms as following")
-        print("  column names. The cells contain the average of all execution times within a single file.")
-        print()
-        sys.exit(0)
+    parser = argparse.ArgumentParser(
+        usage="%(prog)s [options] <prefix> list-of-files",
+        description=DESCRIPTION,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+
+    parser.add_argument(
+        'prefix',
+        help='filename prefix, which is removed from each filename')
+
+    parser.add_argument(
+        'files',
+        nargs='+',
+        metavar='FILE',
+        help='experiment results (TSV)')
+
+    parser.add_argument(
+        '--stat',
+        type=parseStatistic,
+        default='mean',
+        metavar='STAT',
+        help='statistic of the execution times in each cell: mean, std '
+             '(sample standard deviation), min, max, median, or a percentile '
+             'pNN, e.g., p99 (default: %(default)s)')
+
+    parser.add_argument(
+        '--runs',
+        choices=['last', 'all'],
+        default='last',
+        help='experiment runs of each algorithm and parameter value, i.e., '
+             'the last one, which overwrites older ones, or all of them '
+             '(default: %(default)s)')
+
+    parser.add_argument(
+        '--jobs',
+        type=int,
+        default=os.cpu_count(),
+        metavar='N',
+        help='number of files, which are read at the same time (default: '
+             'number of CPUs)')
+
+    parser.add_argument(
+        '--pool',
+        choices=['process', 'thread'],
+        default='process',
+        help='read files in processes, or in threads, e.g., for many small '
+             'files on network storage (default: %(default)s)')
+
+    parser.add_argument(
+        '--index',
+        action='store_true',
+        help='keep the statistics of the runs of each file in the index '
+             'file, and read only new or changed files, i.e., if their size '
+             'or modification time and their content changed')
+
+    parser.add_argument(
+        '--index-file',
+        metavar='FILE',
+        default=getDefaultIndexFile(INDEX_NAME),
+        help='SQLite database of --index (default: %(default)s)')
+
+    args = parser.parse_args()
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
 
     # Collect data
-    # Results have the following hierarchy: parameterValue > algo > [runtimesum, experimentcount, resultcount]
+    # Results have the following hierarchy: parameterValue > algo > list of RunStatistics
     # For example: parameterName = 'N' and the value is the cardinality, so we have a table as follows:
-    #    10     algoA    [10, 2, 200]
+    #    10     algoA    [RunStatistics(run 0), RunStatistics(run 1)]
     #           algoB    [...]
     #    20     algoA    ...
+    # The last run of each list is the current one.
     results = {}
     algorithms = []
     parameters = []
     parameterName = "X"
     oldParameterName = None
-    prefix = sys.argv[1]
-    for arg in sys.argv[2:]:
+    prefix = args.prefix
+    keepRuns = args.runs == 'all'
+    fileParameters = []
+    for arg in args.files:
 
         if not os.path.exists(arg):
             printErrorAndExit("File '%s' does not exist." % arg)
@@ -64,45 +142,24 @@ def main():
         elif parameterName != oldParameterName:
             printErrorAndExit("Parameter name mismatch. First it was '%s', then '%s'." % (oldParameterName, parameterName))
 
-        if not parameterName in parameters:
-            parameters.append(parameterValue)
-
         if not parameterValue in results:
+            parameters.append(parameterValue)
             results[parameterValue] = {}
+        fileParameters.append(parameterValue)
 
-        expRun = 0
-
-        # Read the contents of the file
-        with open(arg, 'r') as f:
-            try:
-                for line in f:
-                    try:
-                        cells = line.split("\t")
-                        algo = os.path.basename(cells[0])
-
-                        # We added timesplit to the results recently, hence result counts are at pos 7 now
-                        # Before that, they were at pos 7 (since pos 8 is a filename/path we can simply check casting
-                        # errors)
-                        try:
-                            resultCount = int(float(cells[8]))
-                        except:
-                            resultCount = int(float(cells[7]))
-
-                        if not algo in algorithms:
-                            algorithms.append(algo)
-
-                        # Experiment run deterimens if we must overwrite an older experiment
-                        if algo in results[parameterValue] and expRun in results[parameterValue][algo]:
-                            results[parameterValue][algo][expRun][0] += int(cells[1])
-                            results[parameterValue][algo][expRun][1] += 1
-                        else:
-                            results[parameterValue][algo] = {expRun : [int(cells[1]), 1, resultCount]}
-                    except:
-                        expRun += 1
-                        continue
-            except:
-                continue
+    # Read all files at the same time, and merge them in the given order
+    tasks = [(arg, keepRuns) for arg in args.files]
+    if args.index:
+        index = ResultIndex(args.index_file, INDEX_NAME, INDEX_VERSION)
+        filesRuns = index.map(readRuns, tasks, args.files, "runs=%s" % args.runs,
+                              args.jobs, args.pool)
+    else:
+        filesRuns = mapFiles(readRuns, tasks, args.jobs, args.pool)
+    for parameterValue, fileRuns in zip(fileParameters, filesRuns):
+        mergeFileRuns(results[parameterValue], algorithms, fileRuns, keepRuns)
 
+    if len(algorithms) == 0:
+        printErrorAndExit("No results found.")
 
     # Print header
     print(parameterName, end='')
@@ -115,24 +172,261 @@ def main():
     for parameter in sorted(parameters, key=natural_sort_key):
         print(parameter + "\t", end='')
         res = results[parameter]
-        # print(parameter)
-        # print(res)
-        try:
-            val = next(iter(res[algorithms[0]].values()))
-            resultCount = val[2]
-        except:
+        if not algorithms[0] in res:
             printErrorAndExit("Algorithm %s not found in results." % algorithms[0])
+        resultCount = mergeRuns(res[algorithms[0]]).resultCount
 
         for a in algorithms:
             if a in res:
-                val = next(iter(res[a].values()))
-                print("%d\t" % int(float(val[0]) / val[1]), end='')
-                if resultCount != val[2]:
+                val = mergeRuns(res[a])
+                print("%s\t" % val.format(args.stat), end='')
+                if resultCount != val.resultCount:
                     printErrorAndExit("Different result counts for the same parameter-value found!")
             else:
                 print("nan\t", end='')
 
         print("%d" % resultCount)
 
+def parseStatistic(text):
+    """Statistic of --stat, where percentiles pNN become their fraction"""
+    if text in ['mean', 'std', 'min', 'max']:
+        return text
+    if text == 'median':
+        return 0.5
+    m = re.fullmatch(r"p([0-9]+(\.[0-9]*)?)", text)
+    if not m or float(m.group(1)) > 100:
+        raise argparse.ArgumentTypeError("invalid statistic: '%s'" % text)
+    return float(m.group(1)) / 100
+
+def readRuns(task):
+    """Statistics of the execution times of each algorithm and experiment run
+    of a file, in the order of the algorithms' first appearance. Lines, which
+    are no results, e.g., headers, separate the runs. Unless we keep all runs,
+    only the first and the last run of each algorithm are returned, since
+    later runs overwrite older ones (see mergeFileRuns)."""
+    filename, keepRuns = task
+    expRun = 0
+    results = {}
+    parser = LineParser()
+    with open(filename, 'r') as f:
+        try:
+            for line in f:
+                values = parser.parse(line)
+                if values is None:
+                    expRun += 1
+                    continue
+                algo, runtime, resultCount = values
+
+                runs = results.get(algo)
+                if runs is None:
+                    runs = results[algo] = []
+
+                # Experiment run determines if we must overwrite an older experiment
+                if len(runs) == 0 or runs[-1].run != expRun:
+                    if not keepRuns and len(runs) == 2:
+                        runs.pop()
+                    runs.append(RunStatistics(expRun, resultCount))
+                runs[-1].add(runtime)
+        except UnicodeDecodeError:
+            # The remainder of files with binary data is no result
+            pass
+    return results
+
+def mergeFileRuns(results, algorithms, fileRuns, keepRuns=False):
+    """Merge the runs of a file (see readRuns) into the runs of all previous
+    files of the same parameter value. The first run of a file continues the
+    current run of an algorithm with the same run number, i.e., as if all
+    files were read one after another."""
+    for algo, runs in fileRuns.items():
+        if not algo in algorithms:
+            algorithms.append(algo)
+        current = results.setdefault(algo, [])
+        if len(current) > 0 and current[-1].run == runs[0].run:
+            current[-1].merge(runs[0])
+            runs = runs[1:]
+        for run in runs:
+            if not keepRuns:
+                current.clear()
+            current.append(run)
+
+class LineParser:
+    """Parser of result lines into algorithm, execution time and result count.
+    Algorithm paths and result counts repeat from line to line, hence we
+    parse each distinct cell once only."""
+
+    def __init__(self):
+        self.names = {}
+        self.counts = {}
+
+    def parse(self, line):
+        """Values of a result line, or None for any other line"""
+        cells = line.split("\t")
+        if len(cells) < 8:
+            return None
+        try:
+            runtime = int(cells[1])
+        except ValueError:
+            return None
+
+        # We added timesplit to the results recently, hence result counts are at pos 8 now
+        # Before that, they were at pos 7 (since pos 8 is a filename/path we can simply check casting
+        # errors)
+        resultCount = self.parseCount(cells[8]) if len(cells) > 8 else None
+        if resultCount is None:
+            resultCount = self.parseCount(cells[7])
+            if resultCount is None:
+                return None
+
+        algo = self.names.get(cells[0])
+        if algo is None:
+            algo = self.names[cells[0]] = os.path.basename(cells[0])
+        return algo, runtime, resultCount
+
+    def parseCount(self, cell):
+        try:
+            return self.counts[cell]
+        except KeyError:
+            pass
+        try:
+            count = int(float(cell))
+        except (ValueError, OverflowError):
+            count = None
+        # Unique cells, e.g., paths, must not fill up the memory
+        if len(self.counts) >= PARSER_CACHE_SIZE:
+            self.counts.clear()
+        self.counts[cell] = count
+        return count
+
+def mergeRuns(runs):
+    """Statistics of all runs together, which must have the same result count"""
+    if len(runs) == 1:
+        return runs[0]
+    merged = RunStatistics(None, runs[0].resultCount)
+    for run in runs:
+        if run.resultCount != merged.resultCount:
+            printErrorAndExit("Different result counts for the same parameter-value found!")
+        merged.merge(run)
+    return merged
+
+class RunStatistics:
+    """Statistics of the execution times of an experiment run, which are
+    updated in a single pass: count, exact sum, minimum, maximum, mean and
+    variance, and quantiles (see QuantileSketch). New values are folded in
+    batches with Welford-style updates (Chan et al.), such that most values
+    just get appended to a list."""
+
+    def __init__(self, run, resultCount):
+        self.run = run
+        self.resultCount = resultCount
+        self.count = 0
+        self.total = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+        self.sketch = QuantileSketch()
+        self.pending = []
+
+    def add(self, value):
+        self.pending.append(value)
+        if len(self.pending) >= SKETCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        values = self.pending
+        if len(values) == 0:
+            return
+        self.pending = []
+        count = len(values)
+        total = sum(values)
+        mean = total / count
+        m2 = sum((value - mean) ** 2 for value in values)
+        self.__merge__(count, total, mean, m2, min(values), max(values))
+        self.sketch.extend(values)
+
+    def merge(self, other):
+        self.flush()
+        other.flush()
+        self.__merge__(other.count, other.total, other.mean, other.m2,
+                       other.min, other.max)
+        self.sketch.merge(other.sketch)
+
+    def __merge__(self, count, total, mean, m2, low, high):
+        # Parallel variance by Chan et al.
+        if count == 0:
+            return
+        if self.count > 0:
+            delta = mean - self.mean
+            m2 += self.m2 + delta * delta * self.count * count / (self.count + count)
+            mean = self.mean + delta * count / (self.count + count)
+            low = min(self.min, low)
+            high = max(self.max, high)
+        self.count += count
+        self.total += total
+        self.mean = mean
+        self.m2 = m2
+        self.min = low
+        self.max = high
+
+    def format(self, statistic):
+        """Cell text of a statistic (see parseStatistic)"""
+        self.flush()
+        if statistic == 'mean':
+            return "%d" % int(float(self.total) / self.count)
+        if statistic == 'std':
+            if self.count < 2:
+                return "%.3f" % 0
+            return "%.3f" % (self.m2 / (self.count - 1)) ** 0.5
+        if statistic == 'min':
+            return "%d" % self.min
+        if statistic == 'max':
+            return "%d" % self.max
+        return "%d" % self.sketch.quantile(statistic)
+
+class QuantileSketch:
+    """KLL-style quantile sketch: Level i holds values, which stand for 2**i
+    values each. A full level is sorted, and every other value moves up to the
+    next level, starting at the first or second in turns."""
+
+    def __init__(self):
+        self.levels = [[]]
+        self.offset = 0
+
+    def extend(self, values):
+        self.levels[0].extend(values)
+        self.compact(0)
+
+    def merge(self, other):
+        for level, values in enumerate(other.levels):
+            if level == len(self.levels):
+                self.levels.append([])
+            self.levels[level].extend(values)
+            self.compact(level)
+
+    def compact(self, level):
+        while len(self.levels[level]) > SKETCH_SIZE:
+            # An odd value stays, such that no weight gets lost
+            values = sorted(self.levels[level])
+            odd = len(values) % 2
+            self.levels[level] = values[len(values) - odd:]
+            if level + 1 == len(self.levels):
+                self.levels.append([])
+            self.levels[level + 1].extend(values[self.offset:len(values) - odd:2])
+            self.offset = 1 - self.offset
+            level += 1
+
+    def quantile(self, q):
+        """Smallest value, such that a q-th of all values are smaller or equal"""
+        weighted = sorted((value, 1 << level)
+                          for level, values in enumerate(self.levels)
+                          for value in values)
+        total = sum(weight for _, weight in weighted)
+        cumulative = 0
+        for value, weight in weighted:
+            cumulative += weight
+            if cumulative >= q * total:
+                return value
+        return weighted[-1][0]
+
 if __name__ == '__main__':
     main()
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+Reading of result files in parallel, and the index of --index, which
+p-stats2data.py and p-psql2tsv.py share. It is kept next to the scripts, which
+import it from there.
+"""
+
+import concurrent.futures
+import hashlib
+import os
+import pickle
+import sqlite3
+
+def mapFiles(function, tasks, jobs, pool='process'):
+    """Map the tasks of several files in a process or thread pool with up to
+    jobs workers, or one after another. Results keep the order of tasks."""
+    jobs = min(jobs, len(tasks))
+    if jobs <= 1:
+        return list(map(function, tasks))
+    if pool == 'thread':
+        with concurrent.futures.ThreadPoolExecutor(jobs) as executor:
+            return list(executor.map(function, tasks))
+    with concurrent.futures.ProcessPoolExecutor(jobs) as executor:
+        # Batches of files save round trips for many small files
+        return list(executor.map(function, tasks,
+                                 chunksize=max(1, len(tasks) // (4 * jobs))))
+
+def getDefaultIndexFile(name):
+    """Index file of the program name inside the user's cache home (see XDG
+    base directories)"""
+    home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(home, "pwscripts", "%s.sqlite" % name)
+
+def hashFile(filename):
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def hashAndRead(task):
+    """Content hash of a file and the result of a function for its task"""
+    function, filename, fileTask = task
+    return hashFile(filename), function(fileTask)
+
+class ResultIndex:
+    """SQLite database of the results of files, e.g., of readRuns of
+    p-stats2data.py or readPlans of p-psql2tsv.py, keyed by the program
+    (name), the absolute path of each file, and the options, which change
+    results. Each file keeps its size, modification time and content hash,
+    and is read again only if its size changed, or its modification time and
+    its content changed. Results of other versions of the program (version),
+    and of files, which do not exist anymore, are removed, when the index is
+    opened. Results of other options are kept, such that switching between
+    options does not read all files again. Hence, several programs may share
+    an index file."""
+
+    # Changes of the table, which are the same for all programs
+    FORMAT = 2
+
+    def __init__(self, filename, name, version):
+        self.name = name
+        self.version = version
+        dirname = os.path.dirname(filename)
+        if dirname != "":
+            os.makedirs(dirname, exist_ok=True)
+        self.db = sqlite3.connect(filename, timeout=60)
+        if self.db.execute("PRAGMA user_version").fetchone()[0] != ResultIndex.FORMAT:
+            self.db.execute("DROP TABLE IF EXISTS files")
+            self.db.execute("CREATE TABLE files (program TEXT, version INTEGER, path TEXT, "
+                            "options TEXT, size INTEGER, mtime INTEGER, hash TEXT, result BLOB, "
+                            "PRIMARY KEY (program, path, options))")
+            self.db.execute("PRAGMA user_version = %d" % ResultIndex.FORMAT)
+        self.db.execute("DELETE FROM files WHERE program = ? AND version != ?",
+                        (self.name, self.version))
+        missing = [(self.name, path) for path, in self.db.execute(
+            "SELECT DISTINCT path FROM files WHERE program = ?", (self.name,))
+            if not os.path.exists(path)]
+        self.db.executemany("DELETE FROM files WHERE program = ? AND path = ?", missing)
+        self.db.commit()
+
+    def map(self, function, tasks, filenames, options, jobs, pool='process'):
+        """Results of function for the task of each file like mapFiles, where
+        only new or changed files are read (in parallel), and added to the
+        index."""
+        results = [None] * len(tasks)
+        changed = []
+        rows = {row[0]: row[1:] for row in self.db.execute(
+            "SELECT path, size, mtime, hash, result FROM files "
+            "WHERE program = ? AND version = ? AND options = ?",
+            (self.name, self.version, options))}
+        for i, filename in enumerate(filenames):
+            # Each file has a single row, however it is named
+            path = os.path.abspath(filename)
+            st = os.stat(filename)
+            row = rows.get(path)
+            if row is not None and row[0] == st.st_size:
+                # Touched or copied files keep their results
+                if row[1] == st.st_mtime_ns or row[2] == hashFile(filename):
+                    results[i] = self.load(row[3])
+                if results[i] is not None:
+                    if row[1] != st.st_mtime_ns:
+                        self.db.execute("UPDATE files SET mtime = ? "
+                                        "WHERE program = ? AND path = ? AND options = ?",
+                                        (st.st_mtime_ns, self.name, path, options))
+                    continue
+            changed.append((i, path, st))
+
+        hashedResults = mapFiles(hashAndRead,
+                                 [(function, filenames[i], tasks[i]) for i, _, _ in changed],
+                                 jobs, pool)
+        for (i, path, st), (digest, result) in zip(changed, hashedResults):
+            results[i] = result
+            self.db.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                            (self.name, self.version, path, options, st.st_size,
+                             st.st_mtime_ns, digest,
+                             pickle.dumps(result, pickle.HIGHEST_PROTOCOL)))
+        self.db.commit()
+        return results
+
+    def load(self, result):
+        """Result of the index, or None if it cannot be restored, e.g., if a
+        class of the result changed without a new version"""
+        try:
+            return pickle.loads(result)
+        except Exception:
+            return None
@@ -0,0 +1,22 @@
+-- Temporal aligner with ranges, points and values with delimiters
+
+-- TIKZ: relation, r, ts, te,, Input relation r
+SELECT * FROM r ORDER BY 1, 2;
+
+-- TIKZ: relation, s, t,,, Input relation s with ranges
+SELECT a, t FROM s ORDER BY 1, 2;
+
+-- TIKZ: relation, p, t,,, Events
+SELECT a, t FROM p ORDER BY 1, 2;
+
+-- TIKZ: timeline, 0, 10, 1, time
+-- TIKZ: relation-table, q, ts, te, y, Result of query 1
+SELECT * FROM q ORDER BY 1, 2;
+
+-- TIKZ: config, label, label0001
+-- TIKZ: config, caption, test text with {asdf} \bfseries x
+-- TIKZ: config, tablecaption, Table
+-- TIKZ: config, tablelabel, tab0001
+-- TIKZ: config, graphcaption, Graph
+-- TIKZ: config, graphlabel, fig0001
+-- TIKZ: config, xscale, 0.5
@@ -0,0 +1,83 @@
+"""Helpers of the tests of the Python scripts in the repository root.
+
+The scripts have dashes in their names, hence they cannot be imported
+directly. load_script imports them as modules with underscores instead, e.g.,
+p-psql2latex.py as p_psql2latex, and run_script runs them as processes, as
+from the command line. Expected outputs of features, which exist since the
+first version of a script, have been created by that version, and are kept in
+the data directory."""
+
+import importlib.util
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA = os.path.join(ROOT, 'tests', 'data')
+
+# Scripts import shared modules next to them, e.g., pwresults
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+def load_script(name):
+    """Import the script name, e.g., p-psql2latex, as module. Modules are put
+    into sys.modules, such that pickled objects of them can be read again."""
+    module_name = name.replace('-', '_')
+    if module_name not in sys.modules:
+        spec = importlib.util.spec_from_file_location(
+            module_name, os.path.join(ROOT, name + '.py'))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[module_name] = module
+        spec.loader.exec_module(module)
+    return sys.modules[module_name]
+
+
+def run_script(name, *args, stdin=None, cwd=None, env=None, check=True):
+    """Run the script name with the command line args, and return the
+    completed process with its output as text. Cache directories are put into
+    a temporary directory, unless env sets XDG_CACHE_HOME."""
+    environ = dict(os.environ)
+    environ['XDG_CACHE_HOME'] = _CACHE_HOME.name
+    environ.update(env or {})
+    process = subprocess.run(
+        [sys.executable, os.path.join(ROOT, name + '.py')] + list(args),
+        stdin=stdin, cwd=cwd, env=environ, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        universal_newlines=True)
+    if check and process.returncode != 0:
+        raise AssertionError("%s %s failed with exit code %d:\n%s" % (
+            name, " ".join(args), process.returncode, process.stderr))
+    return process
+
+
+def data_file(name):
+    return os.path.join(DATA, name)
+
+
+def read_file(filename, mode='r'):
+    with open(filename, mode) as f:
+        return f.read()
+
+
+class ScriptTestCase(unittest.TestCase):
+    """Test case with a temporary directory self.tmp for each test."""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = tmp.name
+
+    def path(self, *names):
+        return os.path.join(self.tmp, *names)
+
+    def write(self, name, content, mode='w'):
+        filename = self.path(name)
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        with open(filename, mode) as f:
+            f.write(content)
+        return filename
+
+
+_CACHE_HOME = tempfile.TemporaryDirectory()
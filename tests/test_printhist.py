@@ -0,0 +1,352 @@
+"""Tests of p-printhist.py
+
+The expected outputs intervals-*.csv and intervals.txt have been created by
+the first version of p-printhist.py, which wrote the start and ending points
+into each other's files, and had no data histograms."""
+
+import importlib.util
+import math
+import os
+import unittest
+
+from helpers import ScriptTestCase, data_file, load_script, read_file, run_script
+
+if importlib.util.find_spec('numpy') is None:
+    raise unittest.SkipTest("p-printhist.py needs numpy")
+
+import numpy as np
+
+printhist = load_script('p-printhist')
+
+TYPES = ['start', 'end', 'duration', 'overlap']
+
+
+class HistogramTest(ScriptTestCase):
+
+    def assertHistograms(self, prefix, expected, types=TYPES):
+        for histogram in types:
+            with self.subTest(histogram=histogram):
+                self.assertEqual(read_file('%s-%s.csv' % (prefix, histogram)),
+                                 read_file('%s-%s.csv' % (expected, histogram)))
+
+    def test_output(self):
+        """Statistics start with the same values as before"""
+        output = run_script('p-printhist', data_file('intervals.tsv'), self.path('out')).stdout
+        self.assertHistograms(self.path('out'), data_file('intervals'))
+        lines = output.splitlines()
+        for expected in read_file(data_file('intervals.txt')).splitlines():
+            self.assertTrue(any(line.startswith(expected + ", STD=") for line in lines), expected)
+        self.assertEqual(lines[-1], "READY.")
+
+    def test_errors(self):
+        for content, error in [("1\n2\n", "Rows need a start and ending point"),
+                               ("1\tx\n", "x"),
+                               ("", "No intervals found")]:
+            with self.subTest(error=error):
+                process = run_script('p-printhist', self.write('in.tsv', content),
+                                     self.path('out'), check=False)
+                self.assertNotEqual(process.returncode, 0)
+                self.assertIn("ERROR: %s: " % self.path('in.tsv'), process.stderr)
+                self.assertIn(error, process.stderr)
+
+
+class OverlapTest(unittest.TestCase):
+    """The overlap histogram must be the same as the one of the sweep over all
+    sorted start and ending points, which p-printhist.py used before"""
+
+    def assertSweep(self, starts, ends, buckets=100):
+        starts = np.array(starts, dtype=np.int64)
+        ends = np.array(ends, dtype=np.int64)
+        domainstart = int(starts.min())
+        bucketlength = -(-(int(ends.max()) - domainstart) // buckets)
+        openints, peak = printhist.overlapHistogram(starts, ends, domainstart,
+                                                    bucketlength, buckets)
+        expected, expectedpeak = sweepOverlaps(starts.tolist(), ends.tolist(),
+                                               domainstart, bucketlength, buckets)
+        self.assertEqual(openints.tolist(), expected)
+        self.assertEqual(peak, expectedpeak)
+
+    def test_random(self):
+        """Dense and sparse domains take different paths"""
+        rng = np.random.default_rng(1)
+        for i in range(300):
+            n = int(rng.integers(1, 200))
+            domain = int(rng.choice([5, 50, 1000, 10 ** 6]))
+            starts = rng.integers(0, domain, n)
+            ends = starts + rng.integers(0, int(rng.choice([1, 10, domain])) + 1, n)
+            with self.subTest(i=i, n=n, domain=domain):
+                self.assertSweep(starts, ends, int(rng.choice([1, 7, 100])))
+
+    def test_special(self):
+        self.assertSweep([5], [5])
+        self.assertSweep([5, 5, 5], [5, 5, 5])
+        self.assertSweep([0, 10], [10, 20])
+        self.assertSweep([0, 1, 2], [3, 3, 3])
+        self.assertSweep([-20, -5], [-10, 0], 3)
+        self.assertSweep([0, 0], [1, 1000], 1000)
+
+
+def sweepOverlaps(starts, ends, domainstart, bucketlength, buckets):
+    """Maximum of concurrently open intervals in each bucket by a sweep over
+    all sorted time points, where ending points follow start points of the
+    same time. Returns the first time point with the overall maximum too."""
+    openints = [0] * buckets
+    bucket = 1
+    overlaps = 0
+    maxoverlaps = 0
+    peak = (0, None)
+    for time, isend in sorted([(t, 0) for t in starts] + [(t, 1) for t in ends]):
+        while time > domainstart + bucket * bucketlength:
+            openints[bucket - 1] = maxoverlaps
+            maxoverlaps = overlaps
+            bucket += 1
+
+        if isend:
+            overlaps -= 1
+        else:
+            overlaps += 1
+            maxoverlaps = max(maxoverlaps, overlaps)
+            if overlaps > peak[0]:
+                peak = (overlaps, time)
+    openints[buckets - 1] = maxoverlaps
+    return openints, peak[1]
+
+
+class StatisticsTest(unittest.TestCase):
+
+    def test_merge(self):
+        """Statistics of chunks, which are merged, are the same as of all
+        values at once"""
+        values = np.random.default_rng(2).integers(-10 ** 6, 10 ** 6, 10000)
+        whole = printhist.Statistics(exact=True)
+        whole.add(values)
+        merged = printhist.Statistics(exact=True)
+        for i in range(0, len(values), 999):
+            chunk = printhist.Statistics(exact=True)
+            chunk.add(values[i:i + 999])
+            merged.merge(chunk)
+        self.assertEqual((merged.count, merged.min, merged.max, merged.total),
+                         (len(values), values.min(), values.max(), int(values.sum())))
+        self.assertAlmostEqual(merged.variance(), values.var(), delta=values.var() * 1e-9)
+        self.assertEqual(merged.quantiles([0.5, 0.99]).tolist(),
+                         whole.quantiles([0.5, 0.99]).tolist())
+
+    def test_exact_sum(self):
+        """Sums do not overflow int64"""
+        values = np.full(3 * printhist.CHUNKSIZE, 2 ** 62, dtype=np.int64)
+        stats = printhist.Statistics()
+        stats.add(values)
+        self.assertEqual(stats.total, 3 * printhist.CHUNKSIZE * 2 ** 62)
+        self.assertEqual(stats.mean(), 2 ** 62)
+        values = np.array([-1, -2 ** 63, 2 ** 63 - 1], dtype=np.int64)
+        self.assertEqual(printhist.exactSum(values), -2)
+
+    def test_exact_quantiles(self):
+        values = np.random.default_rng(3).integers(0, 1000, 999)
+        sketch = printhist.QuantileSketch(None)
+        sketch.add(values)
+        qs = [0.01, 0.5, 0.9, 0.99]
+        self.assertEqual(sketch.quantiles(qs).tolist(),
+                         np.quantile(values, qs, method='inverted_cdf').tolist())
+
+    def test_sketch(self):
+        """Estimated quantiles are within 1% of the exact rank, also if the
+        sketches of several chunks are merged"""
+        values = np.random.default_rng(4).permutation(200000)
+        sketch = printhist.QuantileSketch(512)
+        merged = printhist.QuantileSketch(512)
+        for i in range(0, len(values), 10000):
+            sketch.add(values[i:i + 10000])
+            chunk = printhist.QuantileSketch(512)
+            chunk.add(values[i:i + 10000])
+            merged.merge(chunk)
+        for estimate in [sketch, merged]:
+            self.assertLess(sum(len(level) for level in estimate.levels), 512 * 10)
+            for q, value in zip([0.1, 0.5, 0.9, 0.99], estimate.quantiles([0.1, 0.5, 0.9, 0.99])):
+                self.assertLess(abs(value / len(values) - q), 0.01, q)
+
+
+class BucketsTest(ScriptTestCase):
+
+    def test_buckets(self):
+        run_script('p-printhist', '--buckets', '7', data_file('intervals.tsv'), self.path('out'))
+        for histogram in TYPES + ['data00']:
+            self.assertEqual(len(readHistogram(self.path('out-%s.csv' % histogram))), 7)
+            self.assertAlmostEqual(sum(readHistogram(self.path('out-%s.csv' % histogram))), 100,
+                                   delta=0.01 if histogram != 'overlap' else 1000)
+
+    def test_log_durations(self):
+        """Short durations get more and smaller buckets"""
+        run_script('p-printhist', '--log-durations', data_file('intervals.tsv'), self.path('out'))
+        with open(self.path('out-duration.csv')) as f:
+            next(f)
+            edges = [float(line.split("\t")[0]) for line in f]
+        widths = np.diff(edges)
+        self.assertTrue((widths > 0).all())
+        self.assertTrue((np.diff(widths) > 0).all())
+        self.assertAlmostEqual(sum(readHistogram(self.path('out-duration.csv'))), 100, delta=0.01)
+
+
+class DataTest(ScriptTestCase):
+
+    def test_data(self):
+        """Histograms of data columns go over the range of their values"""
+        output = run_script('p-printhist', data_file('intervals.tsv'), self.path('out')).stdout
+        data = np.loadtxt(data_file('intervals.tsv'), dtype=np.int64)
+        for i in range(2):
+            freq, edges = np.histogram(data[:, 2 + i], 100)
+            with open(self.path('out-data%02d.csv' % i)) as f:
+                self.assertEqual(next(f), "x\ty\n")
+                self.assertEqual(f.read(), "".join("%.3f\t%.3f\n" % (x, y * 100 / len(data))
+                                                   for x, y in zip(edges, freq)))
+            self.assertIn("DATA%02d         -- MIN=%d, MAX=%d, AVG=%.3f, LEN=300, " % (
+                i, data[:, 2 + i].min(), data[:, 2 + i].max(), data[:, 2 + i].mean()), output)
+
+    def test_columns(self):
+        run_script('p-printhist', '--columns', '1', data_file('intervals.tsv'), self.path('one'))
+        run_script('p-printhist', '--columns', 'none', data_file('intervals.tsv'), self.path('none'))
+        run_script('p-printhist', data_file('intervals.tsv'), self.path('all'))
+        self.assertEqual(sorted(os.listdir(self.tmp)),
+                         sorted(['all-%s.csv' % histogram for histogram in TYPES + ['data00', 'data01']] +
+                                ['one-%s.csv' % histogram for histogram in TYPES + ['data01']] +
+                                ['none-%s.csv' % histogram for histogram in TYPES]))
+        for histogram in TYPES:
+            self.assertEqual(read_file(self.path('one-%s.csv' % histogram)),
+                             read_file(self.path('all-%s.csv' % histogram)))
+            self.assertEqual(read_file(self.path('none-%s.csv' % histogram)),
+                             read_file(self.path('all-%s.csv' % histogram)))
+        self.assertEqual(read_file(self.path('one-data01.csv')),
+                         read_file(self.path('all-data01.csv')))
+
+    def test_missing_column(self):
+        for mode in [[], ['--stream'], ['--cache', '--cache-dir', self.path('cache')]]:
+            process = run_script('p-printhist', '--columns', '2', *(mode + [
+                data_file('intervals.tsv'), self.path('out')]), check=False)
+            self.assertNotEqual(process.returncode, 0, mode)
+            self.assertIn("ERROR: %s" % data_file('intervals.tsv'), process.stderr)
+
+
+class StreamTest(ScriptTestCase):
+
+    def test_stream(self):
+        """Streaming gives the same histograms and statistics, except for the
+        overlap histogram, which counts all intervals within each bucket"""
+        memory = run_script('p-printhist', data_file('intervals.tsv'), self.path('memory')).stdout
+        for chunksize in ['7', '1000']:
+            with self.subTest(chunksize=chunksize):
+                stream = run_script('p-printhist', '--stream', '--chunk-size', chunksize,
+                                    data_file('intervals.tsv'), self.path('stream')).stdout
+                for histogram in ['start', 'end', 'duration', 'data00', 'data01']:
+                    self.assertEqual(read_file(self.path('stream-%s.csv' % histogram)),
+                                     read_file(self.path('memory-%s.csv' % histogram)))
+                self.assertEqual(withoutOverlaps(stream), withoutOverlaps(memory))
+                self.assertEqual(readHistogram(self.path('stream-overlap.csv')),
+                                 overlappingIntervals(data_file('intervals.tsv'), 100))
+
+
+class ShardTest(ScriptTestCase):
+
+    def setUp(self):
+        super().setUp()
+        lines = read_file(data_file('intervals.tsv')).splitlines(True)
+        self.shards = [self.write('shard%d.tsv' % i, "".join(part)) for i, part in
+                       enumerate([lines[:1], [], lines[1:120], lines[120:]])]
+
+    def test_shards(self):
+        """Shards give the same output as the whole file, in parallel or not"""
+        for mode in [[], ['--stream', '--chunk-size', '50']]:
+            expected = run_script('p-printhist', *(mode + [data_file('intervals.tsv'),
+                                                           self.path('whole')])).stdout
+            for jobs in ['1', '3']:
+                with self.subTest(mode=mode, jobs=jobs):
+                    output = run_script('p-printhist', '--jobs', jobs,
+                                        *(mode + self.shards + [self.path('shards')])).stdout
+                    self.assertEqual(output, expected)
+                    for histogram in TYPES + ['data00', 'data01']:
+                        self.assertEqual(read_file(self.path('shards-%s.csv' % histogram)),
+                                         read_file(self.path('whole-%s.csv' % histogram)))
+
+    def test_columns(self):
+        self.write('shard1.tsv', "1\t2\n")
+        for mode in [[], ['--stream']]:
+            process = run_script('p-printhist', *(mode + self.shards + [self.path('out')]),
+                                 check=False)
+            self.assertNotEqual(process.returncode, 0)
+            self.assertIn("the number of columns differs from %s" % self.shards[0],
+                          process.stderr)
+
+
+class CacheTest(ScriptTestCase):
+
+    def run_cached(self, *args):
+        return run_script('p-printhist', '--cache', '--cache-dir', self.path('cache'), *args).stdout
+
+    def test_cache(self):
+        """Cached columns give the same output, also for other columns, and
+        changed files get a new cache file"""
+        input_name = self.write('in.tsv', read_file(data_file('intervals.tsv')))
+        for mode in [[], ['--stream', '--chunk-size', '50'], []]:
+            expected = run_script('p-printhist', *(mode + [input_name, self.path('expected')])).stdout
+            self.assertEqual(self.run_cached(*(mode + [input_name, self.path('out')])), expected)
+            self.assertEqual(len(os.listdir(self.path('cache'))), 1)
+
+        entry = os.path.join(self.path('cache'), os.listdir(self.path('cache'))[0])
+        self.assertEqual(np.load(entry).tolist(), np.loadtxt(input_name, dtype=np.int64).tolist())
+        columns = run_script('p-printhist', '--columns', '1', input_name, self.path('expected')).stdout
+        self.assertEqual(self.run_cached('--columns', '1', input_name, self.path('out')), columns)
+
+        self.write('in.tsv', read_file(data_file('intervals.tsv')) + "0\t1\t2\t3\n")
+        self.assertNotEqual(self.run_cached(input_name, self.path('out')), expected)
+        self.assertEqual(len(os.listdir(self.path('cache'))), 2)
+
+    def test_invalid(self):
+        """Invalid cache files are read again from the input"""
+        input_name = self.write('in.tsv', read_file(data_file('intervals.tsv')))
+        expected = self.run_cached(input_name, self.path('out'))
+        entry = os.path.join(self.path('cache'), os.listdir(self.path('cache'))[0])
+        self.write(entry, "invalid")
+        self.assertEqual(self.run_cached(input_name, self.path('out')), expected)
+        self.assertEqual(np.load(entry).shape, (300, 4))
+
+    def test_evict(self):
+        for i, name in enumerate(['c', 'a', 'b']):
+            entry = self.write(os.path.join('cache', name + '.npy'), 'x' * 100)
+            os.utime(entry, (1000 + i, 1000 + i))
+        self.write(os.path.join('cache', 'other'), 'x' * 1000)
+        printhist.evictCache(self.path('cache'), 250)
+        self.assertEqual(sorted(os.listdir(self.path('cache'))), ['a.npy', 'b.npy', 'other'])
+        printhist.evictCache(self.path('missing'), 0)
+
+
+def readHistogram(filename):
+    with open(filename) as f:
+        next(f)
+        return [float(line.split("\t")[1]) for line in f]
+
+
+def overlappingIntervals(filename, buckets):
+    """Percentage of intervals, which overlap each bucket. The first bucket
+    holds the domain start, and each bucket its upper bound."""
+    with open(filename) as f:
+        intervals = [list(map(int, line.split("\t")[:2])) for line in f]
+    domainstart = min(start for start, _ in intervals)
+    domainend = max(end for _, end in intervals)
+    bucketlength = math.ceil((domainend - domainstart) / buckets)
+
+    def bucket(time):
+        return min(max(math.ceil((time - domainstart) / bucketlength) - 1, 0), buckets - 1)
+
+    counts = [0] * buckets
+    for start, end in intervals:
+        for i in range(bucket(start), bucket(end) + 1):
+            counts[i] += 1
+    return [float("%.3f" % (count * 100 / len(intervals))) for count in counts]
+
+
+def withoutOverlaps(output):
+    return [line for line in output.splitlines()
+            if not line.startswith(("OVERLAPS", "PEAK OVERLAP"))]
+
+
+if __name__ == '__main__':
+    unittest.main()
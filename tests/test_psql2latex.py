@@ -0,0 +1,571 @@
+"""Tests of p-psql2latex.py
+
+The expected outputs temporal-*.tex have been created by version 0.9thesis,
+i.e., before the tokenizer got its fast path. Only the version in the header
+differs, and the figure with --figure-only uses the xscale config now (see
+the changelog of 0.10)."""
+
+import argparse
+import gzip
+import importlib.util
+import io
+import lzma
+import os
+import re
+import signal
+import struct
+import subprocess
+import sys
+import threading
+import unittest
+
+from helpers import ScriptTestCase, data_file, load_script, read_file, run_script
+
+psql2latex = load_script('p-psql2latex')
+
+RE_VERSION = re.compile(r'^% p-psql2latex.py v\S+ written by .*\n', re.M)
+
+TABLE_LINES = [
+    '-- TIKZ: relation, r, ts, te,, Input relation r\n',
+    'TABLE r;\n',
+    ' a   | ts | te\n',
+    '-----+----+----\n',
+    ' B   |  1 |  7\n',
+    ' B|x |  3 |  9\n',
+    '(2 rows)\n',
+    '\n',
+]
+
+RE_BAND = re.compile(r'\((\d+),0\)--\((\d+),0\);\n.*\{\$n=(\d+)\$\}')
+RE_POINTS = re.compile(r'\(([\d.]+),0\) node\[cross\].*\n.*\{\$n=(\d+)\$\}')
+
+
+def without_version(text):
+    return RE_VERSION.sub('', text)
+
+
+class TokenizerTest(unittest.TestCase):
+
+    def test_tokens(self):
+        self.assertEqual(list(psql2latex.pgsql_tokenizer(TABLE_LINES)), [
+            ['COMMENT', 'TIKZ: relation, r, ts, te,, Input relation r'],
+            ['COMMAND', 'TABLE r;'],
+            ['HEADER', ['a', 'ts', 'te']],
+            ['TUPLE', ['B', '1', '7']],
+            ['TUPLE', ['B|x', '3', '9']],
+            ['TUPLECOUNT', '2'],
+        ])
+
+    def test_table_end(self):
+        """Tables end at empty lines or the end of the input, if they have no
+        tuple count"""
+        tokens = list(psql2latex.pgsql_tokenizer(TABLE_LINES[:5] + ['\n'] + TABLE_LINES[:5]))
+        self.assertEqual([kind for kind, value in tokens].count('TABLEEND'), 2)
+        self.assertEqual(tokens[-1], ['TABLEEND', ''])
+
+    def test_unaligned_delimiter(self):
+        """Lines with more delimiters, which do not fit the ruler, are split
+        at each delimiter"""
+        lines = TABLE_LINES[:4] + [' B|x| 3 | 9\n']
+        tokens = list(psql2latex.pgsql_tokenizer(lines))
+        self.assertEqual(tokens[3], ['TUPLE', ['B', 'x', '3', '9']])
+
+    def test_tsv(self):
+        lines = ['-- TIKZ: TSV\n', 'a\tts\n', 'x|y\t 1\n', '\n', 'a\tts\n', 'z\t2\n']
+        self.assertEqual(list(psql2latex.pgsql_tokenizer(lines)), [
+            ['HEADER', ['a', 'ts']],
+            ['TUPLE', ['x|y', '1']],
+            ['TABLEEND', ''],
+            ['HEADER', ['a', 'ts']],
+            ['TUPLE', ['z', '2']],
+            ['TABLEEND', ''],
+        ])
+        self.assertEqual(
+            list(psql2latex.pgsql_tokenizer(lines[1:3], psql2latex.INPUT_TYPE_TSV)),
+            list(psql2latex.pgsql_tokenizer(lines[:3])))
+
+    def test_parser(self):
+        configs = psql2latex.pgsql_parser(psql2latex.pgsql_tokenizer(
+            TABLE_LINES + ['-- TIKZ: config, label, l1\n']))
+        self.assertEqual([c['type'] for c in configs], ['relation', 'config'])
+        relation = configs[0]['relation']
+        self.assertEqual(relation.getSchemaB(), ['a'])
+        self.assertEqual(list(relation.getTuplesTB()), [['B', '1', '7'], ['B|x', '3', '9']])
+        self.assertEqual(relation.getTimeBounds(), (1, 9))
+
+
+class RelationTest(unittest.TestCase):
+
+    def relation(self, ts, te, ypos, tuples):
+        relation = psql2latex.Relation()
+        relation.setMetaData(['r', ts, te, ypos, 'R'])
+        relation.setSchema(['a', 'ts', 'te', 'y'])
+        for tup in tuples:
+            relation.addTuple(tup)
+        return relation
+
+    def test_bounds(self):
+        """Points end one time unit after their start"""
+        relation = self.relation('ts', 'te', '', [['B', '3', '9', '0'], ['B', '1', '7', '0']])
+        self.assertEqual(relation.getTimeBounds(), (1, 9))
+        self.assertEqual((relation.getYMin(), relation.getYMax()), (0, 1))
+        relation = self.relation('ts', '', '', [['B', '3', '', '0'], ['B', '[2,5)', '', '0']])
+        self.assertEqual(relation.getTimeBounds(), (2, 5))
+        relation = self.relation('ts', '', '', [['B', '3', '', '0'], ['B', '9', '', '0']])
+        self.assertEqual(relation.getTimeBounds(), (3, 10))
+        self.assertIsNone(self.relation('ts', 'te', '', []).getTimeBounds())
+
+    def test_ypos(self):
+        relation = self.relation('ts', 'te', 'y', [['B', '1', '2', '4'], ['B', '1', '2', '-2']])
+        self.assertEqual((relation.getYMin(), relation.getYMax()), (-2, 4))
+        self.assertEqual(list(relation.getTuplesTB()), [['B', '1', '2'], ['B', '1', '2']])
+
+    def test_columns(self):
+        """Time columns are printed as they were given, e.g., for ranges or
+        leading zeros"""
+        relation = self.relation('ts', 'te', '', [['B', '1', '7', '0'], ['B', '03', '9', '0']])
+        self.assertEqual(list(relation.getTuplesTB()), [['B', '1', '7', '0'], ['B', '03', '9', '0']])
+        self.assertEqual(list(relation.getTuplesB()), [('B', '0'), ('B', '0')])
+        self.assertEqual((list(relation.ts), list(relation.te)), ([1, 3], [7, 9]))
+
+    def test_values(self):
+        """Decoded values of binary inputs give the same relation"""
+        tuples = [['B', '1', '', '0'], ['G', '[2,5)', '', '1']]
+        relation = self.relation('ts', '', 'y', tuples)
+        values = self.relation('ts', '', 'y', [])
+        values.addValues(['B', 1, '', 0])
+        values.addValues(['G', '[2,5)', '', 1])
+        self.assertEqual(list(values.getTuplesTB()), list(relation.getTuplesTB()))
+        self.assertEqual(values.getDigest(), relation.getDigest())
+
+    def test_digest(self):
+        tuples = [['B', '1', '7', '0'], ['G', '2', '5', '1']]
+        digest = self.relation('ts', 'te', '', tuples).getDigest()
+        self.assertEqual(self.relation('ts', 'te', '', tuples).getDigest(), digest)
+        self.assertNotEqual(self.relation('ts', 'te', '', tuples[::-1]).getDigest(), digest)
+        self.assertNotEqual(self.relation('ts', 'te', 'y', tuples).getDigest(), digest)
+
+    def test_not_integer(self):
+        with self.assertRaisesRegex(ValueError, "is not an integer: B, 1, x"):
+            self.relation('ts', 'te', '', [['B', '1', 'x', '0']])
+
+    def test_auto_timeline(self):
+        for bounds, step in [((0, 10), 1), ((0, 11), 2), ((5, 95), 10), ((0, 150), 20),
+                             ((0, 450), 50), ((0, 10000), 1000)]:
+            timeline = psql2latex.get_auto_timeline(bounds)
+            self.assertEqual((timeline['from'], timeline['to'], timeline['step']),
+                             bounds + (step,), bounds)
+
+
+class DensityTest(ScriptTestCase):
+
+    def relation(self, tuples, te='te'):
+        relation = psql2latex.Relation()
+        relation.setMetaData(['r', 'ts', te, '', 'R'])
+        relation.setSchema(['a', 'ts', 'te'])
+        for tup in tuples:
+            relation.addTuple(['B'] + list(map(str, tup)))
+        return relation
+
+    def test_bands(self):
+        """Touching intervals are merged into a band"""
+        out = io.StringIO()
+        psql2latex.write_tikz_density(
+            out, self.relation([(1, 3), (2, 5), (7, 8), (5, 6)]), 0, 100)
+        self.assertEqual(RE_BAND.findall(out.getvalue()),
+                         [('1', '6', '3'), ('7', '8', '1')])
+
+    def test_points(self):
+        out = io.StringIO()
+        psql2latex.write_tikz_density(
+            out, self.relation([(9, ''), (9, ''), (3, ''), (20, '')], te=''), 0, 100)
+        self.assertEqual(RE_POINTS.findall(out.getvalue()),
+                         [('3.5', '1'), ('9.5', '2'), ('20.5', '1')])
+
+    def test_sample(self):
+        """Every stride-th tuple is drawn below the density row"""
+        out = io.StringIO()
+        relation = self.relation([(1, 3), (2, 5), (7, 8), (5, 6)])
+        self.assertEqual(psql2latex.write_tikz_relation(out, relation, 0, 2, 2), -4)
+        self.assertEqual(RE_BAND.findall(out.getvalue()), [('1', '8', '4')])
+        self.assertEqual(re.findall(r'% Tuple (\S+)', out.getvalue()), ['r_1', 'r_3'])
+
+    def test_maxtuples(self):
+        rows = "".join(" B | %4d | %4d\n" % (i, i + 3) for i in range(0, 5000, 5))
+        text = ("-- TIKZ: config, maxtuples, 10\n-- TIKZ: relation, r, ts, te,, R\n"
+                "TABLE r;\n a |  ts  |  te\n---+------+------\n%s(1000 rows)\n" % rows)
+        output = run_script('p-psql2latex', '--no-cache', '-f', self.write('in.out', text)).stdout
+        self.assertEqual(output.count('% Tuple'), 10)
+        self.assertEqual(RE_BAND.findall(output), [('0', '4998', '1000')])
+
+        process = run_script('p-psql2latex', '--no-cache', '-f', self.write(
+            'in.out', text.replace('maxtuples, 10', 'maxtuples, 0')), check=False)
+        self.assertEqual(process.returncode, 3)
+        self.assertIn("We need at least one tuple per relation.", process.stdout)
+
+
+class EventsTest(unittest.TestCase):
+
+    def test_events(self):
+        """Relations do not keep their tuples, if they are streamed"""
+        events = list(psql2latex.pgsql_events(psql2latex.pgsql_tokenizer(
+            TABLE_LINES + ['-- TIKZ: config, label, l1\n']), keep_tuples=False))
+        self.assertEqual([event for event, _ in events],
+                         ['relation', 'header', 'tuple', 'tuple', 'end', 'config'])
+        self.assertEqual(events[3][1], ['B|x', '3', '9'])
+        self.assertEqual(events[-1][1], {'type': 'config', 'key': 'label', 'value': 'l1'})
+        self.assertEqual(events[1][1]['relation'].getLength(), 0)
+
+    def test_relation_without_table(self):
+        events = list(psql2latex.pgsql_events(psql2latex.pgsql_tokenizer(TABLE_LINES[:1])))
+        self.assertEqual([event for event, _ in events], ['relation', 'header', 'end'])
+
+
+class OutputTest(ScriptTestCase):
+
+    def assertOutput(self, expected, *args):
+        output = run_script('p-psql2latex', '--no-cache', *args).stdout
+        self.assertEqual(without_version(output),
+                         without_version(read_file(data_file(expected))))
+
+    def test_output_types(self):
+        for output_type in 'aAtfs':
+            with self.subTest(output_type=output_type):
+                self.assertOutput('temporal-%s.tex' % output_type,
+                                  '-' + output_type, data_file('temporal.out'))
+
+    def test_tsv(self):
+        self.assertOutput('temporal-tsv.tex', data_file('temporal.tsv'))
+
+    def test_stream(self):
+        for output_type in 'aAtfs':
+            with self.subTest(output_type=output_type):
+                self.assertOutput('temporal-%s.tex' % output_type, '--stream',
+                                  '-' + output_type, data_file('temporal.out'))
+        self.assertOutput('temporal-tsv.tex', '--stream', data_file('temporal.tsv'))
+
+    def test_auto_timeline(self):
+        """The timeline goes from the first to the last time point of all
+        relations, below them"""
+        text = read_file(data_file('temporal.out')).replace("-- TIKZ: timeline, 0, 10, 1, time\n", "")
+        input_name = self.write('in.out', text)
+        expected = self.write('expected.out', text.replace(
+            "-- TIKZ: config, label", "-- TIKZ: timeline, 1, 10, 1, time\n-- TIKZ: config, label"))
+        expected = run_script('p-psql2latex', '--no-cache', '--no-echo', expected).stdout
+        for stream in [[], ['--stream']]:
+            output = run_script('p-psql2latex', '--no-cache', '--no-echo', '--auto-timeline',
+                                *(stream + [input_name])).stdout
+            self.assertEqual(output, expected)
+
+    def test_dates(self):
+        """Tables print times as they are, hence they need not be integers,
+        as long as we do not draw them"""
+        input_name = self.write('in.out', "".join(TABLE_LINES).replace(
+            "relation,", "relation-table,").replace(" 1 |  7", " 2017-01-01 | 2017-02-01"))
+        output = run_script('p-psql2latex', '--no-cache', '-t', input_name).stdout
+        self.assertIn("B & 2017-01-01 & 2017-02-01", output)
+        self.assertEqual(run_script('p-psql2latex', '--no-cache', '--stream', '-t', input_name).stdout,
+                         output)
+        for output_type in ['-a', '-f']:
+            process = run_script('p-psql2latex', '--no-cache', output_type, input_name, check=False)
+            self.assertEqual(process.returncode, 3)
+            self.assertIn("is not an integer", process.stdout)
+
+    def test_stream_stdin(self):
+        with open(data_file('temporal.out')) as stdin:
+            output = run_script('p-psql2latex', '--no-cache', '--stream', '-',
+                                stdin=stdin).stdout
+        self.assertEqual(without_version(output),
+                         without_version(read_file(data_file('temporal-a.tex'))))
+
+
+class OpenOutputTest(ScriptTestCase):
+
+    def test_compressed(self):
+        expected = run_script('p-psql2latex', '--no-cache', data_file('temporal.out')).stdout
+        for name, open_compressed in [('out.tex.gz', gzip.open), ('out.tex.xz', lzma.open)]:
+            run_script('p-psql2latex', '--no-cache', '-o', self.path(name), data_file('temporal.out'))
+            with open_compressed(self.path(name), 'rt') as f:
+                self.assertEqual(f.read(), expected)
+
+    def test_atomic(self):
+        """Errors leave neither a half-made output, nor the temporary file"""
+        output = self.write('out.tex', "old")
+        with self.assertRaises(RuntimeError):
+            with psql2latex.open_output(output, 'overwrite') as outfile:
+                outfile.write("new")
+                raise RuntimeError()
+        self.assertEqual(os.listdir(self.tmp), ['out.tex'])
+        self.assertEqual(read_file(output), "old")
+
+        with self.assertRaises(ValueError):
+            with psql2latex.open_output(output):
+                pass
+        with psql2latex.open_output(output, 'overwrite') as outfile:
+            outfile.write("new")
+        self.assertEqual(os.listdir(self.tmp), ['out.tex'])
+        self.assertEqual(read_file(output), "new")
+
+    def test_error(self):
+        process = run_script('p-psql2latex', '--no-cache', '-o', self.path('out.tex'),
+                             self.write('in.out', "SELECT 1;\n"), check=False)
+        self.assertEqual(process.returncode, 3)
+        self.assertEqual(os.listdir(self.tmp), ['in.out'])
+
+
+class BatchTest(ScriptTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.inputs = self.path('in')
+        for name in ['one', 'two']:
+            self.write(os.path.join('in', name + '.out'), read_file(data_file('temporal.out')))
+
+    def assertRendered(self, *names):
+        for name in names:
+            self.assertEqual(without_version(read_file(name)),
+                             without_version(read_file(data_file('temporal-a.tex'))))
+
+    def test_directory(self):
+        """Outputs of an earlier run are no inputs of the next one"""
+        output = run_script('p-psql2latex', '--no-cache', '-j', '2', self.inputs).stdout
+        self.assertIn("2 rendered, 0 skipped, 0 failed", output)
+        self.assertRendered(self.path('in', 'one.tex'), self.path('in', 'two.tex'))
+
+        output = run_script('p-psql2latex', '--no-cache', '--overwrite', self.inputs).stdout
+        self.assertIn("2 rendered, 0 skipped, 0 failed", output)
+        self.assertEqual(sorted(os.listdir(self.inputs)),
+                         ['one.out', 'one.tex', 'two.out', 'two.tex'])
+
+    def test_glob_and_template(self):
+        output = run_script('p-psql2latex', '--no-cache', '-O', self.path('out', '{name}.tikz.tex'),
+                            self.path('in', 't*.out')).stdout
+        self.assertIn("1 rendered, 0 skipped, 0 failed", output)
+        self.assertRendered(self.path('out', 'two.tikz.tex'))
+
+    def test_existing(self):
+        self.write(os.path.join('in', 'one.tex'), "old")
+        process = run_script('p-psql2latex', '--no-cache', self.inputs, check=False)
+        self.assertEqual(process.returncode, 3)
+        self.assertIn("1 rendered, 0 skipped, 1 failed", process.stdout)
+        self.assertIn("FAILED: %s" % self.path('in', 'one.out'), process.stdout)
+
+        output = run_script('p-psql2latex', '--no-cache', '--skip-existing', self.inputs).stdout
+        self.assertIn("0 rendered, 2 skipped, 0 failed", output)
+        self.assertEqual(read_file(self.path('in', 'one.tex')), "old")
+
+    def test_error(self):
+        """Errors of single files do not stop the others"""
+        self.write(os.path.join('in', 'bad.out'), "SELECT 1;\n")
+        process = run_script('p-psql2latex', '--no-cache', '-j', '2', self.inputs, check=False)
+        self.assertEqual(process.returncode, 3)
+        self.assertIn("2 rendered, 0 skipped, 1 failed", process.stdout)
+        self.assertIn("No tables found!", process.stdout)
+        self.assertRendered(self.path('in', 'one.tex'), self.path('in', 'two.tex'))
+
+
+class CacheTest(ScriptTestCase):
+
+    def args(self, **options):
+        args = {'output_type': 'all', 'output_standalone': False, 'echo': True,
+                'auto_timeline': False, 'stream': False, 'input_format': 'auto',
+                'sidecar': None}
+        args.update(options)
+        return argparse.Namespace(**args)
+
+    def test_key(self):
+        input_name = self.write('in.out', read_file(data_file('temporal.out')))
+        key = psql2latex.get_cache_key(input_name, self.args())
+        self.assertEqual(key, psql2latex.get_cache_key(input_name, self.args(input_format='psql')))
+        self.assertNotEqual(key, psql2latex.get_cache_key(input_name, self.args(stream=True)))
+        self.assertNotEqual(key, psql2latex.get_cache_key(input_name, self.args(echo=False)))
+        self.assertNotEqual(key, psql2latex.get_cache_key(input_name, self.args(input_format='tsv')))
+
+        # Sidecar files are part of the input
+        self.write('in.tikz', "-- TIKZ: config, label, l1\n")
+        self.assertNotEqual(key, psql2latex.get_cache_key(input_name, self.args()))
+
+    def test_render(self):
+        """Changed inputs get a new cache entry"""
+        cache_dir = self.path('cache')
+        input_name = self.write('in.out', read_file(data_file('temporal.out')))
+        expected = without_version(read_file(data_file('temporal-a.tex')))
+        for _ in range(2):
+            output = run_script('p-psql2latex', '--cache-dir', cache_dir, input_name).stdout
+            self.assertEqual(without_version(output), expected)
+            self.assertEqual(len(os.listdir(cache_dir)), 1)
+
+        self.write('in.out', read_file(data_file('temporal.out')).replace('label0001', 'label0002'))
+        output = run_script('p-psql2latex', '--cache-dir', cache_dir, input_name).stdout
+        self.assertEqual(without_version(output), expected.replace('label0001', 'label0002'))
+        self.assertEqual(len(os.listdir(cache_dir)), 2)
+
+    def test_evict(self):
+        """Least recently used entries are removed first"""
+        for i, name in enumerate(['c', 'a', 'b']):
+            entry = self.write(os.path.join('cache', name + '.tex'), 'x' * 100)
+            os.utime(entry, (1000 + i, 1000 + i))
+        self.write(os.path.join('cache', 'other'), 'x' * 1000)
+        psql2latex.evict_cache(self.path('cache'), 250)
+        self.assertEqual(sorted(os.listdir(self.path('cache'))), ['a.tex', 'b.tex', 'other'])
+        psql2latex.evict_cache(self.path('cache'), 0)
+        self.assertEqual(os.listdir(self.path('cache')), ['other'])
+
+
+class WatchTest(ScriptTestCase):
+
+    def render(self, blocks, fragments, output_type='all'):
+        args = argparse.Namespace(output_type=output_type, output_standalone=False, echo=True,
+                                  auto_timeline=False, input_format='auto')
+        changed = psql2latex.watch_render(self.input_name, self.output, args, blocks, fragments)
+        return changed, without_version(read_file(self.output))
+
+    def test_render(self):
+        """Only changed blocks are tokenized again, and the output is the same
+        as without watch mode"""
+        text = read_file(data_file('temporal.out'))
+        self.input_name = self.write('in.out', text)
+        self.output = self.path('out.tex')
+        blocks = {}
+        fragments = {}
+        expected = without_version(read_file(data_file('temporal-a.tex')))
+        self.assertEqual(self.render(blocks, fragments), (6, expected))
+        self.assertEqual(self.render(blocks, fragments), (0, expected))
+
+        text = text.replace(' B | [3,4)', ' B | [3,6)')
+        self.write('in.out', text)
+        expected = without_version(run_script('p-psql2latex', '--no-cache', self.input_name).stdout)
+        self.assertEqual(self.render(blocks, fragments), (1, expected))
+        self.assertEqual(len(blocks), 6)
+
+    def test_dates(self):
+        """Tables of relations with dates as times are rendered like without
+        watch mode"""
+        self.input_name = self.write('in.out', "".join(TABLE_LINES).replace(
+            "relation,", "relation-table,").replace(" 1 |  7", " 2017-01-01 | 2017-02-01"))
+        self.output = self.path('out.tex')
+        expected = run_script('p-psql2latex', '--no-cache', '-t', self.input_name).stdout
+        self.assertEqual(self.render({}, {}, 'table-only'), (1, without_version(expected)))
+
+    def test_watch(self):
+        input_name = self.write('in.out', read_file(data_file('temporal.out')))
+        output = self.path('out.tex')
+        process = subprocess.Popen(
+            [sys.executable, psql2latex.__file__, '--watch', '-o', output, input_name],
+            stdout=subprocess.PIPE, universal_newlines=True)
+        timeout = threading.Timer(30, process.kill)
+        timeout.start()
+        try:
+            self.assertIn("(6 of 6 blocks changed)", process.stdout.readline())
+
+            # The size changes as well, in case of coarse modification times
+            self.write('in.out', read_file(data_file('temporal.out')).replace('label0001', 'label00002'))
+            self.assertIn("(1 of 6 blocks changed)", process.stdout.readline())
+            self.assertIn('label00002', read_file(output))
+        finally:
+            process.send_signal(signal.SIGINT)
+            process.communicate(timeout=10)
+            timeout.cancel()
+        self.assertEqual(process.returncode, 0)
+
+
+class CopyTest(ScriptTestCase):
+    """The inputs temporal-copy.* hold the tables of temporal.sql, written by
+    COPY ... TO in CSV and binary format of PostgreSQL 16, and their sidecar
+    file with the TIKZ lines. Their output must be the same as the output of
+    the psql input without echo."""
+
+    def assertSameOutput(self, *args, stdin=None):
+        expected = run_script('p-psql2latex', '--no-cache', '--no-echo',
+                              data_file('temporal.out')).stdout
+        for stream in [[], ['--stream']]:
+            if stdin is not None:
+                stdin.seek(0)
+            output = run_script('p-psql2latex', '--no-cache', '--no-echo',
+                                *(stream + list(args)), stdin=stdin).stdout
+            self.assertEqual(output, expected)
+
+    def test_csv(self):
+        self.assertSameOutput(data_file('temporal-copy.csv'))
+
+    def test_binary(self):
+        self.assertSameOutput(data_file('temporal-copy.bin'))
+        with open(data_file('temporal-copy.bin'), 'rb') as stdin:
+            self.assertSameOutput('--input-format', 'binary', '--sidecar',
+                                  data_file('temporal-copy.tikz'), '-', stdin=stdin)
+
+    def test_binary_errors(self):
+        data = read_file(data_file('temporal-copy.bin'), 'rb')
+        sidecar = read_file(data_file('temporal-copy.tikz'))
+        for name, content, tikz, error in [
+                ('truncated', data[:80], sidecar, "Binary COPY input ends within a tuple."),
+                ('signature', data[:100], sidecar, "no valid signature at byte 90"),
+                ('columns', data, sidecar.replace('-- TIKZ: columns', '-- columns'),
+                 "Binary COPY input needs the names and types of its columns.")]:
+            with self.subTest(name):
+                self.write(name + '.tikz', tikz)
+                process = run_script('p-psql2latex', '--no-cache',
+                                     self.write(name + '.bin', content, 'wb'), check=False)
+                self.assertEqual(process.returncode, 3)
+                self.assertIn(error, process.stdout)
+
+    def test_decoders(self):
+        self.assertEqual(psql2latex.format_copy_range(b'\x01'), "empty")
+        self.assertEqual(psql2latex.format_copy_range(b'\x12' + struct.pack('>ii', 4, 3)), "[3,)")
+        self.assertEqual(psql2latex.format_copy_range(b'\x06' + struct.pack('>iiii', 4, 3, 4, 5)),
+                         "[3,5]")
+        for column_type, field, value in [('float8', struct.pack('>d', 1.5), "1.5"),
+                                          ('bool', b'\x00', "f"),
+                                          ('int2', struct.pack('>h', -3), "-3"),
+                                          ('varchar', b'x|y', "x|y")]:
+            decode = psql2latex.get_copy_decoder(column_type)[2]
+            self.assertEqual(decode(field), value)
+            self.assertEqual(decode(None), "")
+
+
+class InputFormatTest(ScriptTestCase):
+    """temporal-psql.out and temporal-unaligned.out are outputs of psql -a and
+    psql -a -A of temporal.sql, and temporal.jsonl holds the TIKZ lines and
+    the rows of each relation from SELECT row_to_json(...)."""
+
+    def assertSameOutput(self, *args):
+        expected = run_script('p-psql2latex', '--no-cache', '--no-echo',
+                              data_file('temporal.out')).stdout
+        for stream in [[], ['--stream']]:
+            output = run_script('p-psql2latex', '--no-cache', '--no-echo',
+                                *(stream + list(args))).stdout
+            self.assertEqual(output, expected)
+
+    def test_aligned(self):
+        self.assertSameOutput(data_file('temporal-psql.out'))
+        self.assertSameOutput('--input-format', 'aligned', data_file('temporal-psql.out'))
+
+    def test_unaligned(self):
+        self.assertSameOutput('--input-format', 'unaligned', data_file('temporal-unaligned.out'))
+
+    def test_jsonl(self):
+        self.assertSameOutput(data_file('temporal.jsonl'))
+
+    def test_detection(self):
+        for name, content, input_format in [
+                ('in.out', b"-- TIKZ: TSV\n", 'psql'),
+                ('in.dat', read_file(data_file('temporal-copy.bin'), 'rb'), 'binary'),
+                ('in.dat', b"PAR1", 'parquet'),
+                ('in.CSV', b"a,ts,te\n", 'csv'),
+                ('in.ndjson', b"{}\n", 'jsonl')]:
+            with open(self.write(name, content, 'wb')) as input_file:
+                self.assertEqual(psql2latex.get_input_format(input_file), input_format)
+                self.assertEqual(psql2latex.get_input_format(input_file, 'tsv'), 'tsv')
+
+    def test_parquet_without_pyarrow(self):
+        if importlib.util.find_spec('pyarrow') is not None:
+            self.skipTest("pyarrow is installed")
+        self.write('in.tikz', "-- TIKZ: relation, r, ts, te,, R\n")
+        process = run_script('p-psql2latex', '--no-cache', self.write('in.parquet', b"PAR1", 'wb'),
+                             check=False)
+        self.assertEqual(process.returncode, 3)
+        self.assertIn("Parquet inputs need pyarrow.", process.stdout)
+
+
+if __name__ == '__main__':
+    unittest.main()
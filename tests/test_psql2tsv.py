@@ -0,0 +1,330 @@
+"""Tests of p-psql2tsv.py
+
+The query plans in data/plans are outputs of EXPLAIN (ANALYZE, BUFFERS) of a
+nested loop (nl) and a hash join (hash) of PostgreSQL 16. The expected output
+plans.txt has been created by the first version of p-psql2tsv.py."""
+
+import math
+import os
+import re
+import sqlite3
+import statistics
+import unittest
+
+from helpers import ScriptTestCase, data_file, load_script, read_file, run_script
+
+psql2tsv = load_script('p-psql2tsv')
+
+PLANS = [data_file(os.path.join('plans', 'q_N%d_%s' % (n, algo)))
+         for n in [1, 2, 5] for algo in ['nl', 'hash']]
+
+# Query plan of PostgreSQL 9.3 and older with a node, which is never executed
+OLD_PLAN = """\
+                                  QUERY PLAN
+------------------------------------------------------------------------------
+ Hash Join  (cost=1.09..2.19 rows=4 width=8) (actual time=0.030..0.040 rows=4 loops=1)
+   Hash Cond: (r.a = s.a)
+   ->  Seq Scan on r  (cost=0.00..1.04 rows=4 width=4) (actual time=0.005..0.007 rows=4 loops=1)
+   ->  Hash  (cost=1.04..1.04 rows=4 width=4) (actual time=0.010..0.010 rows=4 loops=1)
+         Buckets: 1024  Batches: 1  Memory Usage: 1kB
+         ->  Seq Scan on s  (cost=0.00..1.04 rows=4 width=4) (never executed)
+ Total runtime: 0.081 ms
+(7 rows)
+"""
+
+
+class ExtractTest(ScriptTestCase):
+
+    def test_output(self):
+        output = run_script('p-psql2tsv', 'q_', *PLANS).stdout
+        self.assertEqual(output, read_file(data_file('plans.txt')))
+
+    def test_sorted(self):
+        """Rows are sorted by their parameter values, and not in file order"""
+        output = run_script('p-psql2tsv', 'q_', *(PLANS[4:] + PLANS[2:4] + PLANS[:2])).stdout
+        self.assertEqual(output, read_file(data_file('plans.txt')))
+
+    def test_jobs(self):
+        """Files, which are read in parallel, keep their order"""
+        for args in [[], ['--measure', 'node:Seq Scan', '--stat', 'median,std']]:
+            expected = run_script('p-psql2tsv', '--jobs', '1', *(args + ['q_'] + PLANS)).stdout
+            for jobs, pool in [('3', 'thread'), ('3', 'process'), ('16', 'process')]:
+                with self.subTest(args=args, jobs=jobs, pool=pool):
+                    output = run_script('p-psql2tsv', '--jobs', jobs, '--pool', pool,
+                                        *(args + ['q_'] + PLANS)).stdout
+                    self.assertEqual(output, expected)
+
+    def test_plans(self):
+        """Node times are exclusive, i.e., without the times of their
+        children, and at least zero"""
+        plans = psql2tsv.readPlans(data_file(os.path.join('plans', 'q_N1_hash')))
+        self.assertEqual(len(plans), 3)
+        plan = plans[0]
+        self.assertEqual((plan['planning'], plan['execution'], plan['rows'],
+                          plan['shared-hit'], plan['shared-read']), (0.184, 160.618, 100, 163, 0))
+        self.assertNodes(plan, {'Sort': 0.041, 'HashAggregate': 92.635, 'Hash Join': 65.717,
+                                'Seq Scan': 1.724, 'Hash': 0.446})
+
+        plans = psql2tsv.readPlans(data_file(os.path.join('plans', 'q_N1_nl')))
+        self.assertEqual(len(plans), 3)
+        plan = plans[0]
+        self.assertEqual((plan['planning'], plan['execution'], plan['rows'],
+                          plan['shared-hit'], plan['shared-read']), (0.290, 2.374, 500, 4613, 15))
+        # The inner index scan takes 2000 loops of 0.001 ms, more than the nested loop
+        self.assertNodes(plan, {'Nested Loop': 0.0, 'Seq Scan': 0.934, 'Index Scan': 2.0})
+
+    def test_old_plans(self):
+        """Older PostgreSQL versions have no planning time, and plans, which
+        are cut off, are skipped"""
+        filename = self.write('plans', OLD_PLAN.replace("Total runtime: 0.081", "Total runtime: 1.5") +
+                              OLD_PLAN.splitlines(True)[2] + OLD_PLAN +
+                              OLD_PLAN.replace("Total runtime", "Planning time: 0.100 ms\n"
+                                               " Execution time"))
+        plans = psql2tsv.readPlans(filename)
+        self.assertEqual([(plan['planning'], plan['execution'], plan['rows'], plan['shared-hit'])
+                          for plan in plans], [(None, 1.5, 4, None), (None, 0.081, 4, None),
+                                               (0.100, 0.081, 4, None)])
+        for plan in plans:
+            self.assertNodes(plan, {'Hash Join': 0.023, 'Seq Scan': 0.007, 'Hash': 0.010})
+
+    def test_timing_off(self):
+        plans = psql2tsv.readPlans(self.write('plans', re.sub(
+            r"actual time=\S+ ", "actual ", OLD_PLAN)))
+        self.assertEqual(plans[0]['rows'], 4)
+        self.assertNodes(plans[0], {'Hash Join': 0.0, 'Seq Scan': 0.0, 'Hash': 0.0})
+
+    def test_measures(self):
+        """Cells are the means of each plan's measure, execution times in
+        whole ms, and other measures with three decimals"""
+        times = {}
+        for filename in PLANS[:2]:
+            text = read_file(filename)
+            times[filename] = [[float(ms) for ms in re.findall(r"%s Time: ([\d.]+) ms" % kind, text)]
+                               for kind in ['Planning', 'Execution']]
+        for measure, expected in [
+                ('execution', ["%d" % round(mean(execution)) for _, execution in times.values()]),
+                ('planning', ["%.3f" % mean(planning) for planning, _ in times.values()]),
+                ('total', ["%.3f" % mean([p + e for p, e in zip(*times[filename])])
+                           for filename in PLANS[:2]]),
+                ('rows', ["500.000", "100.000"]),
+                ('shared-hit', ["%.3f" % mean([4613, 4628, 4628]), "163.000"]),
+                ('shared-read', ["5.000", "0.000"]),
+                ('node:Index Scan', ["%.3f" % self.meanNode(PLANS[0], 'Index Scan'), "0.000"]),
+                ('node:Seq Scan', ["%.3f" % self.meanNode(filename, 'Seq Scan')
+                                   for filename in PLANS[:2]])]:
+            with self.subTest(measure=measure):
+                output = run_script('p-psql2tsv', '--measure', measure, 'q_', *PLANS[:2]).stdout
+                self.assertEqual(output, "N\tnl\thash\n1\t%s\t\n" % "\t".join(expected))
+
+    def test_missing_measure(self):
+        """Files without a measure are skipped"""
+        process = run_script('p-psql2tsv', '--measure', 'shared-hit', 'q_', PLANS[0],
+                             self.write('q_N1_old', OLD_PLAN))
+        self.assertEqual(process.stdout, "N\tnl\n1\t4623.000\t\n")
+        self.assertIn("WARNING: No shared-hit found in '%s'. Skipping it." % self.path('q_N1_old'),
+                      process.stderr)
+        process = run_script('p-psql2tsv', '--measure', 'node', 'q_', PLANS[0], check=False)
+        self.assertNotEqual(process.returncode, 0)
+        self.assertIn("invalid measure: 'node'", process.stderr)
+
+    def meanNode(self, filename, nodeType):
+        return mean([plan['nodes'][nodeType] for plan in psql2tsv.readPlans(filename)])
+
+    def assertNodes(self, plan, expected):
+        self.assertEqual(sorted(plan['nodes']), sorted(expected))
+        for nodeType, time in expected.items():
+            self.assertAlmostEqual(plan['nodes'][nodeType], time, places=9, msg=nodeType)
+
+
+class StatisticsTest(ScriptTestCase):
+
+    def test_statistics(self):
+        values = [4, 100, 1, 3, 2]
+        std = statistics.stdev(values)
+        for statistic, expected in [('mean', 22), ('median', 3), ('min', 1), ('max', 100),
+                                    ('trim20', 3), ('trim10', 22), ('std', std),
+                                    ('ci95', 2.776 * std / math.sqrt(5))]:
+            self.assertAlmostEqual(psql2tsv.computeStatistic(statistic, values), expected,
+                                   places=9, msg=statistic)
+        self.assertEqual(psql2tsv.computeStatistic('median', [4, 1, 2, 3]), 2.5)
+        self.assertEqual(psql2tsv.computeStatistic('trim49', [1, 2]), 1.5)
+        for statistic in ['mean', 'median', 'min', 'max', 'trim40']:
+            self.assertEqual(psql2tsv.computeStatistic(statistic, [5.5]), 5.5)
+        self.assertEqual(psql2tsv.computeStatistic('std', [5.5]), 0.0)
+        self.assertEqual(psql2tsv.computeStatistic('ci95', [5.5]), 0.0)
+
+    def test_t_quantiles(self):
+        """Quantiles above the table are off by less than 0.001"""
+        self.assertEqual(psql2tsv.tQuantile95(1), 12.706)
+        self.assertEqual(psql2tsv.tQuantile95(30), 2.042)
+        for df, expected in [(31, 2.0395), (40, 2.0211), (60, 2.0003), (120, 1.9799),
+                             (10 ** 6, 1.96)]:
+            self.assertAlmostEqual(psql2tsv.tQuantile95(df), expected, delta=0.001, msg=df)
+
+    def test_format(self):
+        """Spreads keep their decimals, also of rounded execution times"""
+        self.assertEqual(psql2tsv.formatStatistic('mean', [1.4, 2.0], True), "2")
+        self.assertEqual(psql2tsv.formatStatistic('mean', [1.4, 2.0]), "1.700")
+        self.assertEqual(psql2tsv.formatStatistic('std', [1.4, 2.0], True), "0.424")
+        self.assertEqual(psql2tsv.formatStatistic('ci95', [1.4], True), "0.000")
+
+    def test_columns(self):
+        """Several statistics result in a column per algorithm and statistic"""
+        execution = [executionTimes(filename) for filename in PLANS[:2]]
+        output = run_script('p-psql2tsv', '--stat', 'mean,ci95,trim10', 'q_', *PLANS[:2]).stdout
+        self.assertEqual(output.splitlines(), [
+            "N\tnl_mean\tnl_ci95\tnl_trim10\thash_mean\thash_ci95\thash_trim10",
+            "1\t" + "".join("%d\t%.3f\t%d\t" % (round(mean(values)),
+                                                  4.303 * statistics.stdev(values) / math.sqrt(3),
+                                                  round(mean(values))) for values in execution)])
+
+    def test_warmup(self):
+        """Warm-up plans are dropped, and files without other plans skipped"""
+        hash_plans = self.write('q_N1_hash', read_file(PLANS[1]) + read_file(PLANS[1]))
+        process = run_script('p-psql2tsv', '--warmup', '3', '--stat', 'max', 'q_', PLANS[0], hash_plans)
+        self.assertEqual(process.stdout, "N\thash\n1\t%d\t\n" % round(max(executionTimes(PLANS[1]))))
+        self.assertIn("WARNING: All 3 query plans of '%s' are dropped as warm-up. Skipping it." %
+                      PLANS[0], process.stderr)
+        output = run_script('p-psql2tsv', '--warmup', '1', '--measure', 'planning', 'q_',
+                            PLANS[0]).stdout
+        planning = [float(ms) for ms in re.findall(r"Planning Time: ([\d.]+)", read_file(PLANS[0]))]
+        self.assertEqual(output, "N\tnl\n1\t%.3f\t\n" % mean(planning[1:]))
+
+    def test_errors(self):
+        for args, error in [(['--stat', 'mean,p90'], "invalid statistic: 'p90'"),
+                            (['--stat', 'trim50'], "invalid statistic: 'trim50'"),
+                            (['--warmup', '-1'], "--warmup must not be negative"),
+                            (['--warmup', '3'], "No results found.")]:
+            with self.subTest(error=error):
+                process = run_script('p-psql2tsv', *(args + ['q_', PLANS[0]]), check=False)
+                self.assertNotEqual(process.returncode, 0)
+                self.assertIn(error, process.stderr)
+
+
+class CubeTest(ScriptTestCase):
+    """Sweeps of two parameters, which are incomplete"""
+
+    def setUp(self):
+        super().setUp()
+        self.files = [self.write('q_N%dM%d_%s' % (n, m, algo), read_file(source))
+                      for n, m, algo, source in [(1, 10, 'nl', PLANS[0]), (1, 10, 'hash', PLANS[1]),
+                                                 (1, 20, 'nl', PLANS[2]), (1, 20, 'hash', PLANS[3]),
+                                                 (10, 10, 'nl', PLANS[4]), (2, 10, 'nl', PLANS[4]),
+                                                 (2, 10, 'hash', PLANS[5]), (2, 20, 'nl', PLANS[4])]]
+
+    def table(self, *args):
+        output = run_script('p-psql2tsv', *(args + ('q_',) + tuple(self.files))).stdout
+        return [line.split("\t") for line in output.splitlines()]
+
+    def test_rows(self):
+        """Rows are sorted by their values, and missing cells are nan"""
+        self.assertEqual(self.table(), [
+            ['N', 'M', 'nl', 'hash'],
+            ['1', '10', '2', '161', ''],
+            ['1', '20', '4', '313', ''],
+            ['2', '10', '10', '795', ''],
+            ['2', '20', '10', 'nan', ''],
+            ['10', '10', '10', 'nan', '']])
+
+    def test_pivot(self):
+        self.assertEqual(self.table('--pivot', 'M'), [
+            ['N', 'nl_M10', 'nl_M20', 'hash_M10', 'hash_M20'],
+            ['1', '2', '4', '161', '313', ''],
+            ['2', '10', '10', '795', 'nan', ''],
+            ['10', '10', 'nan', 'nan', 'nan', '']])
+        minimum = ["%d" % round(min(executionTimes(filename))) for filename in PLANS]
+        self.assertEqual(self.table('--pivot', 'N', '--stat', 'mean,min'), [
+            ['M', 'nl_N1_mean', 'nl_N1_min', 'nl_N2_mean', 'nl_N2_min', 'nl_N10_mean',
+             'nl_N10_min', 'hash_N1_mean', 'hash_N1_min', 'hash_N2_mean', 'hash_N2_min'],
+            ['10', '2', minimum[0], '10', minimum[4], '10', minimum[4], '161', minimum[1],
+             '795', minimum[5], ''],
+            ['20', '4', minimum[2], '10', minimum[4], 'nan', 'nan', '313', minimum[3],
+             'nan', 'nan', '']])
+
+    def test_files(self):
+        """Files, which do not match the prefix, are skipped, and all others
+        must have the same parameters"""
+        self.files.append(self.write('x_N1M10_nl', read_file(PLANS[0])))
+        process = run_script('p-psql2tsv', 'q_', *self.files)
+        self.assertIn("WARNING: Prefix 'q_' does not match with filename 'x_N1M10_nl'. Skipping it.",
+                      process.stderr)
+        self.assertEqual(process.stdout.splitlines()[0], "N\tM\tnl\thash")
+        for files, args, error in [
+                (self.files[:1] + [self.write('q_N1_nl', read_file(PLANS[0]))], [],
+                 "Parameter name mismatch. First it was 'NM', then 'N'."),
+                (self.files, ['--pivot', 'K'], "Parameter 'K' to pivot not found. Parameters are: N, M")]:
+            with self.subTest(error=error):
+                process = run_script('p-psql2tsv', *(args + ['q_'] + files), check=False)
+                self.assertNotEqual(process.returncode, 0)
+                self.assertIn(error, process.stderr)
+
+    def test_cube(self):
+        cube = psql2tsv.ResultCube(('N', 'M'))
+        cube.add((2, 10), 'b', ['1'])
+        cube.add((1, 20), 'a', ['2'])
+        cube.add((1, 10), 'b', ['3'])
+        cube.add((1, 10), 'b', ['4'])
+        self.assertEqual(cube.table(), (('N', 'M'), [('b', None), ('a', None)], [
+            ((1, 10), {('b', None): ['4']}), ((1, 20), {('a', None): ['2']}),
+            ((2, 10), {('b', None): ['1']})]))
+        self.assertEqual(cube.table('N'), (('M',), [('b', 1), ('b', 2), ('a', 1)], [
+            ((10,), {('b', 1): ['4'], ('b', 2): ['1']}), ((20,), {('a', 1): ['2']})]))
+
+
+class IndexTest(ScriptTestCase):
+    """Files of the index are only read again, if they changed"""
+
+    def setUp(self):
+        super().setUp()
+        self.files = [self.write(os.path.basename(filename), read_file(filename))
+                      for filename in PLANS]
+
+    def run_indexed(self, *args):
+        return run_script('p-psql2tsv', '--index', '--index-file', self.path('index.sqlite'),
+                          *(args + ('q_',) + tuple(self.files))).stdout
+
+    def test_index(self):
+        """Query plans of the index give the same output for other measures,
+        and changed files are read again"""
+        expected = read_file(data_file('plans.txt'))
+        self.assertEqual(self.run_indexed(), expected)
+        st = os.stat(self.files[0])
+        self.write(self.files[0], "x" * st.st_size)
+        os.utime(self.files[0], ns=(st.st_atime_ns, st.st_mtime_ns))
+        self.assertEqual(self.run_indexed(), expected)
+        self.assertEqual(self.run_indexed('--measure', 'node:Seq Scan', '--stat', 'mean,ci95'),
+                         run_script('p-psql2tsv', '--measure', 'node:Seq Scan', '--stat', 'mean,ci95',
+                                    'q_', *PLANS).stdout)
+
+        self.write(self.files[0], read_file(PLANS[4]))
+        self.assertEqual(self.run_indexed(), run_script('p-psql2tsv', 'q_', *self.files).stdout)
+
+    def test_shared(self):
+        """Both aggregators keep their results in the same index file"""
+        self.run_indexed()
+        sweep = data_file(os.path.join('sweep', 'exp_N1.tsv'))
+        run_script('p-stats2data', '--index', '--index-file', self.path('index.sqlite'), 'exp_', sweep)
+        self.run_indexed()
+        with sqlite3.connect(self.path('index.sqlite')) as db:
+            self.assertEqual(db.execute("SELECT program, version, count(*) FROM files "
+                                        "GROUP BY program ORDER BY program").fetchall(),
+                             [('psql2tsv', psql2tsv.INDEX_VERSION, len(self.files)),
+                              ('stats2data', load_script('p-stats2data').INDEX_VERSION, 1)])
+
+    def test_shared_module(self):
+        """The parallel reading and the index are the ones of p-stats2data.py"""
+        stats2data = load_script('p-stats2data')
+        for name in ['mapFiles', 'getDefaultIndexFile', 'ResultIndex']:
+            self.assertIs(getattr(psql2tsv, name), getattr(stats2data, name))
+
+
+def executionTimes(filename):
+    return [float(ms) for ms in re.findall(r"Execution Time: ([\d.]+) ms", read_file(filename))]
+
+
+def mean(values):
+    return sum(values) / len(values)
+
+
+if __name__ == '__main__':
+    unittest.main()
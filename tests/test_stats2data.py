@@ -0,0 +1,274 @@
+"""Tests of p-stats2data.py
+
+The expected output sweep.txt has been created by the first version of
+p-stats2data.py from the files in data/sweep, with the repeated rows of
+parameter values with several files removed, which it printed once per file."""
+
+import argparse
+import glob
+import math
+import os
+import random
+import sqlite3
+import statistics
+import unittest
+
+from helpers import ScriptTestCase, data_file, load_script, read_file, run_script
+
+stats2data = load_script('p-stats2data')
+
+SWEEP = sorted(glob.glob(data_file(os.path.join('sweep', 'exp_*.tsv'))))
+
+
+class OutputTest(ScriptTestCase):
+
+    def test_output(self):
+        output = run_script('p-stats2data', 'exp_', *SWEEP).stdout
+        self.assertEqual(output, read_file(data_file('sweep.txt')))
+
+    def test_errors(self):
+        other = self.write('exp_M5.tsv', read_file(SWEEP[0]))
+        empty = self.write('exp_N7.tsv', "algo\ttime\n")
+        for args, error in [
+                (['exp_', SWEEP[0], other], "Parameter name mismatch. First it was 'N', then 'M'."),
+                (['run_', SWEEP[0]], "Prefix 'run_' does not match with filename 'exp_N1'."),
+                (['exp_', self.path('exp_N3.tsv')], "File '%s' does not exist." % self.path('exp_N3.tsv')),
+                (['exp_', empty], "No results found."),
+                (['--stat', 'p101', 'exp_', SWEEP[0]], "invalid statistic: 'p101'")]:
+            with self.subTest(error=error):
+                process = run_script('p-stats2data', *args, check=False)
+                self.assertNotEqual(process.returncode, 0)
+                self.assertIn(error, process.stderr)
+
+    def test_result_counts(self):
+        self.write('exp_N3.tsv', "a\t1\t0\t0\t0\t0\t0\t10\nb\t2\t0\t0\t0\t0\t0\t20\n")
+        process = run_script('p-stats2data', 'exp_', self.path('exp_N3.tsv'), check=False)
+        self.assertNotEqual(process.returncode, 0)
+        self.assertIn("Different result counts for the same parameter-value found!", process.stderr)
+
+
+class StatisticTest(ScriptTestCase):
+    """Cells of each statistic are the same as of all values of the last run,
+    or of all runs, of each algorithm"""
+
+    def cells(self, *args):
+        lines = run_script('p-stats2data', *args).stdout.splitlines()
+        header = lines[0].split("\t")
+        return {value: dict(zip(header[1:-1], values))
+                for value, *values in (line.split("\t")[:-1] for line in lines[1:])}
+
+    def test_statistics(self):
+        for name in ['exp_N5.tsv', 'exp_N10.tsv']:
+            runs = readRuns(data_file(os.path.join('sweep', name)))
+            value = name[5:-4]
+            for stat, function in [('mean', lambda values: "%d" % int(sum(values) / len(values))),
+                                   ('std', lambda values: "%.3f" % statistics.stdev(values)),
+                                   ('min', lambda values: "%d" % min(values)),
+                                   ('max', lambda values: "%d" % max(values)),
+                                   ('median', lambda values: "%d" % quantile(values, 0.5)),
+                                   ('p90', lambda values: "%d" % quantile(values, 0.9))]:
+                for mode, select in [('last', lambda algoRuns: algoRuns[-1]),
+                                     ('all', lambda algoRuns: sum(algoRuns, []))]:
+                    with self.subTest(name=name, stat=stat, runs=mode):
+                        cells = self.cells('--stat', stat, '--runs', mode, 'exp_',
+                                           data_file(os.path.join('sweep', name)))
+                        self.assertEqual(cells, {value: {algo: function(select(algoRuns))
+                                                         for algo, algoRuns in runs.items()}})
+
+    def test_single_value(self):
+        self.write('exp_N3.tsv', "a\t5\t0\t0\t0\t0\t0\t10\n")
+        self.assertEqual(self.cells('--stat', 'std', 'exp_', self.path('exp_N3.tsv')),
+                         {'3': {'a': "0.000"}})
+
+    def test_parse_statistic(self):
+        self.assertEqual([stats2data.parseStatistic(text) for text in
+                          ['mean', 'std', 'min', 'max', 'median', 'p99', 'p12.5', 'p0']],
+                         ['mean', 'std', 'min', 'max', 0.5, 0.99, 0.125, 0.0])
+        for text in ['avg', 'p', 'p100.1', 'p-1']:
+            with self.assertRaises(argparse.ArgumentTypeError):
+                stats2data.parseStatistic(text)
+
+
+class MergeTest(ScriptTestCase):
+    """Files, which are read in parallel, are merged in the given order"""
+
+    def test_jobs(self):
+        for options in [[], ['--runs', 'all'], ['--stat', 'p90']]:
+            expected = run_script('p-stats2data', '--jobs', '1', *(options + ['exp_'] + SWEEP)).stdout
+            for jobs, pool in [('3', 'thread'), ('3', 'process'), ('16', 'process')]:
+                with self.subTest(options=options, jobs=jobs, pool=pool):
+                    output = run_script('p-stats2data', '--jobs', jobs, '--pool', pool,
+                                        *(options + ['exp_'] + SWEEP)).stdout
+                    self.assertEqual(output, expected)
+        self.assertEqual(expected.splitlines()[0], "N\talgA\talgB\talgC\tRESULTS")
+
+    def test_split_files(self):
+        """Files, which continue the first run of each other, give the same
+        cells as a single file"""
+        lines = read_file(data_file(os.path.join('sweep', 'exp_N10.tsv'))).splitlines(True)
+        for options in [[], ['--runs', 'all'], ['--stat', 'std']]:
+            expected = run_script('p-stats2data', *(options + [
+                'exp_', data_file(os.path.join('sweep', 'exp_N10.tsv'))])).stdout
+            for split in [1, 2, 5, 9]:
+                with self.subTest(options=options, split=split):
+                    files = [self.write('exp_N10_a.tsv', "".join(lines[:split])),
+                             self.write('exp_N10_b.tsv', "".join(lines[:1] + lines[split:]))]
+                    output = run_script('p-stats2data', '--jobs', '2', *(options + ['exp_'] + files)).stdout
+                    self.assertEqual(output, expected)
+
+    def test_map_files(self):
+        tasks = list(range(-100, 0))
+        for jobs, pool in [(1, 'process'), (4, 'thread'), (4, 'process')]:
+            self.assertEqual(stats2data.mapFiles(abs, tasks, jobs, pool), list(range(100, 0, -1)))
+        self.assertEqual(stats2data.mapFiles(abs, [], 4), [])
+
+
+class IndexTest(ScriptTestCase):
+    """Files of the index are only read again, if they changed"""
+
+    def setUp(self):
+        super().setUp()
+        self.files = [self.write(os.path.basename(filename), read_file(filename))
+                      for filename in SWEEP]
+
+    def run_indexed(self, *args):
+        return run_script('p-stats2data', '--index', '--index-file', self.path('index.sqlite'),
+                          *(args + ('exp_',) + tuple(self.files))).stdout
+
+    def rows(self):
+        with sqlite3.connect(self.path('index.sqlite')) as db:
+            return db.execute("SELECT program, version, path, options FROM files "
+                              "ORDER BY options, path").fetchall()
+
+    def test_index(self):
+        for options in [(), ('--runs', 'all'), ()]:
+            self.assertEqual(self.run_indexed(*options),
+                             run_script('p-stats2data', *(options + ('exp_',) + tuple(SWEEP))).stdout)
+        self.assertEqual(self.rows(), [('stats2data', stats2data.INDEX_VERSION, filename, options)
+                                       for options in ['runs=all', 'runs=last']
+                                       for filename in sorted(self.files)])
+
+    def test_unchanged(self):
+        """Files with the same size and modification time are not read
+        again, and neither are touched files with the same content"""
+        expected = self.run_indexed()
+        st = os.stat(self.files[0])
+        self.write(self.files[0], "x" * st.st_size)
+        os.utime(self.files[0], ns=(st.st_atime_ns, st.st_mtime_ns))
+        self.assertEqual(self.run_indexed(), expected)
+
+        self.write(self.files[0], read_file(SWEEP[0]))
+        os.utime(self.files[0], ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+        self.assertEqual(self.run_indexed(), expected)
+        with sqlite3.connect(self.path('index.sqlite')) as db:
+            self.assertEqual(db.execute("SELECT mtime FROM files WHERE path = ?",
+                                        (self.files[0],)).fetchone(), (st.st_mtime_ns + 10 ** 9,))
+
+    def test_changed(self):
+        """Files with another size, or with another modification time and
+        content, are read again"""
+        self.run_indexed()
+        lines = read_file(SWEEP[0]).splitlines(True)
+        st = os.stat(self.files[0])
+        for content in ["".join(lines[:3]),
+                        read_file(SWEEP[0]).replace("/bin/algA\t8498", "/bin/algA\t1111")]:
+            with self.subTest(content=content):
+                self.write(self.files[0], content)
+                os.utime(self.files[0], ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+                self.assertEqual(self.run_indexed(),
+                                 run_script('p-stats2data', 'exp_', *self.files).stdout)
+
+    def test_paths(self):
+        """Files have a single row, however they are named, and rows of
+        removed files are removed, while other options keep theirs"""
+        self.run_indexed()
+        os.makedirs(self.path('sub'))
+        names = ['.' + os.sep + os.path.basename(self.files[0]),
+                 os.path.join('sub', os.pardir, os.path.basename(self.files[1]))]
+        run_script('p-stats2data', '--index', '--index-file', self.path('index.sqlite'),
+                   'exp_', *names, cwd=self.tmp)
+        self.assertEqual([row[2] for row in self.rows()], sorted(self.files))
+
+        self.run_indexed('--runs', 'all')
+        os.remove(self.files[0])
+        self.files = self.files[1:]
+        self.run_indexed()
+        self.assertEqual(self.rows(), [('stats2data', stats2data.INDEX_VERSION, filename, options)
+                                       for options in ['runs=all', 'runs=last']
+                                       for filename in sorted(self.files)])
+
+    def test_invalid(self):
+        """Results, which cannot be restored, and results of other versions
+        are read again, while other programs keep theirs"""
+        expected = self.run_indexed()
+        with sqlite3.connect(self.path('index.sqlite')) as db:
+            db.execute("UPDATE files SET result = ? WHERE path = ?", (b"invalid", self.files[0]))
+            db.execute("INSERT INTO files SELECT 'other', 1, path, options, size, mtime, hash, result "
+                       "FROM files")
+            db.execute("INSERT INTO files SELECT program, version - 1, path || 'old', options, size, "
+                       "mtime, hash, result FROM files WHERE program = 'stats2data'")
+        self.assertEqual(self.run_indexed(), expected)
+        self.assertEqual(sorted(set(row[:2] for row in self.rows())),
+                         [('other', 1), ('stats2data', stats2data.INDEX_VERSION)])
+        self.assertEqual(len(self.rows()), 2 * len(self.files))
+
+
+class RunStatisticsTest(unittest.TestCase):
+
+    def test_merge(self):
+        """Merged statistics of chunks are the same as of all values at once"""
+        rng = random.Random(1)
+        values = [rng.randrange(10 ** 6) for _ in range(5000)]
+        whole = stats2data.RunStatistics(0, 1)
+        for value in values:
+            whole.add(value)
+        merged = stats2data.RunStatistics(0, 1)
+        for i in range(0, len(values), 777):
+            chunk = stats2data.RunStatistics(0, 1)
+            for value in values[i:i + 777]:
+                chunk.add(value)
+            merged.merge(chunk)
+        for run in [whole, merged]:
+            self.assertEqual([run.format(stat) for stat in ['mean', 'min', 'max']],
+                             ["%d" % int(sum(values) / len(values)), "%d" % min(values),
+                              "%d" % max(values)])
+            self.assertAlmostEqual(float(run.format('std')), statistics.stdev(values), places=2)
+
+    def test_sketch(self):
+        """Quantiles are exact for few values, and within 1% of the exact rank
+        for many values"""
+        values = list(range(100000))
+        random.Random(2).shuffle(values)
+        run = stats2data.RunStatistics(0, 1)
+        for value in values[:stats2data.SKETCH_SIZE]:
+            run.add(value)
+        for q in [0.01, 0.5, 0.9, 1.0]:
+            self.assertEqual(run.format(q), "%d" % quantile(values[:stats2data.SKETCH_SIZE], q))
+        for value in values[stats2data.SKETCH_SIZE:]:
+            run.add(value)
+        for q in [0.1, 0.5, 0.9, 0.99]:
+            self.assertLess(abs(int(run.format(q)) / len(values) - q), 0.01, q)
+
+
+def readRuns(filename):
+    """Execution times of each algorithm and run of a file, where lines
+    without an execution time separate the runs"""
+    runs = {}
+    run = 0
+    with open(filename) as f:
+        for line in f:
+            cells = line.split("\t")
+            if not cells[1].isdigit():
+                run += 1
+                continue
+            runs.setdefault(os.path.basename(cells[0]), {}).setdefault(run, []).append(int(cells[1]))
+    return {algo: list(algoRuns.values()) for algo, algoRuns in runs.items()}
+
+
+def quantile(values, q):
+    """Smallest value, such that a q-th of all values are smaller or equal"""
+    return sorted(values)[max(math.ceil(q * len(values)), 1) - 1]
+
+
+if __name__ == '__main__':
+    unittest.main()